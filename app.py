@@ -1,16 +1,160 @@
-import base64
-import io
+import asyncio
+import logging
 import os
-import wave
 
 import chainlit as cl
 import numpy as np
 from bson.objectid import ObjectId
-from groq import Groq
+from groq import AsyncGroq
 from langchain.schema.runnable.config import RunnableConfig
 from langchain_core.messages import HumanMessage, ToolMessage
+from pymongo.errors import PyMongoError
 
-from src.core.nodes import graph
+from src.utils.audio import EnergyVAD, StreamingTranscriber, encode_wav, prepare_for_transcription
+from src.utils.instrumentation import external_call, instrumentation
+from src.utils.media_cache import MediaCache
+from src.utils.metrics import metrics, start_metrics_server
+from src.utils.startup import lazy_singleton, resolve, startup_report
+from src.utils.vision import analyze_images, image_data_url
+
+with startup_report.measure("graph_modules", "import"):
+    from src.core.nodes import get_graph, memory_queue, warm_up
+    from src.database.db import file_path as destinations_path, reload_destinations
+    from src.database.indexes import ensure_indexes, verify_query_plans
+    from src.database.search_keys import backfill_search_keys
+    from src.tools.tools import get_db
+
+logger = logging.getLogger(__name__)
+
+# Port serving Prometheus metrics; unset disables the endpoint
+METRICS_PORT = os.getenv("METRICS_PORT")
+VISION_MODEL = "llama-3.2-90b-vision-preview"
+WHISPER_MODEL = "whisper-large-v3-turbo"
+# Longest recording transcribed, and the pause that ends an utterance
+AUDIO_MAX_SECONDS = float(os.getenv("AUDIO_MAX_SECONDS", "120"))
+AUDIO_SILENCE_MS = float(os.getenv("AUDIO_SILENCE_MS", "700"))
+# Quietest frame RMS (16-bit samples) still taken for speech
+AUDIO_MIN_RMS = float(os.getenv("AUDIO_MIN_RMS", "100"))
+# Vision calls in flight at once, across every session
+vision_limit = asyncio.Semaphore(int(os.getenv("VISION_CONCURRENCY", "4")))
+# Image analyses and transcripts kept on disk, keyed by the media content
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", ".cache/media")
+# Seconds between checks of the destination PDF for changes; unset disables reloading
+DESTINATIONS_RELOAD_SECONDS = os.getenv("DESTINATIONS_RELOAD_SECONDS")
+MEDIA_CACHE_MAX_MB = float(os.getenv("MEDIA_CACHE_MAX_MB", "64"))
+
+@lazy_singleton("groq")
+def get_groq_client() -> AsyncGroq:
+    """Async Groq client reused by every vision and transcription call."""
+    return AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
+
+
+@lazy_singleton("media_cache")
+def get_media_cache() -> MediaCache:
+    """Vision analyses and transcriptions of media already seen."""
+    return MediaCache(MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_MB)
+
+
+metrics.register_gauge(
+    "media_cache",
+    lambda: {**get_media_cache().stats, "bytes": get_media_cache().volume()} if get_media_cache.is_initialized() else {},
+)
+
+
+# Strong references so background tasks are not garbage collected mid-flight.
+background_tasks = set()
+
+
+async def watch_destinations(interval: float) -> None:
+    """Re-ingest the destination PDF whenever it changes on disk, invalidating cached answers."""
+    modified = os.path.getmtime(destinations_path)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            current = os.path.getmtime(destinations_path)
+            if current == modified:
+                continue
+            modified = current
+            version = await asyncio.to_thread(reload_destinations)
+            logger.info("Destination corpus reloaded (version %s)", version[:12])
+        except Exception:
+            # Keep serving the previous index; the next change is tried again.
+            logger.warning("Destination corpus reload failed", exc_info=True)
+
+
+@cl.on_app_startup
+async def on_app_startup():
+    # Warm up in the background so the server accepts connections right away.
+    # Handlers resolve accessors with ``resolve``, so a request arriving earlier
+    # waits in a worker thread for the component it needs while the event loop
+    # keeps serving other sessions.
+    async def _warm_up():
+        report = await asyncio.to_thread(warm_up)
+        await resolve(get_groq_client)
+        await resolve(get_media_cache)
+        try:
+            with report.measure("search_keys", "init"):
+                keyed = await backfill_search_keys(get_db())
+            if any(keyed.values()):
+                logger.info("Search keys added or refreshed: %s", keyed)
+            with report.measure("mongo_indexes", "init"):
+                await ensure_indexes(get_db())
+                plans = await verify_query_plans(get_db())
+            for collection, uses_index in plans.items():
+                if not uses_index:
+                    logger.warning("Searches on %s do not use an index", collection)
+        except PyMongoError as exc:
+            logger.warning("Index bootstrap failed: %s", exc)
+        logger.info("Startup report:\n%s", report.format())
+
+    if METRICS_PORT:
+        start_metrics_server(int(METRICS_PORT))
+
+    tasks = [asyncio.create_task(_warm_up())]
+    if DESTINATIONS_RELOAD_SECONDS:
+        tasks.append(asyncio.create_task(watch_destinations(float(DESTINATIONS_RELOAD_SECONDS))))
+    for task in tasks:
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+
+@cl.on_app_shutdown
+async def on_app_shutdown():
+    await memory_queue.flush_all(timeout=30)
+
+
+@cl.on_chat_end
+async def on_chat_end():
+    # Let memories of this conversation land before the session goes away.
+    await memory_queue.flush(cl.user_session.get("user_id"), timeout=30)
+
+
+async def analyze_image(jpeg: bytes, prompt: str) -> str:
+    """Describe one prepared image, from the cache when the same image and message were seen before."""
+    return await (await resolve(get_media_cache)).get_or_compute("vision", jpeg, VISION_MODEL, prompt, lambda: describe_image(jpeg, prompt))
+
+
+async def describe_image(jpeg: bytes, prompt: str) -> str:
+    """Describe one prepared image with the vision model, guided by the user's message."""
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": image_data_url(jpeg)}},
+            ],
+        }
+    ]
+    metrics.inc("vision_upload_bytes_total", len(jpeg))
+    async with external_call("groq", VISION_MODEL, cl.context.session.id) as call:
+        response = await (await resolve(get_groq_client)).chat.completions.create(
+            model=VISION_MODEL,
+            messages=messages,
+            max_tokens=1000,
+        )
+        if response.usage:
+            call.add_tokens(response.usage.prompt_tokens, response.usage.completion_tokens)
+    return response.choices[0].message.content
 
 
 # give me tickets from hanoi to saigon on 30 april 2025
@@ -27,38 +171,18 @@ async def on_message(msg: cl.Message):
     cb = cl.LangchainCallbackHandler()
     final_answer = cl.Message(content="")
     
-    # Process any attached images
+    # Analyze every attached image concurrently
     content = msg.content
-    if msg.elements:
-        with open(msg.elements[0].path, "rb") as f:
-            image_bytes = f.read()
-            # Convert image to base64
-            base64_image = base64.b64encode(image_bytes).decode("utf-8")
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": content},
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"},
-                        },
-                    ],
-                }
-            ]
-            client = Groq(
-                api_key=os.getenv("GROQ_API_KEY"),
-                )
-            response = client.chat.completions.create(
-                model="llama-3.2-90b-vision-preview",
-                messages=messages,
-                max_tokens=1000,
-            )
-            content += f"\n[Image Analysis: {response.choices[0].message.content}]"
-            print(content)
+    images = [element.path for element in msg.elements or [] if (element.mime or "").startswith("image/")]
+    if images:
+        for analysis in await analyze_images(images, lambda jpeg: analyze_image(jpeg, msg.content), vision_limit):
+            content += f"\n[Image Analysis: {analysis}]"
+        logger.debug("Message with image analysis: %s", content)
     
-    for msg, metadata in graph.stream({"messages": content}, stream_mode="messages",
-                                      config=RunnableConfig(callbacks=[cb], **config)):
+    # Resolved off the loop in case warm-up is still building the graph.
+    graph = await resolve(get_graph)
+    async for msg, metadata in graph.astream({"messages": content}, stream_mode="messages",
+                                             config=RunnableConfig(callbacks=[cb, instrumentation], **config)):
         if (
                 msg.content
                 and not isinstance(msg, HumanMessage)
@@ -69,54 +193,65 @@ async def on_message(msg: cl.Message):
     await final_answer.send()
 
 
+async def transcribe_segment(samples: np.ndarray, sample_rate: int) -> str:
+    """Transcribe one utterance of the recording with Whisper."""
+    # 16 kHz, trimmed and losslessly compressed: a fraction of the raw 24 kHz WAV.
+    upload = await asyncio.to_thread(prepare_for_transcription, samples, sample_rate)
+    if upload is None:
+        return ""
+    # A re-sent recording prepares to the same bytes and skips Whisper.
+    return await (await resolve(get_media_cache)).get_or_compute("transcript", upload[1], WHISPER_MODEL, "en", lambda: transcribe(upload))
+
+
+async def transcribe(upload: tuple[str, bytes, str]) -> str:
+    """Transcribe a prepared audio file with Whisper."""
+    metrics.inc("audio_upload_bytes_total", len(upload[1]))
+    async with external_call("groq", WHISPER_MODEL, cl.context.session.id):
+        return await (await resolve(get_groq_client)).audio.transcriptions.create(
+            file=upload,
+            model=WHISPER_MODEL,
+            language='en',
+            response_format="text",
+        )
+
+
 @cl.on_audio_start
 async def on_audio_start():
-    cl.user_session.set("audio_chunks", [])
+    # Utterances are transcribed as soon as the user pauses, while recording goes on.
+    cl.user_session.set(
+        "audio_transcriber",
+        StreamingTranscriber(
+            transcribe_segment,
+            max_seconds=AUDIO_MAX_SECONDS,
+            silence_ms=AUDIO_SILENCE_MS,
+            vad=EnergyVAD(min_rms=AUDIO_MIN_RMS),
+        ),
+    )
     
     return True
 
 @cl.on_audio_chunk
 async def on_audio_chunk(chunk: cl.InputAudioChunk):
-    audio_chunks = cl.user_session.get("audio_chunks")
-    if audio_chunks is not None:
-        audio_chunk = np.frombuffer(chunk.data, dtype=np.int16)
-        audio_chunks.append(audio_chunk)
+    transcriber = cl.user_session.get("audio_transcriber")
+    if transcriber is not None:
+        transcriber.feed(chunk.data)
 
 @cl.on_audio_end
 async def on_audio_end():
-    audio_chunks = cl.user_session.get("audio_chunks")
-    if not audio_chunks:
+    transcriber = cl.user_session.get("audio_transcriber")
+    if transcriber is None:
         return
+    cl.user_session.set("audio_transcriber", None)
 
-    # Gộp các chunk lại
-    concatenated = np.concatenate(audio_chunks)
-    wav_buffer = io.BytesIO()
-
-    # Ghi thành file WAV
-    with wave.open(wav_buffer, "wb") as wav_file:
-        wav_file.setnchannels(1)
-        wav_file.setsampwidth(2)
-        wav_file.setframerate(24000)
-        wav_file.writeframes(concatenated.tobytes())
-
-    wav_buffer.seek(0)
-    audio_buffer = wav_buffer.getvalue()
-    cl.user_session.set("audio_chunks", [])
+    # Only the last utterance is still being transcribed at this point.
+    transcription = await transcriber.finish()
+    logger.debug("Transcription: %s", transcription)
+    if not transcription:
+        return
 
     # Tạo audio element để hiển thị
-    input_audio_el = cl.Audio(content=audio_buffer, mime="audio/wav")
+    input_audio_el = cl.Audio(content=encode_wav(transcriber.audio(), transcriber.sample_rate), mime="audio/wav")
 
-    # Gửi đi để transcribe
-    whisper_input = ("audio.wav", audio_buffer, "audio/wav")
-
-    client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-    transcription = client.audio.transcriptions.create(
-        file=whisper_input,
-        model="whisper-large-v3-turbo",
-        language='en',
-        response_format="text",
-    )
-    print(transcription)
     await cl.Message(
         author="You",
         type="user_message",
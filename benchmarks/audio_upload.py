@@ -0,0 +1,122 @@
+"""Bytes uploaded and transcription latency of voice input, raw WAV against preprocessed audio.
+
+Compares the upload the app used to send, the whole recording as 24 kHz
+16-bit WAV, with ``prepare_for_transcription``: resampled to 16 kHz, trimmed of
+silence and FLAC-encoded when ``soundfile`` is installed (WAV otherwise).
+
+Without ``--transcribe`` it reports the bytes, the preprocessing time and the
+upload time they imply on a few uplink speeds. With ``--transcribe`` (needs
+GROQ_API_KEY) it also times real Whisper calls end to end and prints both
+transcripts, so a quality regression would show.
+
+Usage:
+    python -m benchmarks.audio_upload [--wav recording.wav] [--uplink-kbps 384 1000 5000]
+    python -m benchmarks.audio_upload --wav recording.wav --transcribe --repeat 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import wave
+
+import numpy as np
+
+from src.utils.audio import INPUT_SAMPLE_RATE, encode_wav, prepare_for_transcription
+
+WHISPER_MODEL = "whisper-large-v3-turbo"
+
+
+def synthetic_utterance(seconds: float = 8.0, sample_rate: int = INPUT_SAMPLE_RATE, seed: int = 3) -> np.ndarray:
+    """Speech-like test signal: voiced syllables with a moving pitch, pauses and background noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(harmonic * phase) / harmonic for harmonic in range(1, 25))
+    # About four syllables a second, with a pause in the middle and silence around the utterance.
+    envelope = np.clip(np.sin(2 * np.pi * 2 * t), 0, None) ** 0.5
+    envelope[(t < 0.8) | ((t > 3.5) & (t < 4.3)) | (t > seconds - 1.0)] = 0
+    signal = 6000 * envelope * voiced / 3 + rng.normal(0, 20, len(t))
+    return np.clip(signal, -32768, 32767).astype(np.int16)
+
+
+def read_wav(path: str) -> tuple[np.ndarray, int]:
+    with wave.open(path, "rb") as wav_file:
+        if wav_file.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM is supported")
+        samples = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16)
+        # Keep the first channel of a stereo file.
+        return samples[::wav_file.getnchannels()], wav_file.getframerate()
+
+
+def prepare_paths(samples: np.ndarray, sample_rate: int, repeat: int) -> dict[str, dict]:
+    """Upload of each path and the median time to produce it."""
+    paths = {
+        "wav_raw": lambda: ("audio.wav", encode_wav(samples, sample_rate), "audio/wav"),
+        "preprocessed": lambda: prepare_for_transcription(samples, sample_rate),
+    }
+    results = {}
+    for name, prepare in paths.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            upload = prepare()
+            timings.append(time.perf_counter() - start)
+        results[name] = {"upload": upload, "prepare_ms": 1000 * statistics.median(timings)}
+    return results
+
+
+async def transcribe_paths(paths: dict[str, dict], repeat: int) -> None:
+    """Time real Whisper calls for each path, uploads included."""
+    from groq import AsyncGroq
+
+    client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
+    for result in paths.values():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result["transcript"] = await client.audio.transcriptions.create(
+                file=result["upload"], model=WHISPER_MODEL, language="en", response_format="text",
+            )
+            timings.append(time.perf_counter() - start)
+        result["transcribe_ms"] = 1000 * statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--wav", help="16-bit PCM recording to use instead of a synthetic utterance")
+    parser.add_argument("--uplink-kbps", type=float, nargs="+", default=[384, 1000, 5000], help="Uplink speeds to estimate")
+    parser.add_argument("--transcribe", action="store_true", help="Also time real Whisper calls on Groq")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement; the median is reported")
+    args = parser.parse_args()
+
+    samples, sample_rate = read_wav(args.wav) if args.wav else (synthetic_utterance(), INPUT_SAMPLE_RATE)
+    paths = prepare_paths(samples, sample_rate, args.repeat)
+    if paths["preprocessed"]["upload"] is None:
+        raise SystemExit("The recording is silent after trimming")
+    if args.transcribe:
+        asyncio.run(transcribe_paths(paths, args.repeat))
+
+    print(f"{len(samples) / sample_rate:.1f} s of audio at {sample_rate} Hz")
+    header = f"{'path':<14}{'format':>12}{'bytes':>10}{'prepare ms':>12}"
+    header += "".join(f"{f'up@{kbps:g}k ms':>14}" for kbps in args.uplink_kbps)
+    if args.transcribe:
+        header += f"{'whisper ms':>12}"
+    print(header)
+    for name, result in paths.items():
+        _, content, mime = result["upload"]
+        row = f"{name:<14}{mime:>12}{len(content):>10}{result['prepare_ms']:>12.1f}"
+        row += "".join(f"{8 * len(content) / kbps:>14.0f}" for kbps in args.uplink_kbps)
+        if args.transcribe:
+            row += f"{result['transcribe_ms']:>12.0f}"
+        print(row)
+    raw, processed = (len(paths[name]["upload"][1]) for name in ("wav_raw", "preprocessed"))
+    print(f"\nPreprocessed upload is {processed / raw:.0%} of the raw WAV")
+    if args.transcribe:
+        for name, result in paths.items():
+            print(f"{name}: {result['transcript'].strip()}")
+
+
+if __name__ == "__main__":
+    main()
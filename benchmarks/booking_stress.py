@@ -0,0 +1,186 @@
+"""Concurrent booking stress test against a real MongoDB.
+
+Many threads, each with its own event loop and client, book flights,
+shuttles and hotels for a few users at once, replaying some tool calls with
+the same idempotency key. Every thread also replays the same set of tool
+calls, each booking an item reserved for it on behalf of a user who can
+afford them all. Afterwards it checks that:
+
+- no balance went negative,
+- each balance equals its initial value minus the confirmed charges,
+- each hotel was booked at most once,
+- each idempotency key produced at most one booking,
+- each replayed key ended with exactly one confirmed booking, and every
+  call replaying it was told the booking is confirmed.
+
+Usage:
+    python -m benchmarks.booking_stress [--threads 16] [--bookings 200]
+
+Uses MONGODB_URI and a throwaway database (BOOKING_STRESS_DB, default
+``booking_stress``) that is dropped before and after the run.
+"""
+import argparse
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+from pymongo import AsyncMongoClient, MongoClient
+
+from src.database.indexes import IDEMPOTENCY_INDEX
+from src.tools.booking import (
+    BOOKING_COLLECTIONS,
+    FLIGHT_BOOKING,
+    HOTEL_BOOKING,
+    SHUTTLE_BOOKING,
+    BookingEngine,
+    idempotency_key,
+)
+
+MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+STRESS_DB = os.getenv("BOOKING_STRESS_DB", "booking_stress")
+
+USERS = 4
+INITIAL_BALANCE = 1000
+FLIGHTS = 5
+SHUTTLES = 5
+HOTELS = 20
+# Tool calls every thread replays, cycling through flights, shuttles and hotels
+REPLAYS = 12
+REPLAY_PRICE = 50
+
+
+def seed(db) -> dict:
+    users = db.users.insert_many([{"balance": INITIAL_BALANCE} for _ in range(USERS)]).inserted_ids
+    flights = db.flights.insert_many([{"price": random.randint(50, 200)} for _ in range(FLIGHTS)]).inserted_ids
+    shuttles = db.airport_shuttles.insert_many([{"price": random.randint(5, 30)} for _ in range(SHUTTLES)]).inserted_ids
+    hotels = db.hotels.insert_many([{"booked": 0} for _ in range(HOTELS)]).inserted_ids
+    for collection in BOOKING_COLLECTIONS:
+        db[collection].create_indexes([IDEMPOTENCY_INDEX])
+    replay_user = str(db.users.insert_one({"balance": INITIAL_BALANCE}).inserted_id)
+    replays = []
+    for n in range(REPLAYS):
+        kind, spec, document = [
+            ("flight", FLIGHT_BOOKING, {"price": REPLAY_PRICE}),
+            ("shuttle", SHUTTLE_BOOKING, {"price": REPLAY_PRICE}),
+            ("hotel", HOTEL_BOOKING, {"booked": 0}),
+        ][n % 3]
+        item_id = str(db[spec.inventory].insert_one(document).inserted_id)
+        replays.append((spec, replay_user, item_id, idempotency_key(kind, replay_user, item_id, f"replay-{n}")))
+    return {"users": users, "flights": flights, "shuttles": shuttles, "hotels": hotels, "replays": replays}
+
+
+async def worker(
+    ids: dict, bookings: int, worker_id: int, transactions: str, statuses: list[Counter], replayed: list[Counter]
+) -> None:
+    client = AsyncMongoClient(MONGODB_URI)
+    engine = BookingEngine(client[STRESS_DB], transactions)
+    kinds = [
+        ("flight", FLIGHT_BOOKING, ids["flights"]),
+        ("shuttle", SHUTTLE_BOOKING, ids["shuttles"]),
+        ("hotel", HOTEL_BOOKING, ids["hotels"]),
+    ]
+    counts = Counter()
+    replays = Counter()
+    try:
+        # Every thread starts on the same replayed calls, so they race each other.
+        for spec, user_id, item_id, key in random.sample(ids["replays"], len(ids["replays"])):
+            result = await engine.book(spec, user_id, item_id, key)
+            replays[(key, result.status)] += 1
+        for n in range(bookings):
+            kind, spec, items = random.choice(kinds)
+            user_id = str(random.choice(ids["users"]))
+            item_id = str(random.choice(items))
+            # Every other call reuses a key shared by all workers, like a retried tool call.
+            scope = f"shared-{n % 10}" if n % 2 else f"{worker_id}-{n}"
+            key = idempotency_key(kind, user_id, item_id, scope)
+            result = await engine.book(spec, user_id, item_id, key)
+            counts[(result.status, result.duplicate)] += 1
+    finally:
+        await client.close()
+    statuses.append(counts)
+    replayed.append(replays)
+
+
+def check(db, ids: dict, replayed: Counter) -> list[str]:
+    errors = []
+    prices = {item["_id"]: item["price"] for name in ("flights", "airport_shuttles") for item in db[name].find()}
+    for user in db.users.find():
+        if user["balance"] < 0:
+            errors.append(f"user {user['_id']} has a negative balance {user['balance']}")
+        charged = sum(
+            prices[booking[field]]
+            for collection, field in (("bookings", "flight_id"), ("shuttle_bookings", "shuttle_id"))
+            for booking in db[collection].find({"user_id": user["_id"], "status": "confirmed"})
+        )
+        if user["balance"] != INITIAL_BALANCE - charged:
+            errors.append(f"user {user['_id']} balance {user['balance']} != {INITIAL_BALANCE} - {charged}")
+    for collection in BOOKING_COLLECTIONS:
+        keys = Counter(booking["idempotency_key"] for booking in db[collection].find())
+        errors.extend(f"{collection}: key {key} booked {count} times" for key, count in keys.items() if count > 1)
+        pending = db[collection].count_documents({"status": {"$ne": "confirmed"}})
+        if pending:
+            errors.append(f"{collection}: {pending} bookings left unconfirmed")
+    hotel_bookings = Counter(booking["hotel_id"] for booking in db.hotel_bookings.find())
+    errors.extend(f"hotel {hotel} booked {count} times" for hotel, count in hotel_bookings.items() if count > 1)
+    booked = db.hotels.count_documents({"booked": 1})
+    if booked != len(hotel_bookings):
+        errors.append(f"{booked} hotels marked booked but {len(hotel_bookings)} hotel bookings")
+    for spec, _, _, key in ids["replays"]:
+        confirmed = db[spec.bookings].count_documents({"idempotency_key": key, "status": "confirmed"})
+        if confirmed != 1:
+            errors.append(f"{spec.bookings}: replayed key {key} has {confirmed} confirmed bookings")
+        failed = {
+            status: count for (replay, status), count in replayed.items() if replay == key and status != "confirmed"
+        }
+        if failed:
+            errors.append(f"{spec.bookings}: replays of key {key} got {failed}")
+    return errors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--bookings", type=int, default=200, help="Bookings per thread")
+    parser.add_argument("--transactions", choices=["auto", "on", "off"], default="auto")
+    args = parser.parse_args()
+
+    client = MongoClient(MONGODB_URI)
+    client.drop_database(STRESS_DB)
+    db = client[STRESS_DB]
+    ids = seed(db)
+
+    statuses: list[Counter] = []
+    replayed: list[Counter] = []
+    threads = [
+        threading.Thread(
+            target=asyncio.run, args=(worker(ids, args.bookings, n, args.transactions, statuses, replayed),)
+        )
+        for n in range(args.threads)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    total = args.threads * (args.bookings + REPLAYS)
+    print(f"{total} bookings in {elapsed:.2f}s ({total / elapsed:.0f}/s)")
+    for (status, duplicate), count in sorted(sum(statuses, Counter()).items()):
+        print(f"  {status:<20}{'duplicate' if duplicate else '':<10}{count:>8}")
+
+    errors = check(db, ids, sum(replayed, Counter()))
+    client.drop_database(STRESS_DB)
+    client.close()
+    for error in errors:
+        print(f"FAIL: {error}")
+    if errors:
+        raise SystemExit(1)
+    print("OK: balances, hotel claims and idempotency keys are consistent; every replay was confirmed")
+
+
+if __name__ == "__main__":
+    main()
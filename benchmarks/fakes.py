@@ -0,0 +1,217 @@
+"""Offline stand-ins for the external services the graph talks to.
+
+- ``ScriptedChatModel`` replays scripted assistant replies instead of calling Gemini.
+- ``AsyncMockDatabase`` exposes a mongomock database through the subset of the
+  pymongo async API the tools use.
+- ``seed_inventory`` fills a database with synthetic flights, hotels, tours,
+  shuttles and users.
+"""
+import random
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional, Union
+
+import mongomock
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import Runnable, RunnableLambda
+from pydantic import PrivateAttr
+
+# A scripted reply, or a function building it from the prompt messages.
+Step = Union[AIMessage, Callable[[list[BaseMessage]], AIMessage]]
+
+
+def tool_call(name: str, **args: Any) -> AIMessage:
+    """Assistant reply calling one tool."""
+    return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:12]}"}])
+
+
+class ScriptExhausted(RuntimeError):
+    """The graph made more LLM calls than the conversation script provides."""
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Chat model returning queued replies in order, one per call.
+
+    ``bind_tools`` returns the model itself, so every assistant draws from the
+    same queue. The memory extractor (``with_structured_output``) does not use
+    the queue: it keeps every user message as a memory.
+    """
+
+    _script: deque = PrivateAttr(default_factory=deque)
+    _calls: int = PrivateAttr(default=0)
+    _extractions: int = PrivateAttr(default=0)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    @property
+    def extractions(self) -> int:
+        return self._extractions
+
+    def queue(self, steps: list[Step]) -> None:
+        self._script.extend(steps)
+
+    def remaining(self) -> int:
+        return len(self._script)
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        if not self._script:
+            raise ScriptExhausted(f"no scripted reply left for call {self._calls + 1}")
+        step = self._script.popleft()
+        self._calls += 1
+        message = step(messages) if callable(step) else step
+        # Fresh ids so checkpoints never hold two messages with the same id.
+        message = message.model_copy(update={"id": f"run-{uuid.uuid4()}"})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def bind_tools(self, tools: list, **kwargs: Any) -> Runnable:
+        return self
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> Runnable:
+        def extract(prompt_value) -> Any:
+            self._extractions += 1
+            message = prompt_value.to_messages()[-1].content
+            return schema(is_important=True, formatted_memory=f"User said: {message[:200]}")
+
+        return RunnableLambda(extract)
+
+
+class _AsyncCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._cursor, name)
+        if callable(attribute):
+            return lambda *args, **kwargs: _AsyncCursor(attribute(*args, **kwargs))
+        return attribute
+
+    async def to_list(self, length: Optional[int] = None) -> list[dict]:
+        documents = list(self._cursor)
+        return documents[:length] if length else documents
+
+    async def explain(self) -> dict:
+        return {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}
+
+    def __aiter__(self):
+        async def iterate():
+            for document in self._cursor:
+                yield document
+        return iterate()
+
+
+class _AsyncCollection:
+    def __init__(self, collection: mongomock.Collection):
+        self._collection = collection
+
+    def find(self, *args, **kwargs) -> _AsyncCursor:
+        kwargs.pop("session", None)
+        return _AsyncCursor(self._collection.find(*args, **kwargs))
+
+    async def aggregate(self, pipeline: list[dict], **kwargs) -> _AsyncCursor:
+        return _AsyncCursor(self._collection.aggregate(pipeline))
+
+    async def bulk_write(self, requests: list, **kwargs) -> None:
+        # mongomock's bulk_write does not accept operations from current pymongo;
+        # apply the UpdateOne operations the app sends one at a time.
+        for request in requests:
+            self._collection.update_one(request._filter, request._doc, upsert=request._upsert)
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._collection, name)
+        if not callable(attribute):
+            return attribute
+
+        async def method(*args, **kwargs):
+            # mongomock has no sessions; every operation is applied immediately.
+            kwargs.pop("session", None)
+            return attribute(*args, **kwargs)
+        return method
+
+
+class AsyncMockDatabase:
+    """mongomock database behind the async pymongo calls made by the tools.
+
+    It reports itself as a standalone server, so bookings take the
+    conditional-update path rather than transactions.
+    """
+
+    def __init__(self, name: str = "benchmark"):
+        self.sync = mongomock.MongoClient()[name]
+
+    def __getitem__(self, name: str) -> _AsyncCollection:
+        return _AsyncCollection(self.sync[name])
+
+    def __getattr__(self, name: str) -> _AsyncCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def command(self, name: str, *args, **kwargs) -> dict:
+        return {"ok": 1.0, "isWritablePrimary": True}
+
+
+AIRPORTS = ["HAN", "SGN", "DAD", "PQC", "CXR", "HPH"]
+AIRLINES = ["Vietnam Airlines", "Vietjet Air", "Bamboo Airways"]
+DESTINATIONS = ["Đà Lạt", "Phú Quốc", "Sa Pa", "Hội An", "Nha Trang", "Hạ Long"]
+DISTRICTS = ["Quận 1", "Quận 3", "Quận 7", "Hoàn Kiếm", "Sơn Trà"]
+
+
+def seed_inventory(db: mongomock.Database, day: datetime, flights_per_route: int = 5, seed: int = 7) -> dict:
+    """Insert synthetic inventory around ``day`` and return the seeded user ids."""
+    rng = random.Random(seed)
+    db.flights.insert_many([
+        {
+            "departure_airport": departure,
+            "arrival_airport": arrival,
+            "airline": rng.choice(AIRLINES),
+            "departure_time": day + timedelta(days=offset, hours=rng.randint(5, 22)),
+            "arrival_time": day + timedelta(days=offset, hours=23),
+            "price": rng.randint(800, 3500) * 1000,
+            "seats_available": rng.randint(0, 180),
+        }
+        for departure in AIRPORTS for arrival in AIRPORTS if departure != arrival
+        for offset in range(-3, 4) for _ in range(flights_per_route)
+    ])
+    db.hotels.insert_many([
+        {
+            "name": f"{location} Hotel {n}",
+            "location": location,
+            "price_tier": rng.choice(["budget", "mid", "luxury"]),
+            "price": rng.randint(400, 5000) * 1000,
+            "checkin_date": (day + timedelta(days=rng.randint(0, 10))).strftime("%Y-%m-%d"),
+            "checkout_date": (day + timedelta(days=rng.randint(11, 15))).strftime("%Y-%m-%d"),
+            "booked": 0,
+        }
+        for location in DESTINATIONS for n in range(20)
+    ])
+    db.tours.insert_many([
+        {
+            "name": f"{destination} {days} ngày",
+            "destination": destination,
+            "duration_days": days,
+            "price": rng.randint(1000, 9000) * 1000,
+            "description": f"Tour khám phá {destination} trong {days} ngày.",
+        }
+        for destination in DESTINATIONS for days in (1, 2, 3, 4)
+    ])
+    db.airport_shuttles.insert_many([
+        {
+            "from_airport": airport,
+            "to": district,
+            "pickup_datetime": day + timedelta(hours=rng.randint(0, 72)),
+            "car_type": rng.choice(["4 chỗ", "7 chỗ", "16 chỗ"]),
+            "price": rng.randint(150, 600) * 1000,
+        }
+        for airport in ("SGN", "HAN", "DAD") for district in DISTRICTS for _ in range(4)
+    ])
+    users = db.users.insert_many([{"name": f"user {n}", "balance": 50_000_000} for n in range(8)])
+    return {"users": [str(user_id) for user_id in users.inserted_ids]}
@@ -0,0 +1,349 @@
+"""Offline benchmark of scripted conversations through the real agent graph.
+
+Runs flight search and booking, hotel search and booking, tour lookup,
+shuttle booking and an escalation back to the primary assistant through
+``src.core.nodes.get_graph()``. Gemini is replaced by a scripted chat model and
+MongoDB by mongomock seeded with synthetic inventory. The destination corpus,
+vector store, semantic cache and recall memories run for real; their
+embedding model is a deterministic hash embedding unless ``--hf-embeddings``
+is given (which needs the sentence-transformer in the local Hugging Face cache).
+Hash embeddings only match exact copies of the intent router's and memory
+gate's examples, so without ``--hf-embeddings`` the router is off, the gate
+uses its heuristics alone and neither reports classifier numbers.
+
+Reports wall time per graph node, LLM and tool calls per turn, and memory
+growth. With ``--baseline`` it exits with status 1 when a run regresses.
+
+Usage:
+    python -m benchmarks.graph_bench [--repeat 5] [--json results.json]
+    python -m benchmarks.graph_bench --baseline results.json [--tolerance 0.25]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+
+import psutil
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+
+from benchmarks.fakes import AsyncMockDatabase, ScriptedChatModel, seed_inventory, tool_call
+
+# The weather tool is built with the graph but never called by the scripts.
+os.environ.setdefault("OPENWEATHERMAP_API_KEY", "offline")
+
+
+def last_result_id(messages: list[BaseMessage], index: int = 0) -> str:
+    """Id of a result in the latest search result the model can see."""
+    for message in reversed(messages):
+        if isinstance(message, ToolMessage):
+            # The latest turns reach the model in full, so the result the user picks from is never compacted.
+            try:
+                return json.loads(message.content)["results"][index]["id"]
+            except (ValueError, KeyError, IndexError, TypeError):
+                continue
+    raise LookupError("no search result in the conversation")
+
+
+def conversations(day: datetime) -> dict[str, list[tuple[str, list]]]:
+    """Scripted conversations: each user turn with the replies the LLM gives during it."""
+    day_text = day.strftime("%Y-%m-%d")
+    return {
+        "flight_search_and_book": [
+            (f"Tìm chuyến bay từ HAN đến SGN ngày {day_text}", [
+                tool_call("ToFlightBookingAssistant", request="HAN to SGN"),
+                tool_call("search_flights", departure_airport="HAN", arrival_airport="SGN", departure_day=day_text),
+                AIMessage(content="Có 5 chuyến bay, rẻ nhất là chuyến đầu tiên."),
+            ]),
+            ("Đặt chuyến rẻ nhất cho tôi", [
+                lambda messages: tool_call("book_flight", flight_id=last_result_id(messages)),
+                AIMessage(content="Bạn đã đặt vé thành công."),
+            ]),
+        ],
+        "hotel_search_and_book": [
+            ("Tìm khách sạn ở Đà Lạt", [
+                tool_call("ToHotelBookingAssistant", request="Hotel in Đà Lạt"),
+                tool_call("search_hotels", location="Đà Lạt", limit=5),
+                AIMessage(content="Đây là 5 khách sạn giá tốt nhất ở Đà Lạt."),
+            ]),
+            ("Xem thêm khách sạn khác", [
+                tool_call("search_hotels", location="Đà Lạt", limit=5, cursor="5"),
+                AIMessage(content="Đây là 5 khách sạn tiếp theo."),
+            ]),
+            ("Đặt khách sạn đầu tiên", [
+                lambda messages: tool_call("book_hotel", hotel_id=last_result_id(messages)),
+                AIMessage(content="Đã đặt khách sạn."),
+            ]),
+        ],
+        "tour_lookup": [
+            ("Có tour nào đi Phú Quốc không?", [
+                tool_call("ToTourBookingAssistant", request="Tour to Phú Quốc"),
+                tool_call("lookup_available_tours", destination="Phú Quốc"),
+                AIMessage(content="Có 4 tour đi Phú Quốc từ 1 đến 4 ngày."),
+            ]),
+        ],
+        "shuttle_booking": [
+            ("Tôi cần xe từ SGN về Quận 1", [
+                tool_call(
+                    "ToBookAirportShuttle", from_airport="SGN", to="Quận 1",
+                    pickup_datetime=f"{day_text}T10:00:00", request="",
+                ),
+                tool_call("search_shuttles", from_airport="SGN", to="Quận 1"),
+                AIMessage(content="Có 4 xe phù hợp."),
+            ]),
+            ("Đặt xe đầu tiên", [
+                lambda messages: tool_call("book_shuttle", shuttle_id=last_result_id(messages)),
+                AIMessage(content="Bạn đã đặt xe thành công."),
+            ]),
+        ],
+        "escalation": [
+            ("Tôi muốn đặt vé máy bay", [
+                tool_call("ToFlightBookingAssistant", request="Book a flight"),
+                AIMessage(content="Bạn muốn bay từ đâu đến đâu?"),
+            ]),
+            ("Thôi, gợi ý cho tôi vài điểm du lịch biển", [
+                tool_call("CompleteOrEscalate", reason="User wants destination ideas"),
+                tool_call("get_popular_tourist_destinations", query="điểm du lịch biển"),
+                AIMessage(content="Phú Quốc và Nha Trang là hai điểm đến biển nổi tiếng."),
+            ]),
+        ],
+    }
+
+
+class GraphTimer(BaseCallbackHandler):
+    """Collects wall time per graph node and tool calls per tool."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.node_seconds: defaultdict[str, float] = defaultdict(float)
+        self.node_runs: defaultdict[str, int] = defaultdict(int)
+        self.tool_calls: defaultdict[str, int] = defaultdict(int)
+        self._starts: dict = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        if metadata and kwargs.get("name") == metadata.get("langgraph_node"):
+            self._starts[run_id] = (kwargs["name"], time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        if started := self._starts.pop(run_id, None):
+            node, start = started
+            self.node_seconds[node] += time.perf_counter() - start
+            self.node_runs[node] += 1
+
+    on_chain_error = on_chain_end
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self.tool_calls[kwargs.get("name") or (serialized or {}).get("name", "?")] += 1
+
+
+def install_fakes(use_hf_embeddings: bool, index_dir: str) -> tuple[ScriptedChatModel, AsyncMockDatabase, dict]:
+    """Point the app's service accessors at the offline stand-ins."""
+    import src.agents.agents as agents
+    import src.database.db as db
+    import src.tools.tools as tools
+    from src.database.embeddings import BatchedEmbeddings, CachedEmbeddings
+
+    model = ScriptedChatModel()
+    agents.get_llm = lambda: model
+    agents.get_fallback_llm = lambda: None
+
+    database = AsyncMockDatabase()
+    tools.get_db = lambda: database
+    ids = seed_inventory(database.sync, datetime.combine(datetime.now().date(), datetime.min.time()))
+
+    if not use_hf_embeddings:
+        # Keep the hash-embedded index away from the real one.
+        db.INDEX_DIR = index_dir
+        embeddings = CachedEmbeddings(
+            BatchedEmbeddings(DeterministicFakeEmbedding(size=768), db.EMBEDDING_BATCH_SIZE, db.EMBEDDING_BATCH_WAIT_MS),
+            max_entries=db.EMBEDDING_CACHE_SIZE,
+        )
+        db.get_embeddings = lambda: embeddings
+        db.EMBEDDING_MODEL = "deterministic-fake-768"
+
+        import src.core.nodes as nodes
+        from src.utils.memory_gate import MemoryGate
+
+        nodes.INTENT_ROUTER_ENABLED = False
+        gate = MemoryGate(None, min_words=int(os.getenv("MEMORY_GATE_MIN_WORDS", "3")))
+        nodes.get_memory_gate = lambda: gate
+    return model, database, ids
+
+
+def _rss_mb() -> float:
+    return psutil.Process().memory_info().rss / 2**20
+
+
+def is_transfer(step) -> bool:
+    """Whether a scripted reply is the primary assistant handing over to a specialist."""
+    return isinstance(step, AIMessage) and any(call["name"].startswith("To") for call in step.tool_calls)
+
+
+async def run(args: argparse.Namespace, index_dir: str) -> dict:
+    model, database, ids = install_fakes(args.hf_embeddings, index_dir)
+    from src.core.nodes import (
+        INTENT_ROUTER_ENABLED, MEMORY_GATE_ENABLED, checkpointer, get_graph, get_intent_router, get_memory_gate,
+        memory_queue,
+    )
+    from src.database.db import get_memory_store, get_vector_store
+    from src.database.search_keys import backfill_search_keys
+    from src.utils.startup import startup_report
+
+    await backfill_search_keys(database)
+
+    start = time.perf_counter()
+    get_vector_store()
+    get_memory_store()
+    graph = await asyncio.to_thread(get_graph)
+    startup_seconds = time.perf_counter() - start
+
+    day = datetime.combine(datetime.now().date(), datetime.min.time())
+    scripts = conversations(day)
+    timer = GraphTimer()
+    per_conversation = defaultdict(lambda: {"turns": 0, "llm_calls": 0, "tool_calls": 0, "seconds": 0.0})
+    turn_seconds = []
+    intent_routed = 0
+    if args.trace_memory:
+        tracemalloc.start()
+    rss_before = _rss_mb()
+
+    for repeat in range(args.repeat):
+        for number, (name, turns) in enumerate(scripts.items()):
+            config = {
+                "configurable": {
+                    "thread_id": f"{name}-{repeat}",
+                    "user_id": ids["users"][number % len(ids["users"])],
+                },
+                "callbacks": [timer],
+            }
+            stats = per_conversation[name]
+            for text, steps in turns:
+                # The LLM hand-over is skipped for turns the local intent router claims.
+                if steps and is_transfer(steps[0]) and INTENT_ROUTER_ENABLED:
+                    router = get_intent_router()
+                    if router.classify(await router.embeddings.aembed_query(text)):
+                        steps = steps[1:]
+                        intent_routed += 1
+                model.queue(steps)
+                calls_before, tools_before = model.calls, sum(timer.tool_calls.values())
+                turn_start = time.perf_counter()
+                await graph.ainvoke({"messages": text}, config)
+                elapsed = time.perf_counter() - turn_start
+                if model.remaining():
+                    raise RuntimeError(f"{name}: {model.remaining()} scripted replies unused after {text!r}")
+                turn_seconds.append(elapsed)
+                stats["turns"] += 1
+                stats["seconds"] += elapsed
+                stats["llm_calls"] += model.calls - calls_before
+                stats["tool_calls"] += sum(timer.tool_calls.values()) - tools_before
+
+    await memory_queue.flush_all(timeout=60)
+    traced = tracemalloc.get_traced_memory() if args.trace_memory else None
+    memory_store = get_memory_store()
+    turns = len(turn_seconds)
+    return {
+        "startup_seconds": startup_seconds,
+        "startup_report": startup_report.format(),
+        "turns": turns,
+        "mean_turn_ms": 1000 * sum(turn_seconds) / turns,
+        "p95_turn_ms": 1000 * sorted(turn_seconds)[min(int(turns * 0.95), turns - 1)],
+        "llm_calls_per_turn": model.calls / turns,
+        "tool_calls_per_turn": sum(timer.tool_calls.values()) / turns,
+        "memory_extractions": model.extractions,
+        "embeddings": "hf" if args.hf_embeddings else "fake",
+        "memory_gate_skips": get_memory_gate().stats["skipped"] if MEMORY_GATE_ENABLED else 0,
+        "intent_routed_turns": intent_routed if INTENT_ROUTER_ENABLED else None,
+        "nodes": {
+            node: {"runs": timer.node_runs[node], "total_ms": 1000 * seconds, "mean_ms": 1000 * seconds / timer.node_runs[node]}
+            for node, seconds in sorted(timer.node_seconds.items(), key=lambda item: -item[1])
+        },
+        "tools": dict(timer.tool_calls),
+        "conversations": dict(per_conversation),
+        "memory": {
+            "rss_growth_mb": _rss_mb() - rss_before,
+            "python_heap_mb": traced[0] / 2**20 if traced else None,
+            "python_heap_peak_mb": traced[1] / 2**20 if traced else None,
+            "checkpointer": checkpointer.stats,
+            "recall_memories": sum(memory_store.count(user_id) for user_id in ids["users"]),
+        },
+    }
+
+
+def print_report(results: dict) -> None:
+    print(results["startup_report"])
+    print(f"\nStartup {results['startup_seconds']:.2f}s, {results['turns']} turns: "
+          f"mean {results['mean_turn_ms']:.1f} ms, p95 {results['p95_turn_ms']:.1f} ms, "
+          f"{results['llm_calls_per_turn']:.2f} LLM calls and {results['tool_calls_per_turn']:.2f} tool calls per turn", end="")
+    if results.get("intent_routed_turns") is not None:
+        print(f", {results['intent_routed_turns']} turns routed without the primary assistant", end="")
+    print()
+
+    print(f"\n{'node':<28}{'runs':>8}{'total ms':>12}{'mean ms':>10}")
+    for node, stats in results["nodes"].items():
+        print(f"{node:<28}{stats['runs']:>8}{stats['total_ms']:>12.1f}{stats['mean_ms']:>10.2f}")
+
+    print(f"\n{'conversation':<28}{'turns':>8}{'llm':>8}{'tools':>8}{'ms/turn':>10}")
+    for name, stats in results["conversations"].items():
+        print(f"{name:<28}{stats['turns']:>8}{stats['llm_calls']:>8}{stats['tool_calls']:>8}"
+              f"{1000 * stats['seconds'] / stats['turns']:>10.1f}")
+
+    memory = results["memory"]
+    print(f"\nMemory: RSS +{memory['rss_growth_mb']:.1f} MB", end="")
+    if memory["python_heap_mb"] is not None:
+        print(f", Python heap {memory['python_heap_mb']:.1f} MB (peak {memory['python_heap_peak_mb']:.1f} MB)", end="")
+    print(f", checkpoints {memory['checkpointer']['bytes'] / 1024:.0f} KB in {memory['checkpointer']['threads']} threads, "
+          f"{memory['recall_memories']} recall memories ({results['memory_extractions']} extractions, "
+          f"{results.get('memory_gate_skips', 0)} skipped by the memory gate"
+          f"{'' if results.get('embeddings') == 'hf' else ' heuristics'})")
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    found = []
+    if results.get("embeddings") != baseline.get("embeddings"):
+        # Intent routing, and so LLM calls per turn, differ between the two.
+        found.append(f"baseline measured with {baseline.get('embeddings')} embeddings, this run with {results['embeddings']}")
+    for key in ("llm_calls_per_turn", "tool_calls_per_turn"):
+        if results[key] > baseline[key] + 1e-9:
+            found.append(f"{key}: {results[key]:.2f} > baseline {baseline[key]:.2f}")
+    for key in ("mean_turn_ms", "p95_turn_ms"):
+        if results[key] > baseline[key] * (1 + tolerance):
+            found.append(f"{key}: {results[key]:.1f} > baseline {baseline[key]:.1f} + {tolerance:.0%}")
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Times each conversation is replayed")
+    parser.add_argument("--hf-embeddings", action="store_true", help="Use the real sentence-transformer")
+    parser.add_argument("--trace-memory", action="store_true", help="Track the Python heap (slows the run)")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Fail when the results regress from this earlier --json output")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown against the baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        results = asyncio.run(run(args, index_dir))
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            found = regressions(results, json.load(file), args.tolerance)
+        for regression in found:
+            print(f"REGRESSION: {regression}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Check of recall-memory deduplication: updates replace, distinct facts survive.
+
+Writes pairs of memories for one user through ``UserMemoryStore`` and checks
+what is left: one memory with the newer text when the new memory restates or
+extends the old one, one memory with the old text when the new one says less,
+and both memories when the new one adds a different fact, such as a second
+allergy. Exits with status 1 when any pair ends otherwise.
+
+The store embeds memories with the sentence-transformer in the local Hugging
+Face cache. ``--all-similar`` gives every memory the same vector instead, so
+each pair counts as near-duplicate and only the word test decides.
+
+Usage:
+    python -m benchmarks.memory_dedup [--threshold 0.92]
+    python -m benchmarks.memory_dedup --all-similar
+"""
+import argparse
+import sys
+
+from langchain_core.embeddings import Embeddings
+
+from src.database.memory_store import UserMemoryStore
+
+REPLACED = "replaced"
+KEPT = "kept"
+BOTH = "both"
+
+# (stored memory, new memory, expected outcome)
+CASES = [
+    ("User lives in Ho Chi Minh City", "User lives in District 7, Ho Chi Minh City", REPLACED),
+    ("User is allergic to seafood", "User is allergic to seafood and peanuts", REPLACED),
+    ("User is vegetarian", "user is Vegetarian.", REPLACED),
+    ("User prefers window seats on long flights", "User prefers window seats", KEPT),
+    ("User is allergic to seafood", "User is allergic to peanuts", BOTH),
+    ("User travels with two children", "User travels with a wheelchair", BOTH),
+    ("Người dùng thích khách sạn gần biển", "Người dùng thích khách sạn gần biển, yên tĩnh", REPLACED),
+    ("Người dùng dị ứng hải sản", "Người dùng dị ứng đậu phộng", BOTH),
+]
+
+
+class SameVectorEmbeddings(Embeddings):
+    """Every text gets the same vector, so every pair is a near-duplicate."""
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return [1.0, 0.0]
+
+
+def outcome(store: UserMemoryStore, old: str, new: str) -> tuple[str, list[str]]:
+    store.add_memory("user", old)
+    store.add_memory("user", new)
+    texts = [entry["text"] for entry in store._get_store("user").store.values()]
+    if len(texts) == 2:
+        return BOTH, texts
+    return (REPLACED if texts == [new] else KEPT if texts == [old] else "merged"), texts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threshold", type=float, default=0.92, help="MEMORY_DEDUP_THRESHOLD")
+    parser.add_argument("--all-similar", action="store_true", help="Treat every pair as near-duplicate")
+    args = parser.parse_args()
+
+    if args.all_similar:
+        embeddings = SameVectorEmbeddings()
+    else:
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        from src.database.db import EMBEDDING_MODEL
+
+        embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+
+    failures = 0
+    print(f"{'expected':<10}{'got':<10}memories")
+    for old, new, expected in CASES:
+        store = UserMemoryStore(embeddings, dedup_threshold=args.threshold)
+        got, texts = outcome(store, old, new)
+        failures += got != expected
+        print(f"{expected:<10}{got:<10}{' | '.join(texts)}{'' if got == expected else '  <- FAIL'}")
+    print(f"\n{len(CASES) - failures}/{len(CASES)} as expected")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Offline evaluation of the memory gate: extractor calls saved against memories missed.
+
+Runs ``MemoryGate`` over labeled user messages, a built-in set of typical
+booking-chat turns or a JSON Lines file of ``{"text": ..., "memorable": true}``
+records (for instance messages logged with the extractor's ``is_important``
+verdict). For each classifier confidence it reports the share of extractor
+calls skipped and the share of memorable messages skipped, then lists the
+memorable messages missed at the chosen confidence.
+
+The classifier needs the sentence-transformer in the local Hugging Face cache;
+``--heuristics-only`` evaluates the length and keyword checks alone.
+
+Usage:
+    python -m benchmarks.memory_gate_eval [--confidence 0.6 0.7 0.75 0.8 0.9]
+    python -m benchmarks.memory_gate_eval --jsonl labeled.jsonl --min-words 4
+    python -m benchmarks.memory_gate_eval --heuristics-only
+"""
+import argparse
+import json
+from typing import Optional
+
+from src.utils.memory_gate import GateDecision, MemoryGate
+
+# Messages the extractor should keep, none of them among the gate's own examples.
+MEMORABLE_MESSAGES = [
+    "Tôi bị dị ứng đậu phộng",
+    "Con gái tôi mới 3 tuổi",
+    "Tôi thích ở homestay hơn khách sạn",
+    "Tôi ăn chay trường",
+    "Tôi hay say xe khi đi đường đèo",
+    "Chồng tôi không thích đi tour đông người",
+    "Nhà tôi ở Cầu Giấy, Hà Nội",
+    "Tôi là thành viên Bông Sen Vàng",
+    "Tháng sau là kỷ niệm 10 năm ngày cưới của chúng tôi",
+    "Bố tôi đã 80 tuổi, đi lại chậm",
+    "Chúng tôi đi 4 người lớn và 2 trẻ em",
+    "Tôi chỉ bay hạng thương gia",
+    "Lần trước ở Đà Lạt tôi bị lạnh quá, lần này muốn đi chỗ ấm",
+    "Tôi sợ độ cao, đừng gợi ý cáp treo",
+    "I work remotely, so I need good wifi wherever I stay",
+    "My son uses a wheelchair",
+    "I'm allergic to shellfish",
+    "I prefer morning flights",
+    "We're a group of five friends from Singapore",
+    "I don't drink alcohol",
+    "Our budget is around 20 million VND for the whole trip",
+    "I hate long layovers",
+    "This is my first time in Vietnam",
+    "I'm travelling for my 40th birthday",
+]
+
+# Everyday turns the extractor should discard.
+ROUTINE_MESSAGES = [
+    "ok",
+    "Cảm ơn",
+    "Vâng",
+    "yes please",
+    "book the first one",
+    "Đặt chuyến đầu tiên nhé",
+    "Chọn cái thứ 2",
+    "Xác nhận đặt phòng",
+    "thanks, that's all",
+    "Có chuyến bay nào từ Đà Nẵng đi Hà Nội tối nay không?",
+    "Tìm khách sạn ở Hội An từ ngày 12 đến 14",
+    "Giá tour Hạ Long 2 ngày là bao nhiêu?",
+    "Xem thêm kết quả",
+    "Có xe 7 chỗ không?",
+    "Đổi sang chuyến 10 giờ",
+    "Hủy vé giúp tôi",
+    "Sa Pa tuần này có mưa không?",
+    "Gợi ý vài điểm tham quan ở Huế",
+    "Khách sạn này có hồ bơi không?",
+    "Tôi muốn đặt xe từ sân bay Nội Bài về Hoàn Kiếm",
+    "Chuyến bay đó mấy giờ hạ cánh?",
+    "Còn phòng trống không?",
+    "Show me flights from Hanoi to Phu Quoc on Friday",
+    "Any cheaper options?",
+    "What time does the shuttle leave?",
+    "Is breakfast included?",
+    "Cancel my hotel booking",
+    "How far is the hotel from the beach?",
+    "Find tours in Da Nang",
+    "What is the weather in Nha Trang tomorrow?",
+    "Can I pay by card?",
+    "Which airline is that?",
+    "Book the cheapest one",
+    "Go back to the previous results",
+    "Hello",
+    "Bạn là ai?",
+]
+
+
+def load_messages(path: Optional[str]) -> list[tuple[str, bool]]:
+    if path is None:
+        return [(text, True) for text in MEMORABLE_MESSAGES] + [(text, False) for text in ROUTINE_MESSAGES]
+    with open(path, encoding="utf-8") as file:
+        return [(record["text"], bool(record["memorable"])) for record in map(json.loads, file) if record]
+
+
+def evaluate(gate: MemoryGate, messages: list[tuple[str, bool]], vectors: Optional[list]) -> dict:
+    """Skip and miss rates of the gate at its current settings."""
+    decisions: list[GateDecision] = []
+    for index, (text, _) in enumerate(messages):
+        decision = gate.screen(text)
+        if decision is None:
+            decision = gate.classify(vectors[index]) if vectors is not None else GateDecision(True, "memorable")
+        decisions.append(decision)
+    memorable = sum(label for _, label in messages)
+    missed = [text for (text, label), decision in zip(messages, decisions) if label and not decision.extract]
+    skipped = sum(not decision.extract for decision in decisions)
+    return {
+        "skip_rate": skipped / len(messages),
+        "routine_skipped": (skipped - len(missed)) / max(len(messages) - memorable, 1),
+        "missed_rate": len(missed) / max(memorable, 1),
+        "missed": missed,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jsonl", help="Labeled messages: one {\"text\": ..., \"memorable\": bool} per line")
+    parser.add_argument("--confidence", type=float, nargs="+", default=[0.6, 0.7, 0.75, 0.8, 0.9],
+                        help="Classifier confidences (MEMORY_GATE_MIN_CONFIDENCE) to compare")
+    parser.add_argument("--min-words", type=int, default=3, help="MEMORY_GATE_MIN_WORDS")
+    parser.add_argument("--show", type=float, default=0.75, help="List the memories missed at this confidence")
+    parser.add_argument("--heuristics-only", action="store_true", help="Leave out the embedding classifier")
+    args = parser.parse_args()
+
+    messages = load_messages(args.jsonl)
+    embeddings, vectors = None, None
+    if not args.heuristics_only:
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        from src.database.db import EMBEDDING_MODEL
+
+        embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+        vectors = embeddings.embed_documents([text for text, _ in messages])
+    gate = MemoryGate(embeddings, min_words=args.min_words)
+
+    memorable = sum(label for _, label in messages)
+    print(f"{len(messages)} messages, {memorable} memorable, min_words={args.min_words}")
+    print(f"{'confidence':<12}{'calls saved':>12}{'routine skipped':>17}{'memories missed':>17}")
+    confidences = [None] if args.heuristics_only else sorted(set(args.confidence) | {args.show})
+    shown = None
+    for confidence in confidences:
+        if confidence is not None:
+            gate.min_confidence = confidence
+        result = evaluate(gate, messages, vectors)
+        label = "heuristics" if confidence is None else f"{confidence:g}"
+        print(f"{label:<12}{result['skip_rate']:>12.0%}{result['routine_skipped']:>17.0%}{result['missed_rate']:>17.0%}")
+        if confidence is None or confidence == args.show:
+            shown = result
+    if shown["missed"]:
+        print(f"\nMissed at {'heuristics only' if args.heuristics_only else f'confidence {args.show:g}'}:")
+        for text in shown["missed"]:
+            print(f"  {text}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,21 @@
+import asyncio
+import logging
 import os
 from datetime import date, datetime
 from typing import Callable, List, Optional
 
 from dotenv import load_dotenv
-from langchain_community.agent_toolkits.load_tools import load_tools
-from langchain_core.messages import ToolMessage
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, ToolMessage
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.tools import BaseTool
 from langchain_google_genai import ChatGoogleGenerativeAI
 from pydantic import BaseModel, Field
 
+from src.agents.resilience import CallPolicy, LatencyWindow, TokenWatch, hedged_invoke
+from src.core.context import ContextWindow
 from src.core.state import State
-from src.database.db import vector_store
 from src.tools.tools import (
     book_flight,
     book_hotel,
@@ -23,56 +27,197 @@ from src.tools.tools import (
     search_recall_memories,
     search_shuttles,
 )
+from src.utils.metrics import metrics
 from src.utils.prompt import prompt
+from src.utils.startup import lazy_singleton, resolve, startup_report
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # ============================================================================
 # LLM CONFIGURATION
 # ============================================================================
 
-weather_tool = load_tools(["openweathermap-api"])
 api_key = os.getenv("GEMINI_API_KEY")
 model_id = "gemini-2.0-flash"
+# Used once the primary model misses the turn deadline; empty disables the fallback
+fallback_model_id = os.getenv("FALLBACK_MODEL_ID", "gemini-2.0-flash-lite")
+
+call_policy = CallPolicy(
+    attempt_timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", "30")),
+    deadline=float(os.getenv("LLM_DEADLINE_SECONDS", "60")),
+    max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", "3")),
+    hedge=os.getenv("LLM_HEDGE", "true").lower() == "true",
+)
+
+# Shown when neither model produced an answer in time
+UNAVAILABLE_MESSAGE = "Xin lỗi, hệ thống đang bận. Bạn vui lòng thử lại sau ít phút."
 
-llm = ChatGoogleGenerativeAI(
-    model=model_id,
-    temperature=0,
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-    google_api_key=api_key,
+# Conversation history sent on each LLM call, trimmed to this many (estimated) tokens
+context_window = ContextWindow(
+    max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", "6000")),
+    keep_turns=int(os.getenv("CONTEXT_KEEP_TURNS", "2")),
 )
+metrics.register_gauge("llm_context", lambda: context_window.stats)
+
+
+@lazy_singleton("weather_tool")
+def get_weather_tool() -> list[BaseTool]:
+    """OpenWeatherMap tools for the primary assistant."""
+    with startup_report.measure("weather_tool", "import"):
+        from langchain_community.agent_toolkits.load_tools import load_tools
+    return load_tools(["openweathermap-api"])
+
+
+@lazy_singleton("llm")
+def get_llm() -> ChatGoogleGenerativeAI:
+    """Gemini chat model shared by every assistant."""
+    return ChatGoogleGenerativeAI(
+        model=model_id,
+        temperature=0,
+        max_tokens=None,
+        timeout=call_policy.attempt_timeout,
+        # CallPolicy is the only retry layer, so retries stay within the turn deadline.
+        max_retries=0,
+        google_api_key=api_key,
+    )
+
+
+@lazy_singleton("fallback_llm")
+def get_fallback_llm() -> Optional[ChatGoogleGenerativeAI]:
+    """Secondary Gemini model, or None when no fallback is configured."""
+    if not fallback_model_id:
+        return None
+    return ChatGoogleGenerativeAI(
+        model=fallback_model_id,
+        temperature=0,
+        max_tokens=None,
+        timeout=call_policy.attempt_timeout,
+        # CallPolicy is the only retry layer, so retries stay within the turn deadline.
+        max_retries=0,
+        google_api_key=api_key,
+    )
 
 
 # ============================================================================
 # BASE CLASSES
 # ============================================================================
 
+def _is_empty(result: AIMessage) -> bool:
+    return not result.tool_calls and (
+        not result.content
+        or isinstance(result.content, list)
+        and not result.content[0].get("text")
+    )
+
+
 class Assistant:
-    """Base assistant class that wraps a runnable and handles empty responses."""
+    """Base assistant class that wraps a runnable and handles empty responses.
+
+    The runnable is given as a zero-argument accessor and resolved on the first
+    call, so building the graph does not build any model client. The history is
+    fitted into ``context_window`` before each call.
+
+    Each turn follows ``policy``: every request has a timeout, failed or empty
+    responses are retried with backoff up to ``max_attempts`` times within the
+    turn deadline, and a slow request is hedged with a second one after the
+    recent p95 latency. When that budget is spent, the turn is answered by
+    ``get_fallback`` (the same prompt on the fallback model) if available. A
+    request that already streamed part of its reply to the user is never hedged
+    or retried: if it fails, the turn ends with ``UNAVAILABLE_MESSAGE``.
+    Outcomes are counted in ``metrics`` per graph node.
+    """
     
-    def __init__(self, runnable: Runnable):
-        self.runnable = runnable
-
-    def __call__(self, state: State, config: RunnableConfig):
-        while True:
-            configuration = config.get("configurable", {})
-            user_id = configuration.get("user_id", None)
-            state = {**state, "user_id": user_id}
-            result = self.runnable.invoke(state)
-            
-            # If the LLM returns an empty response, re-prompt for actual response
-            if not result.tool_calls and (
-                not result.content
-                or isinstance(result.content, list)
-                and not result.content[0].get("text")
-            ):
-                messages = state["messages"] + [("user", "Respond with a real output.")]
-                state = {**state, "messages": messages}
-            else:
+    def __init__(
+        self,
+        get_runnable: Callable[[], Runnable],
+        get_fallback: Optional[Callable[[], Optional[Runnable]]] = None,
+        policy: CallPolicy = call_policy,
+    ):
+        self.get_runnable = get_runnable
+        self.get_fallback = get_fallback
+        self.policy = policy
+        self.latencies = LatencyWindow()
+
+    @property
+    def runnable(self) -> Runnable:
+        return self.get_runnable()
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.policy.hedge:
+            return None
+        p95 = self.latencies.percentile(self.policy.hedge_percentile, self.policy.hedge_min_samples)
+        return None if p95 is None else max(p95, self.policy.hedge_min_delay)
+
+    async def _fallback(self, state: dict, node: str) -> AIMessage:
+        fallback = await resolve(self.get_fallback) if self.get_fallback else None
+        if fallback is None:
+            metrics.inc("llm_fallbacks_total", node=node, outcome="unavailable")
+            return AIMessage(content=UNAVAILABLE_MESSAGE)
+        try:
+            result = await asyncio.wait_for(fallback.ainvoke(state), self.policy.attempt_timeout)
+        except Exception:
+            logger.warning("Fallback model failed in %s", node, exc_info=True)
+            metrics.inc("llm_fallbacks_total", node=node, outcome="failed")
+            return AIMessage(content=UNAVAILABLE_MESSAGE)
+        if _is_empty(result):
+            metrics.inc("llm_fallbacks_total", node=node, outcome="empty")
+            return AIMessage(content=UNAVAILABLE_MESSAGE)
+        metrics.inc("llm_fallbacks_total", node=node, outcome="ok")
+        return result
+
+    async def __call__(self, state: State, config: RunnableConfig):
+        configuration = config.get("configurable", {})
+        user_id = configuration.get("user_id", None)
+        node = config.get("metadata", {}).get("langgraph_node", "assistant")
+        messages = context_window.fit(state["messages"])
+        state = {**state, "user_id": user_id, "messages": messages}
+        runnable = await resolve(self.get_runnable)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.policy.deadline
+        failed = False
+        for attempt in range(self.policy.max_attempts):
+            if failed:
+                await asyncio.sleep(min(self.policy.backoff(attempt - 1), max(deadline - loop.time(), 0)))
+            remaining = deadline - loop.time()
+            if remaining <= 0:
                 break
-        return {"messages": result}
+            watch = TokenWatch()
+            failed = False
+            try:
+                result, latency, hedge = await asyncio.wait_for(
+                    hedged_invoke(runnable, state, self._hedge_delay(), watch),
+                    min(self.policy.attempt_timeout, remaining),
+                )
+            except asyncio.TimeoutError:
+                metrics.inc("llm_calls_total", node=node, outcome="timeout")
+                failed = True
+            except Exception:
+                logger.warning("LLM call failed in %s (attempt %d)", node, attempt + 1, exc_info=True)
+                metrics.inc("llm_calls_total", node=node, outcome="error")
+                failed = True
+            if failed:
+                if watch.streamed.is_set():
+                    # Part of the reply already reached the user; a retry would repeat it in full.
+                    metrics.inc("llm_fallbacks_total", node=node, outcome="partial")
+                    return {"messages": AIMessage(content=UNAVAILABLE_MESSAGE)}
+                continue
+
+            self.latencies.record(latency)
+            if hedge:
+                metrics.inc("llm_hedges_total", node=node, outcome=hedge)
+            # If the LLM returns an empty response, re-prompt for actual response
+            if _is_empty(result):
+                metrics.inc("llm_calls_total", node=node, outcome="empty")
+                state = {**state, "messages": messages + [("user", "Respond with a real output.")]}
+                failed = False
+                continue
+            metrics.inc("llm_calls_total", node=node, outcome="ok")
+            return {"messages": result}
+
+        return {"messages": await self._fallback(state, node)}
 
 
 class CompleteOrEscalate(BaseModel):
@@ -179,6 +324,8 @@ flight_booking_prompt = ChatPromptTemplate.from_messages([
         "The primary assistant delegates work to you whenever the user needs help with flights. "
         "CONFIRM the booked flight details with the customer and inform them of any additional fees. "
         "When searching, be persistent. Expand your query bounds if the first search returns no results. "
+        "For flights, expand them in a single search: set flexible_days and list every nearby airport "
+        "instead of searching again day by day or airport by airport. "
         "If you need more information or the customer changes their mind, escalate the task back to the main assistant. "
         "Remember that a booking isn't completed until after the relevant tool has successfully been used."
         "\n\nCurrent user flight information:\n<Flights>\n{user_id}\n</Flights>"
@@ -265,30 +412,97 @@ primary_assistant_prompt = ChatPromptTemplate.from_messages([
 # RUNNABLES (Agent + Tools)
 # ============================================================================
 
-# Flight booking
 book_flight_tools = [search_flights, book_flight]
-book_flight_runnable = flight_booking_prompt | llm.bind_tools(book_flight_tools + [CompleteOrEscalate])
+book_hotel_tools = [search_hotels, book_hotel]
+book_tour_tools = [lookup_available_tours]
+book_shuttle_tools = [search_shuttles, book_shuttle]
+
+
+def book_flight_chain(llm: BaseChatModel) -> Runnable:
+    return flight_booking_prompt | llm.bind_tools(book_flight_tools + [CompleteOrEscalate])
+
+
+def book_hotel_chain(llm: BaseChatModel) -> Runnable:
+    return book_hotel_prompt | llm.bind_tools(book_hotel_tools + [CompleteOrEscalate])
+
+
+def book_tour_chain(llm: BaseChatModel) -> Runnable:
+    return tour_booking_prompt | llm.bind_tools(book_tour_tools + [CompleteOrEscalate])
+
+
+def book_shuttle_chain(llm: BaseChatModel) -> Runnable:
+    return book_shuttle_prompt | llm.bind_tools(book_shuttle_tools + [CompleteOrEscalate])
+
+
+def assistant_chain(llm: BaseChatModel) -> Runnable:
+    return primary_assistant_prompt | llm.bind_tools([
+        ToFlightBookingAssistant,
+        ToBookAirportShuttle,
+        ToTourBookingAssistant,
+        ToHotelBookingAssistant,
+        get_popular_tourist_destinations
+    ] + get_weather_tool())
+
+
+# Flight booking
+@lazy_singleton("book_flight_runnable")
+def get_book_flight_runnable() -> Runnable:
+    return book_flight_chain(get_llm())
+
 
 # Hotel booking
-book_hotel_tools = [search_hotels, book_hotel]
-book_hotel_runnable = book_hotel_prompt | llm.bind_tools(book_hotel_tools + [CompleteOrEscalate])
+@lazy_singleton("book_hotel_runnable")
+def get_book_hotel_runnable() -> Runnable:
+    return book_hotel_chain(get_llm())
+
 
 # Tour booking
-book_tour_tools = [lookup_available_tours]
-book_tour_runnable = tour_booking_prompt | llm.bind_tools(book_tour_tools + [CompleteOrEscalate])
+@lazy_singleton("book_tour_runnable")
+def get_book_tour_runnable() -> Runnable:
+    return book_tour_chain(get_llm())
+
 
 # Shuttle booking
-book_shuttle_tools = [search_shuttles, book_shuttle]
-book_shuttle_runnable = book_shuttle_prompt | llm.bind_tools(book_shuttle_tools + [CompleteOrEscalate])
+@lazy_singleton("book_shuttle_runnable")
+def get_book_shuttle_runnable() -> Runnable:
+    return book_shuttle_chain(get_llm())
+
 
 # Primary assistant
-assistant_runnable = primary_assistant_prompt | llm.bind_tools([
-    ToFlightBookingAssistant,
-    ToBookAirportShuttle,
-    ToTourBookingAssistant,
-    ToHotelBookingAssistant,
-    get_popular_tourist_destinations
-] + weather_tool)
+@lazy_singleton("assistant_runnable")
+def get_assistant_runnable() -> Runnable:
+    return assistant_chain(get_llm())
+
+
+# Fallback model versions, only built once a turn falls back
+@lazy_singleton("book_flight_fallback")
+def get_book_flight_fallback() -> Optional[Runnable]:
+    llm = get_fallback_llm()
+    return book_flight_chain(llm) if llm else None
+
+
+@lazy_singleton("book_hotel_fallback")
+def get_book_hotel_fallback() -> Optional[Runnable]:
+    llm = get_fallback_llm()
+    return book_hotel_chain(llm) if llm else None
+
+
+@lazy_singleton("book_tour_fallback")
+def get_book_tour_fallback() -> Optional[Runnable]:
+    llm = get_fallback_llm()
+    return book_tour_chain(llm) if llm else None
+
+
+@lazy_singleton("book_shuttle_fallback")
+def get_book_shuttle_fallback() -> Optional[Runnable]:
+    llm = get_fallback_llm()
+    return book_shuttle_chain(llm) if llm else None
+
+
+@lazy_singleton("assistant_fallback")
+def get_assistant_fallback() -> Optional[Runnable]:
+    llm = get_fallback_llm()
+    return assistant_chain(llm) if llm else None
 
 
 # ============================================================================
@@ -317,4 +531,6 @@ def create_entry_node(assistant_name: str, new_dialog_state: str) -> Callable:
 
 
 # Memory extractor
-extractor = prompt | llm.with_structured_output(MemoryAnalysis)
+@lazy_singleton("extractor")
+def get_extractor() -> Runnable:
+    return prompt | get_llm().with_structured_output(MemoryAnalysis)
@@ -0,0 +1,149 @@
+import threading
+from dataclasses import dataclass
+from typing import Collection, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Labeled requests for the nearest-neighbor vote. Each route is the tool the
+# primary assistant would call; PRIMARY examples are requests it must answer
+# itself, so that they pull similar messages away from the specialists.
+PRIMARY = "primary_assistant"
+
+# Routes the router may take itself: their transfer tools only carry the user's
+# request. ToBookAirportShuttle needs the airport, destination and pickup time
+# parsed from the message, so shuttle requests stay with the primary assistant;
+# their examples still keep them from being routed as flights.
+LOCAL_ROUTES = frozenset({"ToFlightBookingAssistant", "ToHotelBookingAssistant", "ToTourBookingAssistant"})
+
+INTENT_EXAMPLES: dict[str, list[str]] = {
+    "ToFlightBookingAssistant": [
+        "Tìm chuyến bay từ Hà Nội đến Sài Gòn",
+        "Tôi muốn đặt vé máy bay đi Đà Nẵng",
+        "Có chuyến bay nào từ HAN đến SGN ngày mai không?",
+        "Đặt vé máy bay khứ hồi đi Phú Quốc",
+        "Vé máy bay rẻ nhất đi Nha Trang tuần sau",
+        "Cho tôi xem các chuyến bay đến Đà Lạt",
+        "Book a flight from Hanoi to Ho Chi Minh City",
+        "Find me flights from SGN to DAD tomorrow",
+        "I need a plane ticket to Phu Quoc",
+        "What is the cheapest flight to Da Nang next week?",
+    ],
+    "ToHotelBookingAssistant": [
+        "Tìm khách sạn ở Đà Lạt",
+        "Tôi muốn đặt phòng khách sạn ở Hội An",
+        "Khách sạn giá rẻ gần biển Nha Trang",
+        "Đặt phòng cho 2 người ở Sa Pa từ ngày 10 đến ngày 12",
+        "Có khách sạn 5 sao nào ở Phú Quốc không?",
+        "Book a hotel room in Da Lat",
+        "Find me a cheap hotel near the beach in Nha Trang",
+        "I need accommodation in Hoi An for three nights",
+    ],
+    "ToTourBookingAssistant": [
+        "Có tour nào đi Phú Quốc không?",
+        "Tôi muốn đặt tour du lịch Hạ Long 2 ngày",
+        "Tour Sa Pa 3 ngày giá bao nhiêu?",
+        "Gợi ý tour trọn gói đi Đà Lạt",
+        "Danh sách tour khám phá Hội An",
+        "Are there any tours to Ha Long Bay?",
+        "Book a 3 day tour of Sa Pa",
+        "Show me package tours to Phu Quoc",
+    ],
+    "ToBookAirportShuttle": [
+        "Tôi cần xe từ sân bay Tân Sơn Nhất về Quận 1",
+        "Đặt xe đưa đón sân bay Nội Bài",
+        "Tôi cần xe từ SGN về Quận 1",
+        "Thuê xe 7 chỗ từ sân bay Đà Nẵng về khách sạn",
+        "Đặt xe đón tôi ở sân bay lúc 10 giờ sáng mai",
+        "Book an airport shuttle from SGN to District 1",
+        "I need a car from Noi Bai airport to Hoan Kiem",
+        "Airport pickup to my hotel tomorrow morning",
+    ],
+    PRIMARY: [
+        "Xin chào",
+        "Cảm ơn bạn",
+        "Thời tiết ở Đà Nẵng hôm nay thế nào?",
+        "Hà Nội có mưa không?",
+        "Gợi ý cho tôi vài điểm du lịch biển",
+        "Đà Lạt có gì đẹp?",
+        "Những địa điểm nổi tiếng ở Huế",
+        "Bạn có thể giúp gì cho tôi?",
+        "Tôi nên đi du lịch ở đâu vào mùa hè?",
+        "Hello, who are you?",
+        "What's the weather like in Hanoi?",
+        "Recommend some beautiful places to visit in Vietnam",
+        "What can you help me with?",
+        "Thanks, that's all",
+    ],
+}
+
+
+@dataclass(frozen=True)
+class IntentMatch:
+    """Route chosen for a message, with the evidence behind it."""
+
+    route: str
+    # Cosine similarity to the closest example of the route
+    similarity: float
+    # Share of the neighbors' similarity-weighted vote won by the route
+    confidence: float
+
+
+class IntentRouter:
+    """Nearest-neighbor intent classifier over labeled example requests.
+
+    A message is embedded and compared with every example. Its ``k`` most
+    similar examples vote for their route, each weighted by its similarity. The
+    message is routed only when the winner is one of ``routes``, its closest
+    example is at least ``min_similarity`` away and it won at least
+    ``min_confidence`` of the vote; anything else is left to the primary
+    assistant's LLM.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        examples: dict[str, list[str]] = INTENT_EXAMPLES,
+        k: int = 5,
+        min_similarity: float = 0.75,
+        min_confidence: float = 0.8,
+        routes: Collection[str] = LOCAL_ROUTES,
+    ):
+        self.embeddings = embeddings
+        self.routes = frozenset(routes)
+        self.k = k
+        self.min_similarity = min_similarity
+        self.min_confidence = min_confidence
+        self.stats = {"routed": 0, "deferred": 0}
+        self._labels = [route for route, texts in examples.items() for _ in texts]
+        vectors = np.asarray(
+            embeddings.embed_documents([text for texts in examples.values() for text in texts]), dtype=np.float32
+        )
+        self._vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        self._lock = threading.Lock()
+
+    def classify(self, embedding: Sequence[float]) -> Optional[IntentMatch]:
+        """Return the specialist route for a message embedding, or None to defer."""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+        similarities = self._vectors @ vector
+        neighbors = np.argsort(-similarities)[:self.k]
+        votes: dict[str, float] = {}
+        for index in neighbors:
+            votes[self._labels[index]] = votes.get(self._labels[index], 0.0) + max(float(similarities[index]), 0.0)
+        route = max(votes, key=votes.get)
+        total = sum(votes.values())
+        confidence = votes[route] / total if total else 0.0
+        similarity = max(float(similarities[index]) for index in neighbors if self._labels[index] == route)
+        match = None
+        if route in self.routes and similarity >= self.min_similarity and confidence >= self.min_confidence:
+            match = IntentMatch(route, similarity, confidence)
+        with self._lock:
+            self.stats["routed" if match else "deferred"] += 1
+        return match
+
+    async def aroute(self, text: str) -> Optional[IntentMatch]:
+        """Embed ``text`` and classify it."""
+        return self.classify(await self.embeddings.aembed_query(text))
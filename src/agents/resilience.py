@@ -0,0 +1,138 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from langchain_core.callbacks import AsyncCallbackHandler, BaseCallbackManager
+from langchain_core.runnables import Runnable, RunnableConfig, ensure_config
+from langgraph.constants import TAG_NOSTREAM
+
+
+@dataclass(frozen=True)
+class CallPolicy:
+    """Limits on the LLM calls made for one assistant turn."""
+
+    # Seconds one LLM request may take before it is abandoned.
+    attempt_timeout: float = 30.0
+    # Seconds the whole turn may take, retries included, before falling back.
+    deadline: float = 60.0
+    max_attempts: int = 3
+    # Exponential backoff with full jitter between attempts.
+    backoff_base: float = 0.5
+    backoff_max: float = 4.0
+    # Send a second request when the first is slower than this percentile of
+    # recent latencies, once ``hedge_min_samples`` latencies are known.
+    hedge: bool = True
+    hedge_percentile: float = 95.0
+    hedge_min_samples: int = 20
+    hedge_min_delay: float = 1.0
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+class LatencyWindow:
+    """Latencies of the most recent successful calls."""
+
+    def __init__(self, size: int = 200):
+        self._samples: deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percentile: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < max(min_samples, 1):
+            return None
+        index = min(int(len(samples) * percentile / 100), len(samples) - 1)
+        return samples[index]
+
+
+class TokenWatch(AsyncCallbackHandler):
+    """Notes whether a request has streamed any text to the user."""
+
+    def __init__(self):
+        self.streamed = asyncio.Event()
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        if token:
+            self.streamed.set()
+
+    def attach(self, config: RunnableConfig) -> RunnableConfig:
+        """Copy of ``config`` whose callbacks also report to this watch."""
+        callbacks = config.get("callbacks")
+        if isinstance(callbacks, BaseCallbackManager):
+            callbacks = callbacks.copy()
+            callbacks.add_handler(self, inherit=True)
+        else:
+            callbacks = [*(callbacks or []), self]
+        return {**config, "callbacks": callbacks}
+
+
+async def _timed(runnable: Runnable, input: Any, config: Optional[dict]) -> tuple[Any, float]:
+    start = time.perf_counter()
+    result = await runnable.ainvoke(input, config=config)
+    return result, time.perf_counter() - start
+
+
+async def hedged_invoke(
+    runnable: Runnable, input: Any, hedge_delay: Optional[float], watch: Optional[TokenWatch] = None
+) -> tuple[Any, float, Optional[str]]:
+    """Invoke ``runnable``, sending a second identical request if the first is slow.
+
+    The second request starts after ``hedge_delay`` seconds (never when None)
+    and the first successful response wins; the other request is cancelled. It
+    is tagged ``nostream`` so its tokens are not streamed to the user on top of
+    the first request's; if it wins, its message is emitted when the node ends.
+    Once the first request streams text, the user is already reading its reply:
+    the hedge is cancelled, or never sent, and the first request must finish.
+    ``watch`` records whether that happened.
+
+    Returns:
+        tuple: The result, its latency in seconds, and ``None`` if no hedge was
+        sent, else ``"won"`` or ``"lost"``.
+    """
+    config = ensure_config()
+    watch = watch or TokenWatch()
+    primary = asyncio.ensure_future(_timed(runnable, input, watch.attach(config)))
+    streamed = asyncio.ensure_future(watch.streamed.wait())
+    tasks = [primary]
+    try:
+        if hedge_delay is None:
+            result, latency = await primary
+            return result, latency, None
+        done, _ = await asyncio.wait([primary, streamed], timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            hedge_config = {**config, "tags": [*config.get("tags", []), TAG_NOSTREAM]}
+            tasks.append(asyncio.ensure_future(_timed(runnable, input, hedge_config)))
+        pending = set(tasks)
+        while True:
+            done, pending = await asyncio.wait(
+                pending if streamed.done() else pending | {streamed}, return_when=asyncio.FIRST_COMPLETED
+            )
+            pending.discard(streamed)
+            if streamed.done() and len(tasks) > 1:
+                # The user is reading the first request's reply; the hedge's would follow it.
+                for task in pending - {primary}:
+                    task.cancel()
+                result, latency = await primary
+                return result, latency, "lost"
+            for task in done - {streamed}:
+                if task.exception() is None:
+                    result, latency = task.result()
+                    if len(tasks) == 1:
+                        return result, latency, None
+                    return result, latency, "lost" if task is primary else "won"
+                failed = task
+            if not pending:
+                raise failed.exception()
+    finally:
+        for task in [*tasks, streamed]:
+            if not task.done():
+                task.cancel()
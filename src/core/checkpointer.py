@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterator
+from typing import Any, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.memory import MemorySaver
+
+
+class BoundedMemorySaver(MemorySaver):
+    """In-memory checkpointer whose footprint stays bounded under long-running traffic.
+
+    - Only the latest ``max_checkpoints`` checkpoints of each thread (and
+      checkpoint namespace) are kept, with their pending writes; the graph only
+      ever resumes from the latest one.
+    - Threads not read or written for ``ttl_seconds`` are evicted.
+    - When the serialized checkpoints exceed ``max_bytes`` in total, the least
+      recently used threads are evicted until they fit again. The thread being
+      written is never evicted, so a single very large thread may exceed the cap.
+
+    ``stats`` reports the number of threads and bytes held, and eviction counts.
+    """
+
+    def __init__(
+        self,
+        max_checkpoints: int = 5,
+        ttl_seconds: Optional[float] = 3600,
+        max_bytes: Optional[int] = 256 * 1024 * 1024,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self.max_checkpoints = max(max_checkpoints, 1)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        # thread_id -> last access time, least recently used first
+        self._last_access: OrderedDict[str, float] = OrderedDict()
+        self._thread_bytes: dict[str, int] = {}
+        self._counters = {"pruned_checkpoints": 0, "expired_threads": 0, "evicted_threads": 0}
+        self._lock = threading.RLock()
+
+    @property
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"threads": len(self._last_access), "bytes": self.bytes_held, **self._counters}
+
+    @property
+    def bytes_held(self) -> int:
+        return sum(self._thread_bytes.values())
+
+    def _checkpoint_size(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> int:
+        size = 0
+        if saved := self.storage[thread_id][checkpoint_ns].get(checkpoint_id):
+            checkpoint, metadata, _ = saved
+            size += len(checkpoint[1]) + len(metadata[1])
+        return size + self._writes_size((thread_id, checkpoint_ns, checkpoint_id))
+
+    def _writes_size(self, key: tuple[str, str, str]) -> int:
+        return sum(len(value[1]) for _, _, value, _ in self.writes.get(key, {}).values())
+
+    def _touch(self, thread_id: str) -> None:
+        if thread_id in self._last_access:
+            self._last_access[thread_id] = time.monotonic()
+            self._last_access.move_to_end(thread_id)
+
+    def _drop_thread(self, thread_id: str) -> None:
+        for checkpoint_ns, checkpoints in self.storage.pop(thread_id, {}).items():
+            for checkpoint_id in checkpoints:
+                self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+        self._last_access.pop(thread_id, None)
+        self._thread_bytes.pop(thread_id, None)
+
+    def _prune(self, thread_id: str, checkpoint_ns: str) -> None:
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        # Checkpoint ids are time-ordered, so the smallest ones are the oldest.
+        for checkpoint_id in sorted(checkpoints)[:-self.max_checkpoints]:
+            self._thread_bytes[thread_id] -= self._checkpoint_size(thread_id, checkpoint_ns, checkpoint_id)
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            self._counters["pruned_checkpoints"] += 1
+
+    def _evict(self, current: str) -> None:
+        if self.ttl_seconds is not None:
+            deadline = time.monotonic() - self.ttl_seconds
+            while self._last_access:
+                thread_id, last_access = next(iter(self._last_access.items()))
+                if last_access > deadline or thread_id == current:
+                    break
+                self._drop_thread(thread_id)
+                self._counters["expired_threads"] += 1
+        if self.max_bytes is not None:
+            for thread_id in list(self._last_access):
+                if self.bytes_held <= self.max_bytes:
+                    break
+                if thread_id != current:
+                    self._drop_thread(thread_id)
+                    self._counters["evicted_threads"] += 1
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            result = super().get_tuple(config)
+            if thread_id in self._last_access:
+                self._touch(thread_id)
+            elif not any(self.storage.get(thread_id, {}).values()):
+                # Reading an unknown thread leaves empty defaultdict entries behind.
+                self.storage.pop(thread_id, None)
+            return result
+
+    def list(self, config: Optional[RunnableConfig], **kwargs: Any) -> Iterator[CheckpointTuple]:
+        with self._lock:
+            if config:
+                self._touch(config["configurable"]["thread_id"])
+            # Materialized under the lock so eviction cannot change storage mid-iteration.
+            items = list(super().list(config, **kwargs))
+        yield from items
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self._lock:
+            # A checkpoint saved again under the same id replaces the earlier copy.
+            replaced = self._checkpoint_size(thread_id, checkpoint_ns, checkpoint["id"])
+            saved = super().put(config, checkpoint, metadata, new_versions)
+            self._last_access.setdefault(thread_id, 0.0)
+            self._touch(thread_id)
+            size = self._checkpoint_size(thread_id, checkpoint_ns, checkpoint["id"])
+            self._thread_bytes[thread_id] = self._thread_bytes.get(thread_id, 0) + size - replaced
+            self._prune(thread_id, checkpoint_ns)
+            self._evict(thread_id)
+            return saved
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        key = (thread_id, configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"])
+        with self._lock:
+            before = self._writes_size(key)
+            super().put_writes(config, writes, task_id, task_path)
+            if thread_id in self._thread_bytes:
+                self._thread_bytes[thread_id] += self._writes_size(key) - before
+                self._touch(thread_id)
+            else:
+                # The thread was evicted while a step was still running.
+                self.writes.pop(key, None)
@@ -0,0 +1,151 @@
+import json
+from typing import Sequence
+
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, SystemMessage, ToolMessage
+
+# Rough characters per token for mixed Vietnamese and English text.
+CHARS_PER_TOKEN = 4
+# Fixed cost of a message's role and framing.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(message: AnyMessage) -> int:
+    """Approximate prompt tokens of a message, without calling a tokenizer."""
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content, ensure_ascii=False)
+    chars = len(content)
+    if isinstance(message, AIMessage):
+        chars += sum(len(call["name"]) + len(json.dumps(call["args"], ensure_ascii=False)) for call in message.tool_calls)
+    return chars // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+def _text(message: AnyMessage) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return " ".join(part.get("text", "") for part in message.content if isinstance(part, dict))
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit].rstrip() + "…"
+
+
+def compact_tool_result(content: str, max_chars: int) -> str:
+    """Shorten a tool result to a reference that still carries the ids the user may pick from."""
+    if len(content) <= max_chars:
+        return content
+    try:
+        result = json.loads(content)
+    except ValueError:
+        result = None
+    if isinstance(result, dict) and isinstance(result.get("results"), list):
+        ids = [item.get("id") for item in result["results"] if isinstance(item, dict)]
+        reference = json.dumps({"ids": ids, "summary": result.get("summary")}, ensure_ascii=False)
+        if len(reference) <= max_chars:
+            return f"[Earlier search result, details omitted] {reference}"
+    return f"[Earlier tool result, {len(content) - max_chars} characters omitted] {content[:max_chars]}"
+
+
+def _turns(messages: Sequence[AnyMessage]) -> list[list[AnyMessage]]:
+    """Split the history at each user message.
+
+    Tool calls and their results always fall in the same turn, so dropping whole
+    turns never leaves a tool call without its result or the other way round.
+    """
+    turns: list[list[AnyMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def _summarize(turns: Sequence[Sequence[AnyMessage]], max_chars: int, max_turns: int) -> SystemMessage:
+    """Extractive summary of dropped turns: each user request and the final reply to it."""
+    lines = []
+    if len(turns) > max_turns:
+        lines.append(f"- ({len(turns) - max_turns} earlier turns omitted)")
+    for turn in turns[-max_turns:]:
+        request = next((_text(message) for message in turn if isinstance(message, HumanMessage)), "")
+        reply = next(
+            (_text(message) for message in reversed(turn) if isinstance(message, AIMessage) and _text(message)),
+            "",
+        )
+        if request:
+            lines.append(f"- User: {_clip(request, max_chars)}")
+        if reply:
+            lines.append(f"  Assistant: {_clip(reply, max_chars)}")
+    return SystemMessage(content="Summary of the earlier conversation:\n" + "\n".join(lines))
+
+
+class ContextWindow:
+    """Fits the conversation history sent to the LLM into a token budget.
+
+    The full history stays in the graph state. A history within ``max_tokens``
+    is sent unchanged; otherwise only the prompt is trimmed:
+
+    1. Tool results of turns older than the latest ``keep_turns`` are replaced,
+       oldest first, with compact references (ids and summary of search
+       results) until the history fits.
+    2. If it still does not fit, the oldest turns are dropped and replaced
+       with a short extractive summary of the last ``summary_turns`` of them.
+
+    The latest ``keep_turns`` turns are always sent in full, so the results the
+    user is picking from keep their times, prices and names.
+
+    Token counts are estimated from message length. ``stats`` accumulates the
+    estimated tokens before and after fitting.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 6000,
+        keep_turns: int = 2,
+        tool_result_chars: int = 400,
+        summary_chars: int = 160,
+        summary_turns: int = 10,
+    ):
+        self.max_tokens = max_tokens
+        self.keep_turns = max(keep_turns, 1)
+        self.tool_result_chars = tool_result_chars
+        self.summary_chars = summary_chars
+        self.summary_turns = summary_turns
+        self.stats = {"calls": 0, "tokens_in": 0, "tokens_out": 0, "summarized_turns": 0}
+
+    def _compact(self, turn: list[AnyMessage]) -> list[AnyMessage]:
+        compacted = []
+        for message in turn:
+            if isinstance(message, ToolMessage) and isinstance(message.content, str):
+                content = compact_tool_result(message.content, self.tool_result_chars)
+                if content != message.content:
+                    message = message.model_copy(update={"content": content})
+            compacted.append(message)
+        return compacted
+
+    def fit(self, messages: Sequence[AnyMessage]) -> list[AnyMessage]:
+        """Return the messages to send, within ``max_tokens`` where possible."""
+        turns = _turns(messages)
+        sizes = [sum(estimate_tokens(message) for message in turn) for turn in turns]
+        total = sum(sizes)
+        older = max(len(turns) - self.keep_turns, 0)
+        for index in range(older):
+            if total <= self.max_tokens:
+                break
+            turns[index] = self._compact(turns[index])
+            size = sum(estimate_tokens(message) for message in turns[index])
+            total -= sizes[index] - size
+            sizes[index] = size
+
+        dropped = 0
+        while total > self.max_tokens and len(turns) - dropped > self.keep_turns:
+            total -= sizes[dropped]
+            dropped += 1
+
+        fitted = [message for turn in turns[dropped:] for message in turn]
+        if dropped:
+            fitted.insert(0, _summarize(turns[:dropped], self.summary_chars, self.summary_turns))
+            self.stats["summarized_turns"] += dropped
+
+        self.stats["calls"] += 1
+        self.stats["tokens_in"] += sum(estimate_tokens(message) for message in messages)
+        self.stats["tokens_out"] += sum(estimate_tokens(message) for message in fitted)
+        return fitted
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MemoryJob:
+    """A user message waiting to be analyzed for memories."""
+
+    user_id: Optional[str]
+    message: str
+    recall_memories: list[str]
+    done: asyncio.Future = field(default=None, repr=False)
+
+
+class MemoryExtractionQueue:
+    """Runs memory extraction in the background so it never gates a reply.
+
+    Jobs are processed by at most ``max_workers`` concurrent workers. When
+    ``max_pending`` jobs are already waiting, new jobs are dropped rather than
+    growing the backlog without bound. ``flush`` waits for the pending jobs of a
+    user, e.g. when their chat session ends.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[MemoryJob], Awaitable[None]],
+        max_workers: int = 2,
+        max_pending: int = 256,
+    ):
+        self.handler = handler
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "dropped": 0}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+        self._pending: dict[Optional[str], set[asyncio.Future]] = {}
+
+    def _ensure_workers(self) -> None:
+        # Created on first use so the queue and workers belong to the running loop.
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        while len(self._workers) < self.max_workers:
+            self._workers.append(asyncio.create_task(self._work()))
+
+    def submit(self, user_id: Optional[str], message: str, recall_memories: list[str]) -> bool:
+        """Queue a message for extraction. Returns False if the job was dropped."""
+        self._ensure_workers()
+        job = MemoryJob(user_id, message, recall_memories, asyncio.get_running_loop().create_future())
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return False
+        self.stats["submitted"] += 1
+        pending = self._pending.setdefault(user_id, set())
+        pending.add(job.done)
+        job.done.add_done_callback(lambda _: self._forget(user_id, job.done))
+        return True
+
+    def _forget(self, user_id: Optional[str], done: asyncio.Future) -> None:
+        pending = self._pending.get(user_id)
+        if pending is not None:
+            pending.discard(done)
+            if not pending:
+                del self._pending[user_id]
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            start = time.perf_counter()
+            try:
+                await self.handler(job)
+                self.stats["completed"] += 1
+            except Exception:
+                self.stats["failed"] += 1
+                logger.exception("Memory extraction failed for user %s", job.user_id)
+            finally:
+                metrics.observe("memory_job_duration_seconds", time.perf_counter() - start)
+                if not job.done.done():
+                    job.done.set_result(None)
+                self._queue.task_done()
+
+    async def flush(self, user_id: Optional[str], timeout: Optional[float] = None) -> None:
+        """Wait for the pending jobs of one user."""
+        futures = list(self._pending.get(user_id, ()))
+        if futures:
+            await asyncio.wait(futures, timeout=timeout)
+
+    async def flush_all(self, timeout: Optional[float] = None) -> None:
+        """Wait for the pending jobs of every user."""
+        futures = [done for pending in self._pending.values() for done in pending]
+        if futures:
+            await asyncio.wait(futures, timeout=timeout)
+
+    def pending(self) -> int:
+        """Number of jobs queued or in progress."""
+        return sum(len(pending) for pending in self._pending.values())
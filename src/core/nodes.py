@@ -1,10 +1,9 @@
-import uuid
+import os
 from typing import Literal, Optional
+from uuid import uuid4
 
-from langchain_core.documents import Document
-from langchain_core.messages import HumanMessage, ToolMessage
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 from langchain_core.runnables import RunnableConfig
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import END, START, StateGraph
 from langgraph.prebuilt import ToolNode, tools_condition
 
@@ -15,21 +14,30 @@ from src.agents.agents import (
     ToFlightBookingAssistant,
     ToHotelBookingAssistant,
     ToTourBookingAssistant,
-    assistant_runnable,
-    book_flight_runnable,
-    book_hotel_runnable,
-    book_shuttle_runnable,
-    book_tour_runnable,
     create_entry_node,
-    extractor,
-    weather_tool,
+    get_assistant_fallback,
+    get_assistant_runnable,
+    get_book_flight_fallback,
+    get_book_flight_runnable,
+    get_book_hotel_fallback,
+    get_book_hotel_runnable,
+    get_book_shuttle_fallback,
+    get_book_shuttle_runnable,
+    get_book_tour_fallback,
+    get_book_tour_runnable,
+    get_extractor,
+    get_weather_tool,
 )
+from src.agents.intent import IntentRouter
+from src.core.checkpointer import BoundedMemorySaver
+from src.core.memory_worker import MemoryExtractionQueue, MemoryJob
 from src.core.state import State
-from src.database.db import vector_store
+from src.database.db import get_embeddings, get_memory_store, get_vector_store
 from src.tools.tools import (
     book_flight,
     book_hotel,
     book_shuttle,
+    get_db,
     get_popular_tourist_destinations,
     lookup_available_tours,
     search_flights,
@@ -37,14 +45,76 @@ from src.tools.tools import (
     search_recall_memories,
     search_shuttles,
 )
+from src.utils.instrumentation import instrumentation
+from src.utils.memory_gate import MemoryGate
+from src.utils.metrics import metrics
+from src.utils.startup import StartupReport, lazy_singleton, resolve, startup_report
 
 
 # ============================================================================
 # MEMORY FUNCTIONS
 # ============================================================================
 
-def load_memories(state: State, config: RunnableConfig) -> State:
-    """Load memories for the current conversation.
+# Skip the extractor LLM call for messages that cannot hold a memory
+MEMORY_GATE_ENABLED = os.getenv("MEMORY_GATE", "true").lower() == "true"
+
+
+@lazy_singleton("memory_gate")
+def get_memory_gate() -> MemoryGate:
+    """Heuristic and nearest-neighbor pre-filter in front of the memory extractor."""
+    return MemoryGate(
+        get_embeddings(),
+        min_words=int(os.getenv("MEMORY_GATE_MIN_WORDS", "3")),
+        min_confidence=float(os.getenv("MEMORY_GATE_MIN_CONFIDENCE", "0.75")),
+    )
+
+
+metrics.register_gauge(
+    "memory_gate",
+    lambda: {**get_memory_gate().stats, "skip_rate": get_memory_gate().skip_rate()}
+    if get_memory_gate.is_initialized() else {},
+)
+
+
+async def extract_memories(job: MemoryJob) -> None:
+    """Analyze a user message with the LLM and store it if it is worth remembering.
+
+    Runs on the background ``memory_queue`` rather than as a graph node, so the
+    extra LLM round trip never delays the assistant's reply. Messages the
+    memory gate rules out never reach the LLM.
+
+    Args:
+        job (MemoryJob): The user, message and memories recalled for it.
+    """
+    if MEMORY_GATE_ENABLED and not (await (await resolve(get_memory_gate)).acheck(job.message)).extract:
+        return
+
+    recall_str = (
+        "<recall_memory>\n" + "\n".join(job.recall_memories) + "\n</recall_memory>"
+    )
+    
+    analysis = await (await resolve(get_extractor)).ainvoke(
+        {
+            "messages": [HumanMessage(job.message)],
+            "recall_memories": recall_str,
+        },
+        {"callbacks": [instrumentation], "metadata": {"caller": "extract_memories"}},
+    )
+    
+    if analysis.is_important and analysis.formatted_memory:
+        await (await resolve(get_memory_store)).aadd_memory(job.user_id, analysis.formatted_memory)
+
+
+memory_queue = MemoryExtractionQueue(
+    extract_memories,
+    max_workers=int(os.getenv("MEMORY_WORKERS", "2")),
+    max_pending=int(os.getenv("MEMORY_QUEUE_SIZE", "256")),
+)
+metrics.register_gauge("memory_queue", lambda: {**memory_queue.stats, "pending": memory_queue.pending()})
+
+
+async def load_memories(state: State, config: RunnableConfig) -> State:
+    """Load memories for the current conversation and queue the message for extraction.
 
     Args:
         state (State): The current state of the conversation.
@@ -53,44 +123,68 @@ def load_memories(state: State, config: RunnableConfig) -> State:
     Returns:
         State: The updated state with loaded memories.
     """
-    recall_memories = search_recall_memories.invoke(state["messages"][-1].content, config)
+    message = state["messages"][-1].content
+    recall_memories = await search_recall_memories.ainvoke(message, config)
+    configuration = config.get("configurable", {})
+    memory_queue.submit(configuration.get("user_id", None), message, recall_memories)
     return {
         "recall_memories": recall_memories,
     }
 
 
-def extract_memories(state: State, config: RunnableConfig):
-    """Process the current state and generate a response using the LLM.
+# ============================================================================
+# INTENT ROUTING
+# ============================================================================
+
+# Send clear booking requests straight to their specialist, skipping the
+# primary assistant's LLM call
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER", "true").lower() == "true"
+
+
+@lazy_singleton("intent_router")
+def get_intent_router() -> IntentRouter:
+    """Nearest-neighbor intent classifier over the labeled example requests."""
+    return IntentRouter(
+        get_embeddings(),
+        min_similarity=float(os.getenv("INTENT_MIN_SIMILARITY", "0.75")),
+        min_confidence=float(os.getenv("INTENT_MIN_CONFIDENCE", "0.8")),
+    )
+
+
+metrics.register_gauge("intent_router", lambda: get_intent_router().stats if get_intent_router.is_initialized() else {})
+
+
+async def intent_router(state: State) -> dict:
+    """Hand a clear booking request to its specialist without asking the primary assistant.
+
+    On a confident match, adds the transfer tool call the primary assistant would
+    have made, so the entry node and the specialist see the same conversation
+    either way. Otherwise the state is left for the primary assistant.
 
     Args:
         state (State): The current state of the conversation.
-        config (RunnableConfig): The runtime configuration for the agent.
 
     Returns:
-        dict: Empty dict after processing memories.
+        dict: The transfer tool call, or no update.
     """
-    recall_str = (
-        "<recall_memory>\n" + "\n".join(state["recall_memories"]) + "\n</recall_memory>"
-    )
-    
-    analysis = extractor.invoke(
-        {
-            "messages": [HumanMessage(state['messages'][-1].content)],
-            "recall_memories": recall_str,
-        }
-    )
-    
-    if analysis.is_important and analysis.formatted_memory:
-        configuration = config.get("configurable", {})
-        user_id = configuration.get("user_id", None)
-        
-        document = Document(
-            page_content=analysis.formatted_memory,
-            id=str(uuid.uuid4()),
-            metadata={"user_id": user_id}
-        )
-        vector_store.add_documents([document])
-    return {}
+    message = state["messages"][-1]
+    if not INTENT_ROUTER_ENABLED or not isinstance(message, HumanMessage) or not isinstance(message.content, str):
+        return {}
+    # Resolved off the loop: the first call embeds the example requests.
+    router = await resolve(get_intent_router)
+    match = await router.aroute(message.content)
+    if match is None:
+        return {}
+    metrics.inc("intent_routes_total", route=match.route)
+    # The router only takes routes whose transfer tool carries just the request (LOCAL_ROUTES).
+    return {
+        "messages": [
+            AIMessage(
+                content="",
+                tool_calls=[{"name": match.route, "args": {"request": message.content}, "id": f"intent_{uuid4().hex}"}],
+            )
+        ]
+    }
 
 
 # ============================================================================
@@ -164,13 +258,21 @@ def route_primary_assistant(state: State):
     raise ValueError("Invalid route")
 
 
+def route_intent(state: State):
+    """Route a request matched by the intent router to its specialist's entry node."""
+    message = state["messages"][-1]
+    if isinstance(message, AIMessage) and message.tool_calls:
+        return route_primary_assistant(state)
+    return "primary_assistant"
+
+
 def route_to_workflow(
     state: State,
-) -> Literal["primary_assistant", "book_flight", "book_shuttle", "book_tour", "book_hotel"]:
+) -> Literal["intent_router", "book_flight", "book_shuttle", "book_tour", "book_hotel"]:
     """If we are in a delegated state, route directly to the appropriate assistant."""
     dialog_state = state.get("dialog_state")
     if not dialog_state:
-        return "primary_assistant"
+        return "intent_router"
     return dialog_state[-1]
 
 
@@ -194,65 +296,105 @@ def pop_dialog_state(state: State) -> dict:
 # GRAPH CONSTRUCTION
 # ============================================================================
 
-graph_builder = StateGraph(State)
-
-# Memory nodes
-graph_builder.add_node("load_memories", load_memories)
-graph_builder.add_node("extract_memories", extract_memories)
-graph_builder.add_edge(START, "load_memories")
-graph_builder.add_edge("load_memories", "extract_memories")
-
-# Primary assistant
-graph_builder.add_node("primary_assistant", Assistant(assistant_runnable))
-graph_builder.add_node("primary_assistant_tools", ToolNode([get_popular_tourist_destinations] + weather_tool))
-graph_builder.add_edge("primary_assistant_tools", "primary_assistant")
-
-# Shared exit node
-graph_builder.add_node("leave_skill", pop_dialog_state)
-graph_builder.add_edge("leave_skill", "primary_assistant")
-
-# Flight booking assistant
-graph_builder.add_node("enter_book_flight", create_entry_node("Flight Searching & Booking Assistant", "book_flight"))
-graph_builder.add_node("book_flight", Assistant(book_flight_runnable))
-graph_builder.add_node("book_flight_tools", ToolNode([search_flights, book_flight]))
-graph_builder.add_edge("enter_book_flight", "book_flight")
-graph_builder.add_edge("book_flight_tools", "book_flight")
-graph_builder.add_conditional_edges("book_flight", route_book_flight, ["book_flight_tools", "leave_skill", END])
-
-# Hotel booking assistant
-graph_builder.add_node("enter_book_hotel", create_entry_node("Hotel Booking Assistant", "book_hotel"))
-graph_builder.add_node("book_hotel", Assistant(book_hotel_runnable))
-graph_builder.add_node("book_hotel_tools", ToolNode([search_hotels, book_hotel]))
-graph_builder.add_edge("enter_book_hotel", "book_hotel")
-graph_builder.add_edge("book_hotel_tools", "book_hotel")
-graph_builder.add_conditional_edges("book_hotel", route_book_hotel, ["leave_skill", "book_hotel_tools", END])
-
-# Tour booking assistant
-graph_builder.add_node("enter_book_tour", create_entry_node("Tour Searching Assistant", "book_tour"))
-graph_builder.add_node("book_tour", Assistant(book_tour_runnable))
-graph_builder.add_node("book_tour_tools", ToolNode([lookup_available_tours]))
-graph_builder.add_edge("enter_book_tour", "book_tour")
-graph_builder.add_edge("book_tour_tools", "book_tour")
-graph_builder.add_conditional_edges("book_tour", route_book_tour, ["book_tour_tools", "leave_skill", END])
-
-# Shuttle booking assistant
-graph_builder.add_node("enter_book_shuttle", create_entry_node("Shuttle Assistant", "book_shuttle"))
-graph_builder.add_node("book_shuttle", Assistant(book_shuttle_runnable))
-graph_builder.add_node("book_shuttle_tools", ToolNode([search_shuttles, book_shuttle]))
-graph_builder.add_edge("enter_book_shuttle", "book_shuttle")
-graph_builder.add_edge("book_shuttle_tools", "book_shuttle")
-graph_builder.add_conditional_edges("book_shuttle", route_book_shuttle, ["book_shuttle_tools", "leave_skill", END])
-
-# Primary assistant routing
-graph_builder.add_conditional_edges(
-    "primary_assistant",
-    route_primary_assistant,
-    ["enter_book_flight", "enter_book_shuttle", "primary_assistant_tools", "enter_book_tour", "enter_book_hotel", END],
+# Conversation state per Chainlit session, bounded so idle sessions do not pile up
+checkpointer = BoundedMemorySaver(
+    max_checkpoints=int(os.getenv("CHECKPOINT_KEEP_LAST", "5")),
+    ttl_seconds=float(os.getenv("CHECKPOINT_TTL_SECONDS", "3600")),
+    max_bytes=int(float(os.getenv("CHECKPOINT_MAX_MB", "256")) * 1024 * 1024),
 )
+metrics.register_gauge("checkpointer", lambda: checkpointer.stats)
+
+@lazy_singleton("graph")
+def get_graph():
+    """Build and compile the multi-agent graph on first use."""
+    graph_builder = StateGraph(State)
+
+    # Memory node; extraction runs on memory_queue off the critical path
+    graph_builder.add_node("load_memories", load_memories)
+    graph_builder.add_edge(START, "load_memories")
+
+    # Local intent routing ahead of the primary assistant
+    graph_builder.add_node("intent_router", intent_router)
+    graph_builder.add_conditional_edges(
+        "intent_router",
+        route_intent,
+        ["primary_assistant", "enter_book_flight", "enter_book_hotel", "enter_book_tour", "enter_book_shuttle"],
+    )
 
-# Route from memory extraction to appropriate workflow
-graph_builder.add_conditional_edges("extract_memories", route_to_workflow)
+    # Primary assistant
+    graph_builder.add_node("primary_assistant", Assistant(get_assistant_runnable, get_assistant_fallback))
+    graph_builder.add_node("primary_assistant_tools", ToolNode([get_popular_tourist_destinations] + get_weather_tool()))
+    graph_builder.add_edge("primary_assistant_tools", "primary_assistant")
+
+    # Shared exit node
+    graph_builder.add_node("leave_skill", pop_dialog_state)
+    graph_builder.add_edge("leave_skill", "primary_assistant")
+
+    # Flight booking assistant
+    graph_builder.add_node("enter_book_flight", create_entry_node("Flight Searching & Booking Assistant", "book_flight"))
+    graph_builder.add_node("book_flight", Assistant(get_book_flight_runnable, get_book_flight_fallback))
+    graph_builder.add_node("book_flight_tools", ToolNode([search_flights, book_flight]))
+    graph_builder.add_edge("enter_book_flight", "book_flight")
+    graph_builder.add_edge("book_flight_tools", "book_flight")
+    graph_builder.add_conditional_edges("book_flight", route_book_flight, ["book_flight_tools", "leave_skill", END])
+
+    # Hotel booking assistant
+    graph_builder.add_node("enter_book_hotel", create_entry_node("Hotel Booking Assistant", "book_hotel"))
+    graph_builder.add_node("book_hotel", Assistant(get_book_hotel_runnable, get_book_hotel_fallback))
+    graph_builder.add_node("book_hotel_tools", ToolNode([search_hotels, book_hotel]))
+    graph_builder.add_edge("enter_book_hotel", "book_hotel")
+    graph_builder.add_edge("book_hotel_tools", "book_hotel")
+    graph_builder.add_conditional_edges("book_hotel", route_book_hotel, ["leave_skill", "book_hotel_tools", END])
+
+    # Tour booking assistant
+    graph_builder.add_node("enter_book_tour", create_entry_node("Tour Searching Assistant", "book_tour"))
+    graph_builder.add_node("book_tour", Assistant(get_book_tour_runnable, get_book_tour_fallback))
+    graph_builder.add_node("book_tour_tools", ToolNode([lookup_available_tours]))
+    graph_builder.add_edge("enter_book_tour", "book_tour")
+    graph_builder.add_edge("book_tour_tools", "book_tour")
+    graph_builder.add_conditional_edges("book_tour", route_book_tour, ["book_tour_tools", "leave_skill", END])
+
+    # Shuttle booking assistant
+    graph_builder.add_node("enter_book_shuttle", create_entry_node("Shuttle Assistant", "book_shuttle"))
+    graph_builder.add_node("book_shuttle", Assistant(get_book_shuttle_runnable, get_book_shuttle_fallback))
+    graph_builder.add_node("book_shuttle_tools", ToolNode([search_shuttles, book_shuttle]))
+    graph_builder.add_edge("enter_book_shuttle", "book_shuttle")
+    graph_builder.add_edge("book_shuttle_tools", "book_shuttle")
+    graph_builder.add_conditional_edges("book_shuttle", route_book_shuttle, ["book_shuttle_tools", "leave_skill", END])
+
+    # Primary assistant routing
+    graph_builder.add_conditional_edges(
+        "primary_assistant",
+        route_primary_assistant,
+        ["enter_book_flight", "enter_book_shuttle", "primary_assistant_tools", "enter_book_tour", "enter_book_hotel", END],
+    )
 
-# Compile graph
-memory = MemorySaver()
-graph = graph_builder.compile(checkpointer=memory)
+    # Route from memory loading to appropriate workflow
+    graph_builder.add_conditional_edges("load_memories", route_to_workflow)
+
+    # Compile graph
+    return graph_builder.compile(checkpointer=checkpointer)
+
+
+
+def warm_up() -> StartupReport:
+    """Initialize every heavy resource ahead of the first request.
+
+    Returns:
+        StartupReport: Import and initialization time per component.
+    """
+    get_vector_store()
+    get_memory_store()
+    get_db()
+    get_assistant_runnable()
+    get_book_flight_runnable()
+    get_book_hotel_runnable()
+    get_book_tour_runnable()
+    get_book_shuttle_runnable()
+    get_extractor()
+    if MEMORY_GATE_ENABLED:
+        get_memory_gate()
+    if INTENT_ROUTER_ENABLED:
+        get_intent_router()
+    get_graph()
+    return startup_report
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+
+
+def _hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def split_corpus(file_path: str) -> list[str]:
+    """Parse the destination PDF and split it into one chunk per numbered destination."""
+    # Only needed when the index is stale, so keep it off the startup path.
+    from langchain_community.document_loaders import PyPDFLoader
+
+    docs = PyPDFLoader(file_path).load()
+    full_docs = "".join(doc.page_content for doc in docs)
+    return re.split(r"(?m)^(?=\d+\.\s)", full_docs)[1:]
+
+
+def _read_manifest(index_dir: Path) -> dict:
+    try:
+        with (index_dir / MANIFEST_FILE).open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_index(index_dir: Path, manifest: dict, vectors: np.ndarray) -> None:
+    """Write embeddings then manifest, each through a temp file so readers never see a partial index."""
+    index_dir.mkdir(parents=True, exist_ok=True)
+    tmp_vectors = index_dir / f"{EMBEDDINGS_FILE}.tmp"
+    with tmp_vectors.open("wb") as f:
+        np.save(f, vectors)
+    os.replace(tmp_vectors, index_dir / EMBEDDINGS_FILE)
+    tmp_manifest = index_dir / f"{MANIFEST_FILE}.tmp"
+    with tmp_manifest.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_manifest, index_dir / MANIFEST_FILE)
+
+
+def load_corpus_index(
+    file_path: str, embeddings: Embeddings, model_name: str, index_dir: str
+) -> tuple[list[dict], np.ndarray, str]:
+    """Load the destination corpus and its embeddings, recomputing only what changed.
+
+    Embeddings are stored in ``embeddings.npy`` (opened memory-mapped) and the
+    manifest maps each row to the SHA-256 of its chunk text. When the PDF hash
+    and model match the manifest, the PDF is not even parsed. Otherwise the PDF
+    is re-split and only chunks whose hash is not already indexed are embedded.
+
+    Args:
+        file_path (str): Path to the source PDF.
+        embeddings (Embeddings): Model used for chunks missing from the index.
+        model_name (str): Name of the embedding model, part of the cache key.
+        index_dir (str): Directory holding the manifest and embeddings array.
+
+    Returns:
+        tuple: ``(chunks, vectors, source_hash)`` where ``chunks`` is a list of
+        ``{"hash", "text"}`` dicts aligned with the rows of ``vectors``.
+    """
+    index_path = Path(index_dir)
+    source_hash = _hash_bytes(Path(file_path).read_bytes())
+    manifest = _read_manifest(index_path)
+    vectors_path = index_path / EMBEDDINGS_FILE
+
+    cached_rows = {}
+    cached_vectors = None
+    if manifest.get("model") == model_name and vectors_path.exists():
+        cached_vectors = np.load(vectors_path, mmap_mode="r")
+        if len(manifest["chunks"]) == len(cached_vectors):
+            if manifest.get("source_hash") == source_hash:
+                return manifest["chunks"], cached_vectors, source_hash
+            cached_rows = {chunk["hash"]: row for row, chunk in enumerate(manifest["chunks"])}
+
+    chunks = [{"hash": _hash_bytes(text.encode("utf-8")), "text": text} for text in split_corpus(file_path)]
+    missing = [chunk for chunk in chunks if chunk["hash"] not in cached_rows]
+    new_rows = {}
+    if missing:
+        new_vectors = embeddings.embed_documents([chunk["text"] for chunk in missing])
+        new_rows = {chunk["hash"]: np.asarray(vector, dtype=np.float32) for chunk, vector in zip(missing, new_vectors)}
+
+    vectors = np.stack([
+        new_rows[chunk["hash"]] if chunk["hash"] in new_rows else np.asarray(cached_vectors[cached_rows[chunk["hash"]]])
+        for chunk in chunks
+    ]).astype(np.float32)
+    # Release the old mapping before the file is replaced underneath it.
+    del cached_vectors
+
+    _write_index(index_path, {"model": model_name, "source_hash": source_hash, "chunks": chunks}, vectors)
+    return chunks, np.load(vectors_path, mmap_mode="r"), source_hash
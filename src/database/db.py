@@ -1,22 +1,110 @@
-import re
+import os
 
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_core.documents import Document
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
 from langchain_core.vectorstores import InMemoryVectorStore
-from langchain_huggingface import HuggingFaceEmbeddings
 
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2")
-vector_store = InMemoryVectorStore(embeddings)
+from src.database.corpus_index import load_corpus_index
+from src.database.embeddings import BatchedEmbeddings, CachedEmbeddings
+from src.database.memory_store import UserMemoryStore
+from src.database.semantic_cache import SemanticCache
+from src.utils.metrics import metrics
+from src.utils.startup import lazy_singleton, startup_report
+
+load_dotenv()
+
+EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
+INDEX_DIR = os.getenv("INDEX_DIR", ".cache/destination_index")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+DESTINATION_CACHE_THRESHOLD = float(os.getenv("DESTINATION_CACHE_THRESHOLD", "0.92"))
+DESTINATION_CACHE_SIZE = int(os.getenv("DESTINATION_CACHE_SIZE", "256"))
+MEMORY_DEDUP_THRESHOLD = float(os.getenv("MEMORY_DEDUP_THRESHOLD", "0.92"))
+MEMORY_CONSOLIDATE_THRESHOLD = float(os.getenv("MEMORY_CONSOLIDATE_THRESHOLD", "0.85"))
+MEMORY_CONSOLIDATE_EVERY = int(os.getenv("MEMORY_CONSOLIDATE_EVERY", "20"))
+MEMORY_MAX_PER_USER = int(os.getenv("MEMORY_MAX_PER_USER", "200"))
+MEMORY_HALF_LIFE_DAYS = float(os.getenv("MEMORY_HALF_LIFE_DAYS", "30"))
 
 file_path = "assets/tourist_destination.pdf"
-loader = PyPDFLoader(file_path)
 
-docs = loader.load()
-full_docs = ""
-for doc in docs:
-    full_docs = full_docs + doc.page_content
 
-all_splits = [Document(page_content=txt) for txt in re.split(r"(?m)^(?=\d+\.\s)", full_docs)]
-all_splits = all_splits[1:]
+@lazy_singleton("embeddings")
+def get_embeddings() -> Embeddings:
+    """Sentence-transformer shared by the destination corpus and recall memories.
+
+    Query embeddings are served from a shared LRU cache, and async calls from
+    every session are micro-batched into shared forward passes.
+    """
+    with startup_report.measure("embeddings", "import"):
+        from langchain_huggingface import HuggingFaceEmbeddings
+    batched = BatchedEmbeddings(
+        HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL),
+        max_batch_size=EMBEDDING_BATCH_SIZE,
+        max_wait_ms=EMBEDDING_BATCH_WAIT_MS,
+    )
+    return CachedEmbeddings(batched, max_entries=EMBEDDING_CACHE_SIZE)
+
+
+@lazy_singleton("destination_index")
+def get_destinations() -> tuple[InMemoryVectorStore, str]:
+    """Vector store over the tourist-destination corpus and the hash of the PDF it indexes."""
+    vector_store = InMemoryVectorStore(get_embeddings())
+    # Chunks are keyed by the hash of their content, so the vectors come straight
+    # from the memory-mapped index instead of being re-embedded on every start.
+    chunks, chunk_vectors, corpus_version = load_corpus_index(file_path, get_embeddings(), EMBEDDING_MODEL, INDEX_DIR)
+    for chunk, vector in zip(chunks, chunk_vectors):
+        vector_store.store[chunk["hash"]] = {
+            "id": chunk["hash"],
+            "vector": vector,
+            "text": chunk["text"],
+            "metadata": {},
+        }
+    return vector_store, corpus_version
+
+
+def get_vector_store() -> InMemoryVectorStore:
+    """Vector store over the tourist-destination corpus."""
+    return get_destinations()[0]
+
+
+def get_corpus_version() -> str:
+    """Hash of the destination PDF currently indexed."""
+    return get_destinations()[1]
+
+
+def reload_destinations() -> str:
+    """Re-ingest the destination PDF and serve the new index; returns its corpus version.
+
+    Only chunks whose text changed are embedded again. Searches in flight
+    finish on the previous index. A new version makes ``get_destination_cache``
+    drop the answers computed from the previous corpus on its next lookup.
+    """
+    return get_destinations.rebuild()[1]
+
+
+@lazy_singleton("memory_store")
+def get_memory_store() -> UserMemoryStore:
+    """Per-user recall memory store."""
+    return UserMemoryStore(
+        get_embeddings(),
+        snapshot_dir=os.getenv("MEMORY_SNAPSHOT_DIR"),
+        dedup_threshold=MEMORY_DEDUP_THRESHOLD,
+        consolidate_threshold=MEMORY_CONSOLIDATE_THRESHOLD,
+        consolidate_every=MEMORY_CONSOLIDATE_EVERY,
+        max_memories=MEMORY_MAX_PER_USER,
+        half_life_days=MEMORY_HALF_LIFE_DAYS,
+    )
+
+
+@lazy_singleton("destination_cache")
+def get_destination_cache() -> SemanticCache:
+    """Answers of get_popular_tourist_destinations, keyed by query embedding."""
+    return SemanticCache(threshold=DESTINATION_CACHE_THRESHOLD, capacity=DESTINATION_CACHE_SIZE)
+
 
-_ = vector_store.add_documents(documents=all_splits)
\ No newline at end of file
+metrics.register_gauge("embedding_cache", lambda: get_embeddings().stats if get_embeddings.is_initialized() else {})
+metrics.register_gauge(
+    "destination_cache", lambda: get_destination_cache().stats if get_destination_cache.is_initialized() else {}
+)
+metrics.register_gauge("memory_store", lambda: get_memory_store().stats if get_memory_store.is_initialized() else {})
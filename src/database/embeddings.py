@@ -0,0 +1,171 @@
+import asyncio
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+class BatchedEmbeddings(Embeddings):
+    """Coalesce concurrent async embedding requests from all sessions into batches.
+
+    Each ``submit`` returns a future for one text. A single drain task waits at
+    most ``max_wait_ms`` for up to ``max_batch_size`` texts to accumulate, runs
+    them through the wrapped model in one ``embed_documents`` call on a worker
+    thread, then resolves every future. While a batch is running, new requests
+    queue up and form the next batch, so batches grow with load on their own.
+
+    Queries are embedded with ``embed_documents`` as well, which is equivalent for
+    sentence-transformer models that do not use a query instruction. Sync calls
+    go straight to the wrapped model.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.stats = {"requests": 0, "batches": 0}
+        self._pending: list[tuple[str, asyncio.Future, float]] = []
+        self._full: Optional[asyncio.Event] = None
+        self._drainer: Optional[asyncio.Task] = None
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return list(await asyncio.gather(*(self.submit(text) for text in texts)))
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await self.submit(text)
+
+    def submit(self, text: str) -> asyncio.Future:
+        """Queue one text and return a future resolved with its embedding."""
+        loop = asyncio.get_running_loop()
+        if self._full is None:
+            self._full = asyncio.Event()
+        future = loop.create_future()
+        self._pending.append((text, future, time.monotonic()))
+        self.stats["requests"] += 1
+        if len(self._pending) >= self.max_batch_size:
+            self._full.set()
+        if self._drainer is None or self._drainer.done():
+            self._drainer = loop.create_task(self._drain())
+        return future
+
+    async def _drain(self) -> None:
+        while self._pending:
+            remaining = self.max_wait - (time.monotonic() - self._pending[0][2])
+            if remaining > 0 and len(self._pending) < self.max_batch_size:
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            self.stats["batches"] += 1
+            try:
+                vectors = await asyncio.to_thread(self.embeddings.embed_documents, [text for text, _, _ in batch])
+            except Exception as exc:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            for (_, future, _), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+
+def normalize_query(text: str) -> str:
+    """Cache key for a query: NFC-normalized, case-folded, whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFC", text).casefold().split())
+
+
+class CachedEmbeddings(Embeddings):
+    """LRU cache of query embeddings shared by every vector store caller.
+
+    Keys are normalized query text, so "Đà Lạt" and " đà  lạt" share one entry.
+    Concurrent async requests for the same key share a single model call. Once
+    ``max_entries`` are held, the least recently used entry is evicted. Document
+    embeddings are not cached since stored texts are rarely embedded twice.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_entries: int = 4096):
+        self.embeddings = embeddings
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._cache: OrderedDict[str, list[float]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[list[float]]:
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.stats["hits"] += 1
+            return vector
+
+    def _put(self, key: str, vector: list[float]) -> None:
+        with self._lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        key = normalize_query(text)
+        vector = self._get(key)
+        if vector is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            vector = self.embeddings.embed_query(text)
+            self._put(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> list[float]:
+        key = normalize_query(text)
+        vector = self._get(key)
+        if vector is not None:
+            return vector
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            with self._lock:
+                self.stats["hits"] += 1
+            return await asyncio.shield(inflight)
+
+        with self._lock:
+            self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            vector = await self.embeddings.aembed_query(text)
+        except BaseException as exc:
+            if isinstance(exc, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(exc)
+                # Mark retrieved so an unawaited failure does not log a warning.
+                future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+        self._put(key, vector)
+        future.set_result(vector)
+        return vector
+
+    def __len__(self) -> int:
+        return len(self._cache)
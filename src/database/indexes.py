@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+from pymongo import IndexModel
+from pymongo.asynchronous.database import AsyncDatabase
+
+from src.tools.booking import BOOKING_COLLECTIONS
+
+# Booking records are unique per idempotency key; older records without a key are ignored.
+IDEMPOTENCY_INDEX = IndexModel(
+    [("idempotency_key", 1)], unique=True, partialFilterExpression={"idempotency_key": {"$exists": True}}
+)
+
+# Compound indexes per collection, declared in the order of each tool's query:
+# equality fields first, then the range or sort field. Names are matched
+# through their normalized key fields (see search_keys.py).
+INDEXES = {
+    "flights": [
+        IndexModel([("departure_airport", 1), ("arrival_airport", 1), ("departure_time", 1)]),
+        IndexModel([("departure_time", 1)]),
+    ],
+    "hotels": [
+        IndexModel([("location_key", 1), ("booked", 1), ("checkin_date", 1)]),
+        IndexModel([("name_key", 1)]),
+        IndexModel([("search_keys_version", 1)]),
+    ],
+    "tours": [
+        IndexModel([("destination_key", 1), ("duration_days", 1)]),
+        IndexModel([("search_keys_version", 1)]),
+    ],
+    "airport_shuttles": [
+        IndexModel([("from_airport", 1), ("to_key", 1), ("pickup_datetime", 1)]),
+        IndexModel([("search_keys_version", 1)]),
+    ],
+    **{collection: [IDEMPOTENCY_INDEX] for collection in BOOKING_COLLECTIONS},
+}
+
+
+def _sample_queries() -> dict[str, dict]:
+    """One representative query per collection, shaped like the search tools build them."""
+    day = datetime.combine(datetime.now().date(), datetime.min.time())
+    return {
+        "flights": {
+            "departure_airport": "HAN",
+            "arrival_airport": "SGN",
+            "departure_time": {"$gte": day, "$lt": day + timedelta(days=1)},
+        },
+        "hotels": {"location_key": "da lat", "booked": 0},
+        "tours": {"destination_key": "da lat"},
+        "airport_shuttles": {"from_airport": "SGN", "to_key": "quan 1"},
+    }
+
+
+async def ensure_indexes(db: AsyncDatabase) -> list[str]:
+    """Create every declared index that does not exist yet.
+
+    Returns:
+        list[str]: Names of the indexes, as ``<collection>.<index>``.
+    """
+    names = []
+    for collection, models in INDEXES.items():
+        created = await db[collection].create_indexes(models)
+        names.extend(f"{collection}.{name}" for name in created)
+    return names
+
+
+def _stages(plan: dict) -> set[str]:
+    stages = {plan.get("stage")}
+    for child in [plan.get("inputStage"), *plan.get("inputStages", [])]:
+        if child:
+            stages |= _stages(child)
+    return stages
+
+
+async def verify_query_plans(db: AsyncDatabase) -> dict[str, bool]:
+    """Explain the representative query of each collection.
+
+    Returns:
+        dict[str, bool]: Whether the winning plan of each collection uses an
+        index scan rather than a collection scan.
+    """
+    results = {}
+    for collection, query in _sample_queries().items():
+        explain = await db[collection].find(query).explain()
+        winning_plan = explain["queryPlanner"]["winningPlan"]
+        # Newer servers nest the classic plan under "queryPlan".
+        stages = _stages(winning_plan.get("queryPlan", winning_plan))
+        results[collection] = "IXSCAN" in stages and "COLLSCAN" not in stages
+    return results
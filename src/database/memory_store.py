@@ -0,0 +1,258 @@
+import asyncio
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from src.utils.text import fold
+
+
+class UserMemoryStore:
+    """Recall memories partitioned by user, with one vector index per user.
+
+    Searching only scores the memories of the requesting user, so recall cost
+    grows with that user's memories instead of every user plus the destination
+    corpus. When ``snapshot_dir`` is set, each user's index is written to
+    ``<snapshot_dir>/<user_id>.json`` after every write and reloaded on first use.
+
+    Each user's memories stay few and distinct:
+
+    - A new memory at least ``dedup_threshold`` similar to an existing one
+      is a duplicate when the words of one contain all the words of the
+      other. It counts one more mention of the existing memory, whose text
+      becomes the more detailed of the two (the newest when they have the
+      same words): "lives in District 7, Ho Chi Minh City" replaces "lives in
+      Ho Chi Minh City". A similar memory saying something else, such as
+      "allergic to peanuts" after "allergic to seafood", is stored on its own.
+    - Every ``consolidate_every`` new memories, each group of memories at
+      least ``consolidate_threshold`` similar is reduced to its most detailed
+      (longest) member: members whose words it all contains are merged into
+      it with their mentions and recall hits. Members saying anything more
+      are kept, by the same word test as duplicates.
+    - Beyond ``max_memories``, the memories with the lowest score are evicted.
+      The score is mentions plus recall hits, halved every
+      ``half_life_days`` since the memory was last written or recalled.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        snapshot_dir: Optional[str] = None,
+        dedup_threshold: float = 0.92,
+        consolidate_threshold: float = 0.85,
+        consolidate_every: int = 20,
+        max_memories: int = 200,
+        half_life_days: float = 30.0,
+    ):
+        self.embedding = embedding
+        self.snapshot_dir = Path(snapshot_dir) if snapshot_dir else None
+        self.dedup_threshold = dedup_threshold
+        self.consolidate_threshold = consolidate_threshold
+        self.consolidate_every = consolidate_every
+        self.max_memories = max_memories
+        self.half_life = half_life_days * 86400
+        self.stats = {"added": 0, "deduplicated": 0, "merged": 0, "evicted": 0}
+        self._stores: dict[str, InMemoryVectorStore] = {}
+        self._writes_since_consolidation: defaultdict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _snapshot_path(self, user_id: str) -> Optional[Path]:
+        if self.snapshot_dir is None:
+            return None
+        return self.snapshot_dir / f"{re.sub(r'[^A-Za-z0-9_-]', '_', user_id)}.json"
+
+    def _get_store(self, user_id: Optional[str], create: bool = False) -> Optional[InMemoryVectorStore]:
+        """Return the index of a user, loading its snapshot or creating it if asked."""
+        key = str(user_id)
+        with self._lock:
+            store = self._stores.get(key)
+            if store is not None:
+                return store
+            path = self._snapshot_path(key)
+            if path is not None and path.exists():
+                store = InMemoryVectorStore.load(str(path), self.embedding)
+            elif create:
+                store = InMemoryVectorStore(self.embedding)
+            else:
+                return None
+            self._stores[key] = store
+            return store
+
+    async def _aget_store(self, user_id: Optional[str], create: bool = False) -> Optional[InMemoryVectorStore]:
+        # Only a snapshot load touches the disk; everything else stays on the loop.
+        if self.snapshot_dir is None or str(user_id) in self._stores:
+            return self._get_store(user_id, create)
+        return await asyncio.to_thread(self._get_store, user_id, create)
+
+    @staticmethod
+    def _matrix(store: InMemoryVectorStore) -> tuple[list[str], np.ndarray]:
+        """Ids and unit-normalized vectors of every memory in an index."""
+        ids = list(store.store)
+        vectors = np.asarray([store.store[memory_id]["vector"] for memory_id in ids], dtype=np.float32)
+        if ids:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return ids, vectors
+
+    def _score(self, metadata: dict, now: float) -> float:
+        age = now - metadata.get("last_used", metadata.get("created_at", now))
+        return (metadata.get("mentions", 1) + metadata.get("hits", 0)) * 0.5 ** (max(age, 0) / self.half_life)
+
+    def _remember(self, user_id: Optional[str], store: InMemoryVectorStore, memory: str, vector: list[float]) -> Document:
+        """Store a memory unless a near-duplicate exists, then consolidate and evict as due."""
+        now = time.time()
+        ids, vectors = self._matrix(store)
+        if ids:
+            query = np.asarray(vector, dtype=np.float32)
+            similarities = vectors @ (query / max(np.linalg.norm(query), 1e-12))
+            words = set(fold(memory).split())
+            # Most similar first: the first near-duplicate whose words contain the new
+            # memory's, or are contained in them, absorbs it.
+            for index in np.argsort(-similarities):
+                if similarities[index] < self.dedup_threshold:
+                    break
+                entry = store.store[ids[index]]
+                stored_words = set(fold(entry["text"]).split())
+                if stored_words <= words:
+                    # The new memory says as much or more, so its text wins.
+                    entry["text"] = memory
+                    entry["vector"] = list(vector)
+                elif not words <= stored_words:
+                    continue
+                entry["metadata"]["mentions"] = entry["metadata"].get("mentions", 1) + 1
+                entry["metadata"]["last_used"] = now
+                self.stats["deduplicated"] += 1
+                return Document(id=entry["id"], page_content=entry["text"], metadata=entry["metadata"])
+
+        metadata = {"user_id": user_id, "created_at": now, "last_used": now, "mentions": 1, "hits": 0}
+        memory_id = str(uuid.uuid4())
+        store.store[memory_id] = {"id": memory_id, "vector": list(vector), "text": memory, "metadata": metadata}
+        self.stats["added"] += 1
+        key = str(user_id)
+        self._writes_since_consolidation[key] += 1
+        if self._writes_since_consolidation[key] >= self.consolidate_every:
+            self._consolidate(store)
+            self._writes_since_consolidation[key] = 0
+        self._evict(store, now)
+        return Document(id=memory_id, page_content=memory, metadata=metadata)
+
+    def _consolidate(self, store: InMemoryVectorStore) -> int:
+        """Merge groups of similar memories; returns the number of memories removed."""
+        ids, vectors = self._matrix(store)
+        if len(ids) < 2:
+            return 0
+        similarities = vectors @ vectors.T
+        now = time.time()
+        # Best-scored memories seed the groups, so a weak memory never absorbs a strong one.
+        order = sorted(range(len(ids)), key=lambda index: -self._score(store.store[ids[index]]["metadata"], now))
+        assigned = np.zeros(len(ids), dtype=bool)
+        removed = 0
+        for seed in order:
+            if assigned[seed]:
+                continue
+            group = [index for index in np.flatnonzero(similarities[seed] >= self.consolidate_threshold) if not assigned[index]]
+            keeper = max(group, key=lambda index: len(store.store[ids[index]]["text"]))
+            words = set(fold(store.store[ids[keeper]]["text"]).split())
+            # Only members saying nothing the keeper does not are merged; the others may seed their own group.
+            group = [index for index in group if set(fold(store.store[ids[index]]["text"]).split()) <= words]
+            assigned[group] = True
+            assigned[seed] = True
+            if len(group) < 2:
+                continue
+            entries = [store.store[ids[index]] for index in group]
+            keeper = store.store[ids[keeper]]
+            keeper["metadata"].update(
+                mentions=sum(entry["metadata"].get("mentions", 1) for entry in entries),
+                hits=sum(entry["metadata"].get("hits", 0) for entry in entries),
+                created_at=min(entry["metadata"].get("created_at", now) for entry in entries),
+                last_used=max(entry["metadata"].get("last_used", 0) for entry in entries),
+            )
+            for entry in entries:
+                if entry is not keeper:
+                    del store.store[entry["id"]]
+                    removed += 1
+        self.stats["merged"] += removed
+        return removed
+
+    def _evict(self, store: InMemoryVectorStore, now: float) -> None:
+        excess = len(store.store) - self.max_memories
+        if excess <= 0:
+            return
+        scores = sorted(store.store, key=lambda memory_id: self._score(store.store[memory_id]["metadata"], now))
+        for memory_id in scores[:excess]:
+            del store.store[memory_id]
+        self.stats["evicted"] += excess
+
+    def add_memory(self, user_id: Optional[str], memory: str) -> Document:
+        """Embed and store a memory in the index of the given user."""
+        store = self._get_store(user_id, create=True)
+        document = self._remember(user_id, store, memory, self.embedding.embed_documents([memory])[0])
+        self.save(user_id)
+        return document
+
+    async def aadd_memory(self, user_id: Optional[str], memory: str) -> Document:
+        """Async version of ``add_memory``; embedding and snapshot run off the event loop."""
+        store = await self._aget_store(user_id, create=True)
+        vector = (await self.embedding.aembed_documents([memory]))[0]
+        document = self._remember(user_id, store, memory, vector)
+        if self.snapshot_dir is not None:
+            await asyncio.to_thread(self.save, user_id)
+        return document
+
+    def consolidate(self, user_id: Optional[str]) -> int:
+        """Merge a user's similar memories now; returns the number of memories removed."""
+        store = self._get_store(user_id)
+        if not store:
+            return 0
+        removed = self._consolidate(store)
+        self._writes_since_consolidation[str(user_id)] = 0
+        if removed:
+            self.save(user_id)
+        return removed
+
+    @staticmethod
+    def _mark_recalled(store: InMemoryVectorStore, documents: list[Document]) -> None:
+        now = time.time()
+        for document in documents:
+            entry = store.store.get(document.id)
+            if entry is not None:
+                entry["metadata"]["hits"] = entry["metadata"].get("hits", 0) + 1
+                entry["metadata"]["last_used"] = now
+
+    def search(self, user_id: Optional[str], query: str, k: int = 3) -> list[Document]:
+        """Return the ``k`` memories of a user most similar to ``query``."""
+        store = self._get_store(user_id)
+        # Users without memories never pay for the query embedding.
+        if not store or not store.store:
+            return []
+        documents = store.similarity_search(query, k=k)
+        self._mark_recalled(store, documents)
+        return documents
+
+    async def asearch(self, user_id: Optional[str], query: str, k: int = 3) -> list[Document]:
+        """Async version of ``search``."""
+        store = await self._aget_store(user_id)
+        if not store or not store.store:
+            return []
+        documents = await store.asimilarity_search(query, k=k)
+        self._mark_recalled(store, documents)
+        return documents
+
+    def count(self, user_id: Optional[str]) -> int:
+        """Number of memories held for a user."""
+        store = self._get_store(user_id)
+        return len(store.store) if store else 0
+
+    def save(self, user_id: Optional[str]) -> None:
+        """Write the snapshot of a user's index, if snapshots are enabled."""
+        path = self._snapshot_path(str(user_id))
+        store = self._stores.get(str(user_id))
+        if path is not None and store is not None:
+            store.dump(str(path))
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Iterable, Optional
+
+from pymongo import UpdateOne
+from pymongo.asynchronous.database import AsyncDatabase
+
+from src.utils.text import fold, place_key
+
+logger = logging.getLogger(__name__)
+
+# Bump when the key functions or aliases change, so the backfill re-keys every document.
+SEARCH_KEYS_VERSION = 1
+
+# Normalized key fields stored next to the fields the search tools filter on:
+# key field -> (source field, key function), per collection.
+SEARCH_KEYS: dict[str, dict[str, tuple[str, Callable[[str], str]]]] = {
+    "hotels": {"location_key": ("location", place_key), "name_key": ("name", fold)},
+    "tours": {"destination_key": ("destination", place_key)},
+    "airport_shuttles": {"to_key": ("to", place_key)},
+}
+
+
+def search_keys(collection: str, document: dict) -> dict:
+    """Key fields of a document, to ``$set`` whenever its source fields are written.
+
+    Writers that set them make a document searchable at once; otherwise
+    ``SearchKeyRefresher`` keys it within its refresh interval.
+    """
+    keys = {
+        key: key_function(document[source])
+        for key, (source, key_function) in SEARCH_KEYS.get(collection, {}).items()
+        if document.get(source) is not None
+    }
+    return {**keys, "search_keys_version": SEARCH_KEYS_VERSION}
+
+
+def hidden_search_keys(collection: str) -> dict:
+    """Projection leaving the key fields out of full documents."""
+    return {**dict.fromkeys(SEARCH_KEYS[collection], 0), "search_keys_version": 0}
+
+
+async def backfill_search_keys(
+    db: AsyncDatabase, batch_size: int = 500, collections: Optional[Iterable[str]] = None
+) -> dict[str, int]:
+    """Add or refresh the key fields of documents never keyed or keyed under an older version.
+
+    Returns:
+        dict[str, int]: Number of documents updated per collection.
+    """
+    updated = {}
+    for collection in collections or SEARCH_KEYS:
+        keys = SEARCH_KEYS[collection]
+        sources = {source: 1 for source, _ in keys.values()}
+        stale = db[collection].find({"search_keys_version": {"$ne": SEARCH_KEYS_VERSION}}, sources)
+        updated[collection] = 0
+        batch = []
+        async for document in stale:
+            batch.append(UpdateOne({"_id": document["_id"]}, {"$set": search_keys(collection, document)}))
+            if len(batch) >= batch_size:
+                await db[collection].bulk_write(batch, ordered=False)
+                updated[collection] += len(batch)
+                batch = []
+        if batch:
+            await db[collection].bulk_write(batch, ordered=False)
+            updated[collection] += len(batch)
+    return updated
+
+
+class SearchKeyRefresher:
+    """Keys documents written since the last backfill before they are searched.
+
+    ``refresh`` backfills a collection's documents lacking the current
+    ``search_keys_version`` at most once every ``interval`` seconds, and
+    concurrent searches share one run. A document inserted or edited while the
+    app runs without its key fields is found by searches at most ``interval``
+    seconds later. When nothing is stale, a refresh is a single indexed query
+    returning no documents.
+    """
+
+    def __init__(self, interval: float = 30.0):
+        self.interval = interval
+        self.stats = {"refreshes": 0, "keyed": 0, "failed": 0}
+        self._checked: dict[str, float] = {}
+        self._running: dict[str, asyncio.Future] = {}
+
+    async def _run(self, db: AsyncDatabase, collection: str) -> None:
+        try:
+            updated = await backfill_search_keys(db, collections=[collection])
+        except Exception:
+            # Searching with the keys already stored beats failing the search.
+            logger.exception("Refreshing the search keys of %s failed", collection)
+            self.stats["failed"] += 1
+            return
+        self.stats["refreshes"] += 1
+        self.stats["keyed"] += updated[collection]
+        if updated[collection]:
+            logger.info("Keyed %d new or edited %s", updated[collection], collection)
+
+    async def refresh(self, db: AsyncDatabase, collection: str) -> None:
+        task = self._running.get(collection)
+        if task is None:
+            now = time.monotonic()
+            if now - self._checked.get(collection, float("-inf")) < self.interval:
+                return
+            self._checked[collection] = now
+            task = asyncio.ensure_future(self._run(db, collection))
+            self._running[collection] = task
+            task.add_done_callback(lambda _: self._running.pop(collection, None))
+        await asyncio.shield(task)
@@ -0,0 +1,79 @@
+import threading
+from typing import Any, Optional, Sequence
+
+import numpy as np
+
+
+class SemanticCache:
+    """Result cache keyed by query embedding rather than query text.
+
+    A lookup returns the result stored for the most similar cached query when
+    their cosine similarity is at least ``threshold``. Every entry is tied to a
+    corpus ``version``; a lookup or store under a different version clears the
+    cache, so results never outlive the corpus they were computed from. For the
+    destination corpus, the version changes when ``reload_destinations`` (in
+    ``src.database.db``) re-ingests a changed PDF. Beyond ``capacity`` entries,
+    the least recently used one is replaced.
+    """
+
+    def __init__(self, threshold: float = 0.92, capacity: int = 256):
+        self.threshold = threshold
+        self.capacity = capacity
+        self.version: Optional[str] = None
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+        self._vectors: Optional[np.ndarray] = None
+        self._results: list[Any] = []
+        self._last_used = np.zeros(capacity, dtype=np.int64)
+        self._clock = 0
+        self._lock = threading.Lock()
+
+    def _check_version(self, version: str) -> None:
+        if version != self.version:
+            if self._results:
+                self.stats["invalidations"] += 1
+            self.version = version
+            self._vectors = None
+            self._results = []
+            self._last_used[:] = 0
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding: Sequence[float], version: str) -> Optional[Any]:
+        """Return the cached result for a similar enough query, if any."""
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_version(version)
+            if self._results:
+                similarities = self._vectors[:len(self._results)] @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._clock += 1
+                    self._last_used[best] = self._clock
+                    self.stats["hits"] += 1
+                    return self._results[best]
+            self.stats["misses"] += 1
+            return None
+
+    def store(self, embedding: Sequence[float], result: Any, version: str) -> None:
+        """Cache ``result`` for the query with this embedding."""
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_version(version)
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, len(vector)), dtype=np.float32)
+            if len(self._results) < self.capacity:
+                slot = len(self._results)
+                self._results.append(result)
+            else:
+                slot = int(np.argmin(self._last_used))
+                self._results[slot] = result
+            self._vectors[slot] = vector
+            self._clock += 1
+            self._last_used[slot] = self._clock
+
+    def __len__(self) -> int:
+        return len(self._results)
@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from pymongo.asynchronous.client_session import AsyncClientSession
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import DuplicateKeyError
+
+# "auto" uses transactions when the server supports them (replica set or
+# sharded cluster), "on" always uses them and "off" never does.
+BOOKING_TRANSACTIONS = os.getenv("BOOKING_TRANSACTIONS", "auto")
+# A replayed call waits up to this long for the booking it duplicates to settle
+BOOKING_PENDING_WAIT_SECONDS = float(os.getenv("BOOKING_PENDING_WAIT_SECONDS", "2"))
+
+
+@dataclass(frozen=True)
+class BookingSpec:
+    """How one kind of item is booked."""
+
+    inventory: str
+    bookings: str
+    item_field: str
+    # Debit the item's price from the user's balance.
+    charge: bool = False
+    # Only book items matching this filter, and apply this update to claim them.
+    claim_filter: Optional[dict] = None
+    claim_update: Optional[dict] = None
+
+
+FLIGHT_BOOKING = BookingSpec("flights", "bookings", "flight_id", charge=True)
+HOTEL_BOOKING = BookingSpec(
+    "hotels", "hotel_bookings", "hotel_id", claim_filter={"booked": 0}, claim_update={"$set": {"booked": 1}}
+)
+SHUTTLE_BOOKING = BookingSpec("airport_shuttles", "shuttle_bookings", "shuttle_id", charge=True)
+
+BOOKING_COLLECTIONS = [FLIGHT_BOOKING.bookings, HOTEL_BOOKING.bookings, SHUTTLE_BOOKING.bookings]
+
+
+class BookingFailed(Exception):
+    """Aborts a booking; ``status`` says why."""
+
+    def __init__(self, status: str):
+        super().__init__(status)
+        self.status = status
+
+
+@dataclass
+class BookingResult:
+    """Outcome of a booking.
+
+    ``status`` is one of ``confirmed``, ``not_found``, ``unavailable`` or
+    ``insufficient_funds``. ``duplicate`` is True when the idempotency key had
+    already been used and the earlier booking was returned instead; its status
+    is then ``pending`` if that booking is still in progress after the engine's
+    ``pending_wait``.
+    """
+
+    status: str
+    booking_id: Optional[ObjectId] = None
+    duplicate: bool = False
+
+
+def idempotency_key(kind: str, user_id: Optional[str], item_id: str, scope: Optional[str] = None) -> str:
+    """Key identifying one booking intent, so retried tool calls map to the same booking.
+
+    ``scope`` is the id of the tool call making the booking: a retry or replay
+    of that call shares it, while the user asking again is a new call.
+    """
+    return hashlib.sha256(f"{scope}:{user_id}:{kind}:{item_id}".encode("utf-8")).hexdigest()
+
+
+class BookingEngine:
+    """Books items atomically and idempotently.
+
+    Each booking record carries a unique ``idempotency_key``; a retried call
+    with the same key returns the existing booking without charging again.
+    When that booking is still in progress, the retried call waits for it to
+    settle; if it was rolled back, the retried call makes the booking itself.
+
+    With transactions, the booking insert, inventory claim and balance debit
+    commit or abort together. Without them (standalone server), the same steps
+    run as conditional updates: the claim only matches unclaimed items and the
+    debit only matches balances covering the price, so concurrent bookings can
+    never overdraw or double-claim, and a failed step undoes the earlier ones.
+    """
+
+    def __init__(
+        self,
+        db: AsyncDatabase,
+        transactions: str = BOOKING_TRANSACTIONS,
+        pending_wait: float = BOOKING_PENDING_WAIT_SECONDS,
+    ):
+        self.db = db
+        self.transactions = transactions
+        self.pending_wait = pending_wait
+        self._supports_transactions: Optional[bool] = None
+
+    async def _use_transactions(self) -> bool:
+        if self.transactions != "auto":
+            return self.transactions == "on"
+        if self._supports_transactions is None:
+            hello = await self.db.command("hello")
+            self._supports_transactions = "setName" in hello or hello.get("msg") == "isdbgrid"
+        return self._supports_transactions
+
+    async def book(self, spec: BookingSpec, user_id: str, item_id: str, key: str) -> BookingResult:
+        """Book ``item_id`` for ``user_id`` under the idempotency ``key``."""
+        booking = {
+            "user_id": ObjectId(user_id),
+            spec.item_field: ObjectId(item_id),
+            "booking_time": datetime.now(),
+            "idempotency_key": key,
+        }
+        for attempt in range(2):
+            try:
+                if await self._use_transactions():
+                    await self._book_in_transaction(spec, booking)
+                else:
+                    await self._book_with_conditional_updates(spec, booking)
+            except BookingFailed as failure:
+                return BookingResult(failure.status)
+            except DuplicateKeyError:
+                # The key was used before (or by a concurrent call): report that booking instead.
+                existing = await self._settled(spec, key)
+                if existing is not None:
+                    return BookingResult(existing["status"], existing["_id"], duplicate=True)
+                if attempt:
+                    return BookingResult("pending", duplicate=True)
+                # The other call rolled back and deleted its booking: book once more.
+                booking.pop("_id", None)
+                continue
+            return BookingResult("confirmed", booking["_id"])
+
+    async def _settled(self, spec: BookingSpec, key: str) -> Optional[dict]:
+        """The booking made under ``key`` once it is no longer pending, or None if it was rolled back.
+
+        A booking still pending after ``pending_wait`` seconds is returned as is.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.pending_wait
+        delay = 0.01
+        while True:
+            existing = await self.db[spec.bookings].find_one({"idempotency_key": key}, {"status": 1})
+            if existing is None or existing["status"] != "pending" or loop.time() >= deadline:
+                return existing
+            await asyncio.sleep(min(delay, max(deadline - loop.time(), 0)))
+            delay = min(delay * 2, 0.2)
+
+    async def _claim(self, spec: BookingSpec, item_id: ObjectId, session: Optional[AsyncClientSession] = None) -> dict:
+        """Claim the item (or just read it when the kind has no claim) and return its price."""
+        projection = {"price": 1}
+        if spec.claim_update is None:
+            item = await self.db[spec.inventory].find_one({"_id": item_id}, projection, session=session)
+            if item is None:
+                raise BookingFailed("not_found")
+            return item
+        item = await self.db[spec.inventory].find_one_and_update(
+            {"_id": item_id, **spec.claim_filter}, spec.claim_update,
+            projection=projection, return_document=ReturnDocument.AFTER, session=session,
+        )
+        if item is None:
+            exists = await self.db[spec.inventory].count_documents({"_id": item_id}, limit=1, session=session)
+            raise BookingFailed("unavailable" if exists else "not_found")
+        return item
+
+    async def _debit(self, user_id: ObjectId, amount, session: Optional[AsyncClientSession] = None) -> None:
+        result = await self.db.users.update_one(
+            {"_id": user_id, "balance": {"$gte": amount}}, {"$inc": {"balance": -amount}}, session=session
+        )
+        if not result.modified_count:
+            raise BookingFailed("insufficient_funds")
+
+    async def _book_in_transaction(self, spec: BookingSpec, booking: dict) -> None:
+        document = {**booking, "status": "confirmed"}
+
+        async def callback(session: AsyncClientSession) -> None:
+            await self.db[spec.bookings].insert_one(document, session=session)
+            item = await self._claim(spec, booking[spec.item_field], session)
+            if spec.charge:
+                await self._debit(booking["user_id"], item["price"], session)
+
+        async with self.db.client.start_session() as session:
+            await session.with_transaction(callback)
+        booking["_id"] = document["_id"]
+
+    async def _book_with_conditional_updates(self, spec: BookingSpec, booking: dict) -> None:
+        # Reserving the key and claiming the item are independent, so they share a round trip.
+        pending = {**booking, "status": "pending"}
+        reserved, claimed = await asyncio.gather(
+            self.db[spec.bookings].insert_one(pending),
+            self._claim(spec, booking[spec.item_field]),
+            return_exceptions=True,
+        )
+        booking["_id"] = pending.get("_id")
+        if isinstance(reserved, BaseException) or isinstance(claimed, BaseException):
+            if not isinstance(claimed, BaseException):
+                await self._release(spec, booking[spec.item_field])
+            if not isinstance(reserved, BaseException):
+                await self.db[spec.bookings].delete_one({"_id": booking["_id"]})
+            raise reserved if isinstance(reserved, BaseException) else claimed
+
+        try:
+            if spec.charge:
+                await self._debit(booking["user_id"], claimed["price"])
+        except BaseException:
+            await self._release(spec, booking[spec.item_field])
+            await self.db[spec.bookings].delete_one({"_id": booking["_id"]})
+            raise
+        await self.db[spec.bookings].update_one({"_id": booking["_id"]}, {"$set": {"status": "confirmed"}})
+
+    async def _release(self, spec: BookingSpec, item_id: ObjectId) -> None:
+        """Undo a claim made by ``_claim``."""
+        if spec.claim_update is None:
+            return
+        await self.db[spec.inventory].update_one({"_id": item_id}, {"$set": spec.claim_filter})
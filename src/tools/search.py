@@ -0,0 +1,85 @@
+import os
+from datetime import date, datetime
+from typing import Optional
+
+from bson.objectid import ObjectId
+from pymongo.asynchronous.collection import AsyncCollection
+
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "10"))
+SEARCH_MAX_PAGE_SIZE = 50
+
+
+def _compact_value(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def compact_document(document: dict) -> dict:
+    """Stringify ids and dates so results serialize into short, stable tool messages."""
+    compact = {"id": str(document["_id"])} if "_id" in document else {}
+    compact.update({key: _compact_value(value) for key, value in document.items() if key != "_id"})
+    return compact
+
+
+def _decode_cursor(cursor: Optional[str]) -> int:
+    try:
+        return max(int(cursor), 0) if cursor else 0
+    except ValueError:
+        return 0
+
+
+async def paginated_search(
+    collection: AsyncCollection,
+    match: dict,
+    projection: Optional[dict],
+    sort: dict,
+    summary: dict,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    extra_facets: Optional[dict[str, list[dict]]] = None,
+) -> dict:
+    """Run a search as one aggregation returning a sorted page plus summary facets.
+
+    Args:
+        collection (AsyncCollection): Collection to search.
+        match (dict): Filter on the collection.
+        projection (Optional[dict]): Fields kept in each result, or None for full documents.
+        sort (dict): Sort order of the results, e.g. ``{"price": 1}``.
+        summary (dict): ``$group`` accumulators computed over every match, e.g. ``{"price_min": {"$min": "$price"}}``.
+        limit (Optional[int]): Page size, capped at ``SEARCH_MAX_PAGE_SIZE``.
+        cursor (Optional[str]): ``next_cursor`` of the previous page.
+        extra_facets (Optional[dict[str, list[dict]]]): Further pipelines run over every
+            match, e.g. a breakdown per day; each is returned under its name.
+
+    Returns:
+        dict: ``results`` (the page), ``summary`` (``count`` plus the accumulators
+        over every match), ``next_cursor`` (None on the last page) and one list
+        per extra facet.
+    """
+    offset = _decode_cursor(cursor)
+    limit = min(limit or SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE)
+    # _id breaks ties so pages stay stable across "show more" calls.
+    page = [{"$sort": {**sort, "_id": 1}}, {"$skip": offset}, {"$limit": limit}]
+    if projection:
+        page.append({"$project": projection})
+    pipeline = [
+        {"$match": match},
+        {"$facet": {
+            "results": page,
+            "summary": [{"$group": {"_id": None, "count": {"$sum": 1}, **summary}}],
+            **(extra_facets or {}),
+        }},
+    ]
+    facets = (await (await collection.aggregate(pipeline)).to_list())[0]
+    stats = facets["summary"][0] if facets["summary"] else {"count": 0}
+    stats.pop("_id", None)
+    next_offset = offset + len(facets["results"])
+    return {
+        "results": [compact_document(document) for document in facets["results"]],
+        "summary": {key: _compact_value(value) for key, value in stats.items()},
+        "next_cursor": str(next_offset) if next_offset < stats["count"] else None,
+        **{name: [compact_document(document) for document in facets[name]] for name in extra_facets or {}},
+    }
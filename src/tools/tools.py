@@ -1,75 +1,196 @@
+import logging
 import os
-import uuid
-from datetime import date, datetime
-from typing import List, Optional
+from datetime import date, datetime, time, timedelta
+from typing import Annotated, List, Optional
 
-from bson.objectid import ObjectId
 from dotenv import load_dotenv
-from langchain_core.documents import Document
 from langchain_core.runnables import RunnableConfig
-from langchain_core.tools import tool
-from pymongo import MongoClient
-
-from src.database.db import vector_store
+from langchain_core.tools import InjectedToolCallId, tool
+from pymongo import AsyncMongoClient
+from pymongo.asynchronous.database import AsyncDatabase
+
+from src.database.db import get_destination_cache, get_destinations, get_memory_store
+from src.database.search_keys import SearchKeyRefresher, hidden_search_keys
+from src.tools.booking import (
+    FLIGHT_BOOKING,
+    HOTEL_BOOKING,
+    SHUTTLE_BOOKING,
+    BookingEngine,
+    BookingResult,
+    idempotency_key,
+)
+from src.tools.search import paginated_search
+from src.utils.metrics import metrics
+from src.utils.startup import lazy_singleton, resolve
+from src.utils.text import airport_code, fold, place_key
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
 DB_NAME = os.getenv("DB_NAME", "flight_booking")
+# Documents written without search keys become searchable within this many seconds
+SEARCH_KEYS_REFRESH_SECONDS = float(os.getenv("SEARCH_KEYS_REFRESH_SECONDS", "30"))
+
+
+@lazy_singleton("mongo")
+def get_db() -> AsyncDatabase:
+    """Async database handle on a client created on first use."""
+    client = AsyncMongoClient(MONGODB_URI)
+    return client[DB_NAME]
+
+
+@lazy_singleton("booking_engine")
+def get_booking_engine() -> BookingEngine:
+    """Atomic, idempotent booking engine on the shared database."""
+    return BookingEngine(get_db())
+
+
+@lazy_singleton("search_key_refresher")
+def get_search_key_refresher() -> SearchKeyRefresher:
+    """Keys hotels, tours and shuttles written since startup before they are searched."""
+    return SearchKeyRefresher(SEARCH_KEYS_REFRESH_SECONDS)
+
+
+metrics.register_gauge(
+    "search_keys", lambda: get_search_key_refresher().stats if get_search_key_refresher.is_initialized() else {}
+)
+
+
+def _booking_message(result: BookingResult) -> str:
+    """Message of the flight and shuttle booking tools for a booking outcome."""
+    if result.status == "confirmed":
+        return 'Bạn đã đặt vé thành công'
+    if result.status == "insufficient_funds":
+        return 'Tài khoản của bạn không đủ số dư'
+    if result.status == "pending":
+        return 'Yêu cầu đặt vé này đang được xử lý'
+    return 'Không tìm thấy chuyến đã chọn'
+
+
+# Fields returned by the search tools unless full documents are requested,
+# with the sort order and the summary computed over every match.
+TOUR_FIELDS = {"name": 1, "destination": 1, "duration_days": 1, "price": 1, "start_date": 1}
+TOUR_SORT = {"price": 1}
+TOUR_SUMMARY = {
+    "price_min": {"$min": "$price"},
+    "price_max": {"$max": "$price"},
+    "durations": {"$addToSet": "$duration_days"},
+}
+HOTEL_FIELDS = {"name": 1, "location": 1, "price_tier": 1, "price": 1, "checkin_date": 1, "checkout_date": 1}
+HOTEL_SORT = {"price": 1}
+HOTEL_SUMMARY = {
+    "price_min": {"$min": "$price"},
+    "price_max": {"$max": "$price"},
+    "price_tiers": {"$addToSet": "$price_tier"},
+}
+FLIGHT_FIELDS = {
+    "flight_number": 1, "airline": 1, "departure_airport": 1, "arrival_airport": 1,
+    "departure_time": 1, "arrival_time": 1, "price": 1,
+}
+FLIGHT_SORT = {"price": 1, "departure_time": 1}
+FLIGHT_SUMMARY = {
+    "price_min": {"$min": "$price"},
+    "price_max": {"$max": "$price"},
+    "airlines": {"$addToSet": "$airline"},
+    "first_departure": {"$min": "$departure_time"},
+    "last_departure": {"$max": "$departure_time"},
+}
+# Cheapest flight and number of flights per departure day, for date-window searches.
+FLIGHT_DAYS = [
+    {"$sort": {"price": 1, "departure_time": 1, "_id": 1}},
+    {"$group": {
+        "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$departure_time"}},
+        "flights": {"$sum": 1},
+        "cheapest_flight_id": {"$first": "$_id"},
+        "cheapest_price": {"$first": "$price"},
+        "airline": {"$first": "$airline"},
+        "departure_airport": {"$first": "$departure_airport"},
+        "arrival_airport": {"$first": "$arrival_airport"},
+        "departure_time": {"$first": "$departure_time"},
+    }},
+    {"$sort": {"_id": 1}},
+    {"$project": {
+        "_id": 0, "day": "$_id", "flights": 1, "cheapest_flight_id": 1, "cheapest_price": 1, "airline": 1,
+        "departure_airport": 1, "arrival_airport": 1, "departure_time": 1,
+    }},
+]
+MAX_FLEXIBLE_DAYS = 7
+SHUTTLE_FIELDS = {"from_airport": 1, "to": 1, "pickup_datetime": 1, "vehicle_type": 1, "seats": 1, "price": 1}
+SHUTTLE_SORT = {"pickup_datetime": 1, "price": 1}
+SHUTTLE_SUMMARY = {
+    "price_min": {"$min": "$price"},
+    "price_max": {"$max": "$price"},
+    "destinations": {"$addToSet": "$to"},
+}
 
-client = MongoClient(MONGODB_URI)
-db = client[DB_NAME]
 
 @tool
-def lookup_available_tours(
+async def lookup_available_tours(
     destination: Optional[str] = None,
     duration_days: Optional[int] = None,
-) -> list[dict]:
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    detailed: bool = False,
+) -> dict:
     """
     Truy vấn các tour đang mở để người dùng có thể đặt.
     Sử dụng khi người dùng hỏi về các tour cụ thể để đi du lịch (có thể đặt).
     Args:
-        destination (Optional[str]): Điểm đến du lịch (Ví dụ: Đà Lạt, Phú Quốc, Sa Pa).
+        destination (Optional[str]): Điểm đến du lịch (Ví dụ: Đà Lạt, Phú Quốc, Sa Pa). Không phân biệt dấu và chữ hoa.
         duration_days (Optional[int]): Số ngày của tour (Ví dụ: 1,2,3).
+        limit (Optional[int]): Số tour tối đa trả về, rẻ nhất trước (mặc định 10).
+        cursor (Optional[str]): Truyền next_cursor của lần tìm trước khi người dùng muốn xem thêm.
+        detailed (bool): True để lấy toàn bộ thông tin của từng tour.
+    Returns:
+        dict: results (danh sách tour), summary (tổng số, giá thấp nhất/cao nhất, số ngày có sẵn) và next_cursor.
     """
     query = {}
     if destination:
-        query["destination"] = destination
+        query["destination_key"] = place_key(destination)
     if duration_days:
         query["duration_days"] = duration_days
-    print(query)
-    results = list(db.tours.find(query))
-
-    return results
+    logger.debug("Tour search: %s", query)
+    db = await resolve(get_db)
+    await (await resolve(get_search_key_refresher)).refresh(db, "tours")
+    projection = hidden_search_keys("tours") if detailed else TOUR_FIELDS
+    return await paginated_search(db.tours, query, projection, TOUR_SORT, TOUR_SUMMARY, limit, cursor)
 
 @tool
-def search_hotels(
+async def search_hotels(
     location: Optional[str] = None,
     name: Optional[str] = None,
     price_tier: Optional[str] = None,
     checkin_date: Optional[str] = None,
     checkout_date: Optional[str] = None,
-) -> list[dict]:
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    detailed: bool = False,
+) -> dict:
     """
     Search for hotels based on location, name, price tier, check-in date, and check-out date.
 
     Args:
-        location (Optional[str]): The location of the hotel. Must include correct Vietnamese accents (e.g., "Đà Lạt", not "Da Lat"). Defaults to None.
-        name (Optional[str]): The name of the hotel. Defaults to None.
+        location (Optional[str]): The city or district of the hotel, e.g. "Đà Lạt". Accents, case and common aliases ("Da Lat", "Sài Gòn", "HCM") do not matter. Defaults to None.
+        name (Optional[str]): The name of the hotel, with or without accents. Defaults to None.
         price_tier (Optional[str]): The price tier of the hotel. Defaults to None. Examples: mid, luxury, budget
         checkin_date (Optional[str]): The check-in date in 'YYYY-MM-DD' format. Defaults to None.
         checkout_date (Optional[str]): The check-out date in 'YYYY-MM-DD' format. Defaults to None.
+        limit (Optional[int]): Maximum number of hotels to return, cheapest first. Defaults to 10.
+        cursor (Optional[str]): The next_cursor of a previous search, to show more results. Defaults to None.
+        detailed (bool): Return every field of each hotel instead of the main ones. Defaults to False.
 
     Returns:
-        list[dict]: A list of hotel dictionaries matching the search criteria.
+        dict: results (the matching hotels), summary (count, price range and price tiers of every match) and next_cursor.
     
     Notes: Date format must be in 'YYYY-MM-DD'. For example, "3/5" (spoken or written) should be converted to "2025-05-03".
     """
     query = {}
     if location:
-        query["location"] = location
+        query["location_key"] = place_key(location)
     if name:
-        query["name"] = name
+        query["name_key"] = fold(name)
     if price_tier:
         query["price_tier"] = price_tier
     if checkin_date:
@@ -77,12 +198,15 @@ def search_hotels(
     if checkout_date:
         query["checkout_date"] = checkout_date
     query["booked"] = 0
-    results = list(db.hotels.find(query))
-
-    return results
+    db = await resolve(get_db)
+    await (await resolve(get_search_key_refresher)).refresh(db, "hotels")
+    projection = hidden_search_keys("hotels") if detailed else HOTEL_FIELDS
+    return await paginated_search(db.hotels, query, projection, HOTEL_SORT, HOTEL_SUMMARY, limit, cursor)
 
 @tool
-def book_hotel(hotel_id: str, config: RunnableConfig) -> str:
+async def book_hotel(
+    hotel_id: str, config: RunnableConfig, tool_call_id: Annotated[str, InjectedToolCallId]
+) -> str:
     """
     Book a hotel by its ID.
 
@@ -98,68 +222,86 @@ def book_hotel(hotel_id: str, config: RunnableConfig) -> str:
     """
     configuration = config.get("configurable", {})
     user_id = configuration.get("user_id", None)
-    hotel = db['hotels'].find_one({"_id": ObjectId(hotel_id)})
-
-    if hotel:
-        if hotel.get("booked") == 1:
-            return f"This hotel {hotel_id} has already been booked."
-        else:
-            result = db["hotels"].update_one(
-                {"_id": ObjectId(hotel_id)},
-                {"$set": {"booked": 1}}
-            )
-            if result.modified_count:
-                db.hotel_bookings.insert_one({
-                "user_id": ObjectId(user_id),
-                "hotel_id": ObjectId(hotel_id),
-                "booking_time": datetime.now(),
-                "status": "confirmed"
-                })
-                return f"Hotel {hotel_id} successfully booked."
-            else:
-                return f"Failed to update booking status for hotel with ID {hotel_id}."
+    # A replayed tool call keeps its id and finds its booking; a new request is a new booking.
+    key = idempotency_key("hotel", user_id, hotel_id, tool_call_id)
+    result = await (await resolve(get_booking_engine)).book(HOTEL_BOOKING, user_id, hotel_id, key)
+
+    if result.status == "confirmed":
+        return f"Hotel {hotel_id} successfully booked."
+    elif result.status == "unavailable":
+        return f"This hotel {hotel_id} has already been booked."
+    elif result.status == "pending":
+        return f"The booking for hotel {hotel_id} is already being processed."
     else:
         return f"No hotel found with ID {hotel_id}."
     
+
+def _airport_filter(airports: str):
+    """Filter on one airport, or any of a comma-separated list of airports."""
+    codes = list(dict.fromkeys(airport_code(airport) for airport in airports.split(",") if airport.strip()))
+    return codes[0] if len(codes) == 1 else {"$in": codes}
+
+
 @tool
-def search_flights(
+async def search_flights(
     departure_airport: Optional[str] = None,
     arrival_airport: Optional[str] = None,
     airline: Optional[str] = None,
     departure_day : Optional[date | datetime] = None,
-) -> list[dict]:
+    flexible_days: int = 0,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    detailed: bool = False,
+) -> dict:
     """In ra các chuyến bay dựa vào sân bay khởi hành, sân bay đến, hãng hàng không hoặc
     thời gian khởi hành để người dùng mua vé
     Args:
-        departure_airport (Optional[str]): Mã IATA của sân bay khởi hành (VD: "HAN" cho Hà Nội).
-        arrival_airport (Optional[str]): Mã IATA của sân bay đến (VD: "SGN" cho Sài Gòn).
+        departure_airport (Optional[str]): Mã IATA hoặc tên thành phố của sân bay khởi hành (VD: "HAN" hoặc "Hà Nội").
+            Có thể truyền nhiều sân bay, cách nhau bởi dấu phẩy (VD: "HAN, HPH").
+        arrival_airport (Optional[str]): Mã IATA hoặc tên thành phố của sân bay đến (VD: "SGN" hoặc "Sài Gòn").
+            Có thể truyền nhiều sân bay, cách nhau bởi dấu phẩy.
         airline (Optional[str]): Hãng hàng không cụ thể cần tìm (VD: "Vietnam Airlines").
         departure_day (Optional[date | datetime]): Ngày khởi hành, định dạng YYYY-MM-DD.
             mặc định là năm 2025.
+        flexible_days (int): Tìm cả các ngày trước và sau departure_day, tối đa 7 ngày mỗi phía
+            (VD: 3 để tìm từ 3 ngày trước đến 3 ngày sau). Dùng khi người dùng linh hoạt về ngày
+            hoặc ngày đã chọn không có chuyến, thay vì tìm lại nhiều lần.
+        limit (Optional[int]): Số chuyến bay tối đa trả về, rẻ nhất trước (mặc định 10).
+        cursor (Optional[str]): Truyền next_cursor của lần tìm trước khi người dùng muốn xem thêm.
+        detailed (bool): True để lấy toàn bộ thông tin của từng chuyến bay.
+    Returns:
+        dict: results (danh sách chuyến bay), summary (tổng số, giá thấp nhất/cao nhất, các hãng bay,
+            giờ khởi hành sớm nhất/muộn nhất) và next_cursor. Khi flexible_days > 0, thêm days:
+            số chuyến bay và chuyến rẻ nhất của từng ngày trong khoảng tìm kiếm.
     """
     query = {}
     if departure_airport:
-        query["departure_airport"] = departure_airport
+        query["departure_airport"] = _airport_filter(departure_airport)
     if arrival_airport:
-        query["arrival_airport"] = arrival_airport
+        query["arrival_airport"] = _airport_filter(arrival_airport)
     if airline:
         query["airline"] = airline
+    extra_facets = None
     if departure_day:
-        print(departure_day)
-        print(type(departure_day ))
-        query["$expr"] = {
-            "$eq": [
-                {"$dateToString": {"format": "%Y-%m-%d", "date": "$departure_time"}},
-                departure_day.strftime("%Y-%m-%d")
-            ]
+        # Half-open range on the raw field so the departure_time index applies.
+        window = min(max(flexible_days, 0), MAX_FLEXIBLE_DAYS)
+        day_start = datetime.combine(departure_day, time.min)
+        query["departure_time"] = {
+            "$gte": day_start - timedelta(days=window),
+            "$lt": day_start + timedelta(days=window + 1),
         }
-    print(query)
-    results = list(db.flights.find(query))
-
-    return results
+        if window:
+            extra_facets = {"days": FLIGHT_DAYS}
+    logger.debug("Flight search: %s", query)
+    return await paginated_search(
+        (await resolve(get_db)).flights, query, None if detailed else FLIGHT_FIELDS, FLIGHT_SORT, FLIGHT_SUMMARY, limit, cursor,
+        extra_facets,
+    )
 
 @tool
-def book_flight(flight_id: str, config: RunnableConfig) -> str:
+async def book_flight(
+    flight_id: str, config: RunnableConfig, tool_call_id: Annotated[str, InjectedToolCallId]
+) -> str:
     """
     Đặt chuyến bay theo ID của chuyến bay.
     Lưu ý: Nếu người dùng đã chọn, hãy tìm flight_id từ danh sách chuyến bay đã trả về trước đó và tự động truyền vào khi gọi book_flight(flight_id, config) thay vì bắt người dùng nhập ID.
@@ -172,49 +314,49 @@ def book_flight(flight_id: str, config: RunnableConfig) -> str:
     """
     configuration = config.get("configurable", {})
     user_id = configuration.get("user_id", None)
-    balance_user = db.users.find_one({"_id": ObjectId(user_id)}, {"balance": 1, "_id": 0})['balance']
-    price = db.flights.find_one({"_id": ObjectId(flight_id)}, {"price": 1, "_id": 0})['price']
-    if balance_user < price:
-        return 'Tài khoản của bạn không đủ số dư'
-    else:
-        new_balance = balance_user - price
-        db.users.update_one({"_id": ObjectId(user_id)}, {"$set": {"balance": new_balance}})
-        db.bookings.insert_one({
-            "user_id": ObjectId(user_id),
-            "flight_id": ObjectId(flight_id),
-            "booking_time": datetime.now(),
-            "status": "confirmed"
-        })
-        return 'Bạn đã đặt vé thành công'
+    # A replayed tool call keeps its id and finds its booking; a new request is a new booking.
+    key = idempotency_key("flight", user_id, flight_id, tool_call_id)
+    result = await (await resolve(get_booking_engine)).book(FLIGHT_BOOKING, user_id, flight_id, key)
+    return _booking_message(result)
 
 @tool
-def search_shuttles(
+async def search_shuttles(
     from_airport: Optional[str] = None,
     to: Optional[str] = None,
     pickup_datetime : Optional[datetime] = None,
-) -> list[dict]:
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    detailed: bool = False,
+) -> dict:
     """In ra các danh sách xe đưa đón sân bay dựa vào sân bay, điểm đến hoặc
     thời gian đón để người dùng đặt xe.
-    lưu ý: tham số truyền vào cần là tiếng việt. Ví dụ:
-    from_airport(str): SGN
+    lưu ý: không phân biệt dấu, chữ hoa và tên gọi khác (VD: "Q1", "quan 1"). Ví dụ:
+    from_airport(str): SGN hoặc Sài Gòn
     to: Quận 1
+    limit: số xe tối đa trả về (mặc định 10).
+    cursor: truyền next_cursor của lần tìm trước khi người dùng muốn xem thêm.
+    detailed: True để lấy toàn bộ thông tin của từng xe.
+    Kết quả gồm results, summary (tổng số, khoảng giá, các điểm đến) và next_cursor.
     """
     query = {}
     if from_airport:
-        query["from_airport"] = from_airport
+        query["from_airport"] = airport_code(from_airport)
     if to:
-        query["to"] = to
+        query["to_key"] = place_key(to)
     if pickup_datetime:
-        print(pickup_datetime )
-        print(type(pickup_datetime))
         query["pickup_datetime"] = pickup_datetime
-    print(query)
-    results = list(db.airport_shuttles.find(query))
-
-    return results
+    logger.debug("Shuttle search: %s", query)
+    db = await resolve(get_db)
+    await (await resolve(get_search_key_refresher)).refresh(db, "airport_shuttles")
+    projection = hidden_search_keys("airport_shuttles") if detailed else SHUTTLE_FIELDS
+    return await paginated_search(
+        db.airport_shuttles, query, projection, SHUTTLE_SORT, SHUTTLE_SUMMARY, limit, cursor
+    )
 
 @tool
-def book_shuttle(shuttle_id: str, config: RunnableConfig) -> str:
+async def book_shuttle(
+    shuttle_id: str, config: RunnableConfig, tool_call_id: Annotated[str, InjectedToolCallId]
+) -> str:
     """
     Đặt shuttle theo ID của shuttle.
 
@@ -230,52 +372,44 @@ def book_shuttle(shuttle_id: str, config: RunnableConfig) -> str:
     """
     configuration = config.get("configurable", {})
     user_id = configuration.get("user_id", None)
-    balance_user = db.users.find_one({"_id": ObjectId(user_id)}, {"balance": 1, "_id": 0})['balance']
-    price = db.airport_shuttles.find_one({"_id": ObjectId(shuttle_id)}, {"price": 1, "_id": 0})['price']
-    if balance_user < price:
-        return 'Tài khoản của bạn không đủ số dư'
-    else:
-        new_balance = balance_user - price
-        db.users.update_one({"_id": ObjectId(user_id)}, {"$set": {"balance": new_balance}})
-        db.shuttle_bookings.insert_one({
-            "user_id": ObjectId(user_id),
-            "shuttle_id": ObjectId(shuttle_id),
-            "booking_time": datetime.now(),
-            "status": "confirmed"
-        })
-        return 'Bạn đã đặt vé thành công'
+    # A replayed tool call keeps its id and finds its booking; a new request is a new booking.
+    key = idempotency_key("shuttle", user_id, shuttle_id, tool_call_id)
+    result = await (await resolve(get_booking_engine)).book(SHUTTLE_BOOKING, user_id, shuttle_id, key)
+    return _booking_message(result)
 
 @tool
-def get_popular_tourist_destinations(query: str) -> str:
+async def get_popular_tourist_destinations(query: str) -> str:
     """
     Truy xuất thông tin về các địa điểm du lịch nổi bật ở Việt Nam.
     """
-    docs = vector_store.similarity_search(query)
-    return "\n\n".join([doc.page_content for doc in docs])
+    # Resolved off the loop: the first call may load and embed the corpus. The store
+    # and its version are read together, so a reload never mixes two corpora.
+    vector_store, corpus_version = await resolve(get_destinations)
+    cache = await resolve(get_destination_cache)
+    embedding = await vector_store.embeddings.aembed_query(query)
+    # Near-identical questions reuse the answer computed for the current corpus.
+    cached = cache.lookup(embedding, corpus_version)
+    if cached is not None:
+        return cached
+    docs = await vector_store.asimilarity_search_by_vector(embedding)
+    result = "\n\n".join([doc.page_content for doc in docs])
+    cache.store(embedding, result, corpus_version)
+    return result
 
 @tool
-def search_recall_memories(query: str, config: RunnableConfig) -> List[str]:
+async def search_recall_memories(query: str, config: RunnableConfig) -> List[str]:
     """Search for relevant memories."""
     configuration = config.get("configurable", {})
     user_id = configuration.get("user_id", None)
 
-    def _filter_function(doc: Document) -> bool:
-        return doc.metadata.get("user_id") == user_id
-
-    documents = vector_store.similarity_search(
-        query, k=3, filter=_filter_function
-    )
+    documents = await (await resolve(get_memory_store)).asearch(user_id, query, k=3)
     return [document.page_content for document in documents]
 
 @tool
-def save_recall_memory(memory: str, config: RunnableConfig) -> str:
+async def save_recall_memory(memory: str, config: RunnableConfig) -> str:
     """Save memory to vectorstore for later semantic retrieval."""
     configuration = config.get("configurable", {})
     user_id = configuration.get("user_id", None)
 
-    document = Document(
-        page_content=memory, id=str(uuid.uuid4()), metadata={"user_id": user_id}
-    )
-    vector_store.add_documents([document])
+    await (await resolve(get_memory_store)).aadd_memory(user_id, memory)
     return memory
-
@@ -0,0 +1,344 @@
+import asyncio
+import io
+import logging
+import math
+import wave
+from functools import lru_cache
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Sample rate of the 16-bit mono PCM chunks Chainlit streams from the microphone.
+INPUT_SAMPLE_RATE = 24000
+# Whisper works on 16 kHz audio; anything above is resampled away on the server.
+SPEECH_SAMPLE_RATE = 16000
+
+
+def encode_wav(samples: np.ndarray, sample_rate: int) -> bytes:
+    """16-bit mono PCM as a WAV file."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.astype(np.int16, copy=False).tobytes())
+    return buffer.getvalue()
+
+
+def _load_soundfile():
+    try:
+        import soundfile
+    except (ImportError, OSError):
+        logger.info("soundfile is not installed; audio is uploaded as WAV instead of FLAC")
+        return None
+    return soundfile
+
+
+soundfile = _load_soundfile()
+
+
+def encode_flac(samples: np.ndarray, sample_rate: int) -> Optional[bytes]:
+    """16-bit mono PCM as a FLAC file, or None without ``soundfile``."""
+    if soundfile is None:
+        return None
+    buffer = io.BytesIO()
+    soundfile.write(buffer, samples.astype(np.int16, copy=False), sample_rate, format="FLAC", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+@lru_cache(maxsize=8)
+def _resampling_filter(up: int, down: int, half_width: int = 16) -> np.ndarray:
+    """Kaiser-windowed sinc low-pass at the lower of the two Nyquist rates, with a gain of ``up``."""
+    cutoff = 0.5 / max(up, down)
+    n = np.arange(-half_width * max(up, down), half_width * max(up, down) + 1)
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(len(n), 5.0) * up
+    return taps
+
+
+def resample(samples: np.ndarray, from_rate: int, to_rate: int) -> np.ndarray:
+    """Resample int16 audio by a rational factor with a polyphase FIR filter.
+
+    Equivalent to upsampling by ``up``, low-pass filtering and keeping every
+    ``down``-th sample, but each output phase is a single ``np.convolve`` of the
+    input with a sub-filter, so no zero-stuffed signal is ever filtered.
+    """
+    if from_rate == to_rate or not len(samples):
+        return samples
+    divisor = math.gcd(from_rate, to_rate)
+    up, down = to_rate // divisor, from_rate // divisor
+    taps = _resampling_filter(up, down)
+    delay = len(taps) // 2
+    signal = samples.astype(np.float32)
+    # Filtered, upsampled signal: phase p holds the positions congruent to p modulo up.
+    upsampled = np.zeros(len(signal) * up + len(taps) - 1, dtype=np.float32)
+    for phase in range(up):
+        filtered = np.convolve(signal, taps[phase::up])
+        upsampled[phase::up][:len(filtered)] = filtered
+    output = upsampled[delay:delay + len(signal) * up:down]
+    return np.clip(np.round(output), -32768, 32767).astype(np.int16)
+
+
+def trim_silence(
+    samples: np.ndarray, sample_rate: int, threshold_db: float = -40.0, margin_ms: float = 100.0, frame_ms: float = 20.0
+) -> np.ndarray:
+    """Cut leading and trailing frames quieter than ``threshold_db`` below the loudest frame.
+
+    ``margin_ms`` of audio is kept on each side so word onsets and endings survive.
+    """
+    frame = max(int(sample_rate * frame_ms / 1000), 1)
+    count = len(samples) // frame
+    if not count:
+        return samples
+    frames = samples[:count * frame].astype(np.float32).reshape(count, frame)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    loud = np.flatnonzero(rms >= rms.max() * 10 ** (threshold_db / 20))
+    if not len(loud) or rms.max() == 0:
+        return samples[:0]
+    margin = int(sample_rate * margin_ms / 1000)
+    start = max(loud[0] * frame - margin, 0)
+    end = min((loud[-1] + 1) * frame + margin, len(samples))
+    return samples[start:end]
+
+
+def prepare_for_transcription(samples: np.ndarray, sample_rate: int) -> Optional[tuple[str, bytes, str]]:
+    """Smallest upload of an utterance that loses nothing the recognizer uses.
+
+    The audio is resampled to 16 kHz, trimmed of leading and trailing silence
+    and encoded as FLAC (lossless) when ``soundfile`` is installed, else as WAV.
+
+    Returns:
+        Optional[tuple[str, bytes, str]]: File name, content and MIME type, or
+        None when nothing but silence is left.
+    """
+    speech = trim_silence(resample(samples, sample_rate, SPEECH_SAMPLE_RATE), SPEECH_SAMPLE_RATE)
+    if not len(speech):
+        return None
+    flac = encode_flac(speech, SPEECH_SAMPLE_RATE)
+    if flac is not None:
+        return "audio.flac", flac, "audio/flac"
+    return "audio.wav", encode_wav(speech, SPEECH_SAMPLE_RATE), "audio/wav"
+
+
+class RingBuffer:
+    """Fixed-size circular buffer of int16 samples, addressed by absolute position.
+
+    Position ``n`` is the n-th sample ever appended. Samples stay readable until
+    ``release`` moves ``start`` past them, which frees their space.
+    """
+
+    def __init__(self, capacity: int):
+        self._data = np.zeros(capacity, dtype=np.int16)
+        self.capacity = capacity
+        self.start = 0
+        self.end = 0
+
+    def free(self) -> int:
+        return self.capacity - (self.end - self.start)
+
+    def append(self, samples: np.ndarray) -> None:
+        if len(samples) > self.free():
+            raise OverflowError(f"{len(samples)} samples do not fit in {self.free()} free slots")
+        offset = self.end % self.capacity
+        head = min(len(samples), self.capacity - offset)
+        self._data[offset:offset + head] = samples[:head]
+        self._data[:len(samples) - head] = samples[head:]
+        self.end += len(samples)
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """Copy of the samples at positions ``[start, end)``."""
+        if start < self.start or end > self.end:
+            raise IndexError(f"[{start}, {end}) is outside the buffered [{self.start}, {self.end})")
+        indices = np.arange(start, end) % self.capacity
+        return self._data[indices]
+
+    def release(self, position: int) -> None:
+        """Drop every sample before ``position``."""
+        self.start = max(self.start, min(position, self.end))
+
+
+def _rms(frame: np.ndarray) -> float:
+    return float(np.sqrt(np.mean(frame.astype(np.float32) ** 2)))
+
+
+class EnergyVAD:
+    """Frame-level voice activity detection on signal energy.
+
+    A frame is speech when its RMS is above ``ratio`` times the noise floor,
+    and at least ``min_rms``. The floor is seeded by ``calibrate`` from the
+    quietest of the first frames, drops at once to any quieter frame and rises
+    slowly with the frames judged silent.
+    """
+
+    def __init__(self, min_rms: float = 100.0, ratio: float = 3.0, smoothing: float = 0.05):
+        self.min_rms = min_rms
+        self.ratio = ratio
+        self.smoothing = smoothing
+        self.noise_floor: Optional[float] = None
+
+    def calibrate(self, frames: list[np.ndarray]) -> None:
+        """Seed the noise floor from the quietest frame, so speech from the first frame is still speech."""
+        self.noise_floor = min(_rms(frame) for frame in frames)
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        rms = _rms(frame)
+        if self.noise_floor is None:
+            self.noise_floor = rms
+        speech = rms >= max(self.min_rms, self.ratio * self.noise_floor)
+        if not speech:
+            self.noise_floor += self.smoothing * (rms - self.noise_floor)
+        self.noise_floor = min(self.noise_floor, rms)
+        return speech
+
+
+class StreamingTranscriber:
+    """Split a recording into utterances at pauses and transcribe each while recording goes on.
+
+    Samples go into a ring buffer and through ``EnergyVAD`` one frame at a time.
+    A segment ends after ``silence_ms`` of silence following speech, or once it
+    is ``max_segment_seconds`` long; it is then handed to ``transcribe`` on its
+    own task, so earlier segments are transcribed while the user keeps talking.
+    Silence between segments is dropped. Audio beyond ``max_seconds`` is
+    ignored. ``finish`` transcribes the last segment and joins every
+    transcript in order.
+
+    Detection starts once ``calibration_ms`` of audio has arrived, from which
+    the VAD takes its noise floor. Until a first segment is cut, the whole
+    recording is also kept, so that audio the VAD never took for speech (too
+    quiet, or without a pause to calibrate on) is transcribed in one piece by
+    ``finish`` rather than lost.
+    """
+
+    def __init__(
+        self,
+        transcribe: Callable[[np.ndarray, int], Awaitable[str]],
+        sample_rate: int = INPUT_SAMPLE_RATE,
+        max_seconds: float = 120.0,
+        silence_ms: float = 700.0,
+        min_speech_ms: float = 250.0,
+        max_segment_seconds: float = 30.0,
+        frame_ms: float = 30.0,
+        preroll_ms: float = 200.0,
+        calibration_ms: float = 500.0,
+        vad: Optional[EnergyVAD] = None,
+    ):
+        self.transcribe = transcribe
+        self.sample_rate = sample_rate
+        self.max_samples = int(max_seconds * sample_rate)
+        self.frame = int(frame_ms * sample_rate / 1000)
+        self.silence_frames = max(int(silence_ms / frame_ms), 1)
+        self.min_speech_frames = max(int(min_speech_ms / frame_ms), 1)
+        self.max_segment = int(max_segment_seconds * sample_rate)
+        self.preroll = int(preroll_ms * sample_rate / 1000)
+        self.vad = vad or EnergyVAD()
+        # Room for the longest segment plus the chunk being appended.
+        self._ring = RingBuffer(self.max_segment + sample_rate)
+        self.calibration = min(max(int(calibration_ms * sample_rate / 1000), self.frame), self._ring.capacity)
+        self._unsegmented: list[np.ndarray] = []
+        self._scanned = 0
+        self._segment_start: Optional[int] = None
+        self._speech_frames = 0
+        self._silence_run = 0
+        self._tasks: list[asyncio.Task] = []
+        self.segments: list[np.ndarray] = []
+        self.stats = {"received_samples": 0, "segments": 0, "truncated": False, "unsegmented": False}
+
+    @property
+    def received_seconds(self) -> float:
+        return self.stats["received_samples"] / self.sample_rate
+
+    def feed(self, pcm: bytes) -> bool:
+        """Add a chunk of 16-bit PCM.
+
+        Returns:
+            bool: False once the recording reached ``max_seconds``; later chunks are ignored.
+        """
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        room = self.max_samples - self.stats["received_samples"]
+        if len(samples) > room:
+            if not self.stats["truncated"]:
+                logger.info("Recording longer than %.0f s, ignoring the rest", self.max_samples / self.sample_rate)
+            self.stats["truncated"] = True
+            samples = samples[:room]
+        self.stats["received_samples"] += len(samples)
+        if not self.segments and len(samples):
+            self._unsegmented.append(samples)
+        while len(samples):
+            piece, samples = samples[:self._ring.free()], samples[self._ring.free():]
+            self._ring.append(piece)
+            self._scan()
+        return not self.stats["truncated"]
+
+    def _calibrate(self) -> None:
+        count = (self._ring.end - self._scanned) // self.frame
+        if count:
+            self.vad.calibrate([
+                self._ring.read(self._scanned + n * self.frame, self._scanned + (n + 1) * self.frame) for n in range(count)
+            ])
+
+    def _scan(self) -> None:
+        if self.vad.noise_floor is None:
+            if self._ring.end - self._scanned < self.calibration:
+                return
+            self._calibrate()
+        while self._ring.end - self._scanned >= self.frame:
+            frame_end = self._scanned + self.frame
+            if self.vad.is_speech(self._ring.read(self._scanned, frame_end)):
+                if self._segment_start is None:
+                    self._segment_start = max(self._scanned - self.preroll, self._ring.start)
+                self._speech_frames += 1
+                self._silence_run = 0
+            elif self._segment_start is not None:
+                self._silence_run += 1
+            self._scanned = frame_end
+
+            if self._segment_start is None:
+                # Keep only the pre-roll ahead of the next utterance.
+                self._ring.release(self._scanned - self.preroll)
+            elif self._silence_run >= self.silence_frames:
+                self._cut(self._scanned - self._silence_run * self.frame + self.frame)
+            elif self._scanned - self._segment_start >= self.max_segment:
+                self._cut(self._scanned)
+
+    def _cut(self, end: int) -> None:
+        """Close the current segment at ``end``, transcribing it if it held enough speech."""
+        if self._speech_frames >= self.min_speech_frames:
+            segment = self._ring.read(self._segment_start, end)
+            self.segments.append(segment)
+            self._unsegmented = []
+            self.stats["segments"] += 1
+            self._tasks.append(asyncio.ensure_future(self.transcribe(segment, self.sample_rate)))
+        self._ring.release(end)
+        self._segment_start = None
+        self._speech_frames = 0
+        self._silence_run = 0
+
+    async def finish(self) -> str:
+        """Transcribe the trailing segment and return the whole transcript."""
+        if self.vad.noise_floor is None:
+            # Shorter than the calibration window: calibrate on what there is.
+            self._calibrate()
+            self._scan()
+        if self._segment_start is not None:
+            self._cut(self._scanned)
+        if not self.segments and self._unsegmented:
+            # No utterance detected: let the recognizer judge the whole recording.
+            self.segments.append(np.concatenate(self._unsegmented))
+            self._unsegmented = []
+            self.stats["unsegmented"] = True
+            self._tasks.append(asyncio.ensure_future(self.transcribe(self.segments[0], self.sample_rate)))
+        results = await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        texts = []
+        for number, result in enumerate(results):
+            if isinstance(result, BaseException):
+                # One lost segment should not cost the user the whole recording.
+                logger.warning("Transcription of segment %d failed: %r", number, result)
+            elif result and result.strip():
+                texts.append(result.strip())
+        return " ".join(texts)
+
+    def audio(self) -> np.ndarray:
+        """Every transcribed segment, back to back."""
+        return np.concatenate(self.segments) if self.segments else np.zeros(0, dtype=np.int16)
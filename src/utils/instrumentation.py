@@ -0,0 +1,210 @@
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Emit OpenTelemetry spans for nodes, tools and model calls. Spans go to the
+# tracer provider configured by the process (e.g. opentelemetry-instrument).
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+
+
+def _get_tracer():
+    if not TRACING_ENABLED:
+        return None
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning("TRACING_ENABLED is set but opentelemetry-api is not installed; tracing is off")
+        return None
+    return trace.get_tracer("travel-support-bot")
+
+
+tracer = _get_tracer()
+
+
+def _start_span(name: str, attributes: dict, parent_span: Any = None) -> Any:
+    if tracer is None:
+        return None
+    from opentelemetry import trace
+
+    context = trace.set_span_in_context(parent_span) if parent_span is not None else None
+    return tracer.start_span(name, context=context, attributes={k: v for k, v in attributes.items() if v is not None})
+
+
+def _end_span(span: Any, error: Optional[BaseException] = None) -> None:
+    if span is None:
+        return
+    if error is not None:
+        from opentelemetry.trace import Status, StatusCode
+
+        span.record_exception(error)
+        span.set_status(Status(StatusCode.ERROR, type(error).__name__))
+    span.end()
+
+
+@dataclass
+class _Run:
+    kind: str
+    name: str
+    labels: dict[str, str]
+    dialog_state: Optional[str] = None
+    span: Any = None
+    start: float = field(default_factory=time.perf_counter)
+
+
+class InstrumentationHandler(BaseCallbackHandler):
+    """Records every graph node, tool run and chat model call.
+
+    Each run adds its duration to a histogram (``graph_node_duration_seconds``,
+    ``tool_duration_seconds``, ``llm_request_duration_seconds``) and failures to
+    an ``*_errors_total`` counter; chat model calls also count input and output
+    tokens. With ``TRACING_ENABLED``, each run is a span tagged with the
+    ``thread_id`` and dialog state, nested under the node that made it.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._runs: dict[UUID, _Run] = {}
+        # Every chain's parent, so tool and model runs find their node through
+        # the runnables in between.
+        self._parents: dict[UUID, Optional[UUID]] = {}
+
+    def _ancestor(self, parent_run_id: Optional[UUID]) -> Optional[_Run]:
+        while parent_run_id is not None:
+            if run := self._runs.get(parent_run_id):
+                return run
+            parent_run_id = self._parents.get(parent_run_id)
+        return None
+
+    def _start(
+        self, kind: str, name: str, labels: dict[str, str], run_id: UUID, parent_run_id: Optional[UUID],
+        metadata: Optional[dict], dialog_state: Optional[str] = None,
+    ) -> None:
+        parent = self._ancestor(parent_run_id)
+        dialog_state = dialog_state or (parent.dialog_state if parent else None)
+        span = _start_span(
+            f"{kind} {name}",
+            {"thread_id": (metadata or {}).get("thread_id"), "dialog_state": dialog_state, **labels},
+            parent.span if parent else None,
+        )
+        self._runs[run_id] = _Run(kind, name, labels, dialog_state, span)
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None) -> Optional[_Run]:
+        self._parents.pop(run_id, None)
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return None
+        metrics.observe(
+            {"node": "graph_node_duration_seconds", "tool": "tool_duration_seconds", "llm": "llm_request_duration_seconds"}[run.kind],
+            time.perf_counter() - run.start,
+            **run.labels,
+        )
+        if error is not None:
+            metrics.inc(
+                {"node": "graph_node_errors_total", "tool": "tool_errors_total", "llm": "llm_errors_total"}[run.kind],
+                error=type(error).__name__,
+                **run.labels,
+            )
+        _end_span(run.span, error)
+        return run
+
+    # Graph nodes
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        self._parents[run_id] = parent_run_id
+        node = (metadata or {}).get("langgraph_node")
+        if node and kwargs.get("name") == node:
+            dialog_state = inputs.get("dialog_state") if isinstance(inputs, dict) else None
+            self._start(
+                "node", node, {"node": node}, run_id, parent_run_id, metadata,
+                dialog_state[-1] if dialog_state else "primary_assistant",
+            )
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    # Tools
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name", "unknown")
+        self._start("tool", name, {"tool": name}, run_id, parent_run_id, metadata)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    # Chat models
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        metadata = metadata or {}
+        parent = self._ancestor(parent_run_id)
+        labels = {
+            "model": metadata.get("ls_model_name") or (serialized or {}).get("name", "unknown"),
+            "caller": parent.name if parent else metadata.get("caller", "unknown"),
+        }
+        self._start("llm", labels["model"], labels, run_id, parent_run_id, metadata)
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs):
+        run = self._end(run_id)
+        if run is None:
+            return
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    metrics.inc("llm_tokens_total", usage.get("input_tokens", 0), direction="input", **run.labels)
+                    metrics.inc("llm_tokens_total", usage.get("output_tokens", 0), direction="output", **run.labels)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+
+instrumentation = InstrumentationHandler()
+
+
+class ExternalCall:
+    """Handle of an ``external_call`` block, to report token usage."""
+
+    def __init__(self, service: str, model: str):
+        self.labels = {"service": service, "model": model}
+
+    def add_tokens(self, input_tokens: Optional[int], output_tokens: Optional[int]) -> None:
+        metrics.inc("external_tokens_total", input_tokens or 0, direction="input", **self.labels)
+        metrics.inc("external_tokens_total", output_tokens or 0, direction="output", **self.labels)
+
+
+@asynccontextmanager
+async def external_call(service: str, model: str, thread_id: Optional[str] = None) -> AsyncIterator[ExternalCall]:
+    """Time a call to an external model API outside LangChain, e.g. Groq.
+
+    Records ``external_call_duration_seconds`` and ``external_call_errors_total``
+    by service and model, plus a span when tracing is enabled.
+    """
+    call = ExternalCall(service, model)
+    span = _start_span(f"external {service}", {"thread_id": thread_id, **call.labels})
+    start = time.perf_counter()
+    try:
+        yield call
+    except BaseException as error:
+        metrics.inc("external_call_errors_total", error=type(error).__name__, **call.labels)
+        _end_span(span, error)
+        raise
+    finally:
+        metrics.observe("external_call_duration_seconds", time.perf_counter() - start, **call.labels)
+    _end_span(span)
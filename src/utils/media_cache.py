@@ -0,0 +1,75 @@
+import asyncio
+import hashlib
+from typing import Awaitable, Callable
+
+from diskcache import Cache
+
+
+class MediaCache:
+    """Persistent results of model calls on media, keyed by a hash of their content.
+
+    The key is the SHA-256 of the kind of call, the model, the prompt and the
+    prepared media bytes, so the same image or recording sent again gets the
+    stored analysis or transcript without a remote call. Entries live in a
+    disk cache shared by every worker process and are evicted least recently
+    used first beyond ``size_limit_mb``. Concurrent calls for the same key
+    share one remote call.
+    """
+
+    def __init__(self, directory: str, size_limit_mb: float = 64):
+        self._cache = Cache(
+            directory, size_limit=int(size_limit_mb * 1024 * 1024), eviction_policy="least-recently-used"
+        )
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.stats = {"hits": 0, "misses": 0, "shared": 0}
+
+    @staticmethod
+    def key(kind: str, content: bytes, model: str, prompt: str = "") -> str:
+        digest = hashlib.sha256()
+        for part in (kind, model, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        digest.update(content)
+        return f"{kind}:{digest.hexdigest()}"
+
+    def volume(self) -> int:
+        """Bytes used on disk."""
+        return self._cache.volume()
+
+    async def get_or_compute(
+        self, kind: str, content: bytes, model: str, prompt: str, compute: Callable[[], Awaitable[str]]
+    ) -> str:
+        """Return the stored result for this media, or compute and store it.
+
+        Empty results are returned but not stored, so a failed or blank answer
+        is retried next time.
+        """
+        key = self.key(kind, content, model, prompt)
+        if key in self._inflight:
+            self.stats["shared"] += 1
+            return await asyncio.shield(self._inflight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await asyncio.to_thread(self._cache.get, key)
+            if result is not None:
+                self.stats["hits"] += 1
+            else:
+                self.stats["misses"] += 1
+                result = await compute()
+                if result:
+                    await asyncio.to_thread(self._cache.set, key, result)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Waiters get the error; retrieve it here so an unawaited future does not log it.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
@@ -0,0 +1,184 @@
+import re
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.utils.text import fold
+
+# Folded phrases that disclose something lasting about the user: preferences,
+# family, health, home, work. A message containing one always goes to the
+# extractor, however short.
+PERSONAL_PHRASES = [
+    "toi thich", "toi khong thich", "toi ghet", "toi yeu", "toi so", "toi hay", "toi thuong", "toi luon",
+    "toi uu tien", "toi la", "toi ten", "ten toi", "toi song", "nha toi", "toi lam", "cong viec", "tuoi",
+    "di ung", "an chay", "an kieng", "toi bi", "say xe", "say may bay", "xe lan", "mang thai", "gia dinh",
+    "vo toi", "chong toi", "con toi", "bo me", "ban gai", "ban trai", "sinh nhat", "ky niem", "trang mat",
+    "ngan sach", "thanh vien",
+    "i like", "i love", "i hate", "i prefer", "i always", "i never", "i usually", "i am a", "i m a", "my name",
+    "i live", "i work", "years old", "allergic", "allergy", "vegetarian", "vegan", "halal", "kosher",
+    "wheelchair", "pregnant", "afraid of", "my wife", "my husband", "my kids", "my children", "my son",
+    "my daughter", "my family", "my parents", "my partner", "birthday", "anniversary", "honeymoon", "budget",
+    "loyalty", "member",
+]
+_PERSONAL = re.compile(r"\b(?:" + "|".join(re.escape(phrase) for phrase in PERSONAL_PHRASES) + r")\b")
+
+# Folded words of acknowledgements, confirmations and picks from a list
+# ("ok", "cảm ơn", "book the first one", "đặt chuyến đầu tiên nhé"). A message
+# made of nothing else carries no memory.
+FILLER_WORDS = frozenset(
+    "ok oke okay yes yeah yep no nope sure please thanks thank you so much very great good fine perfect done "
+    "s all the a an one it this that first second third last next other cheapest book take pick choose select confirm go "
+    "vang da u uh um co khong dung roi duoc cam on ban nhieu lam nhe nha a oi tot hay qua xong dong y chac chan "
+    "dat chon lay xac nhan cai chuyen phong ve tour xe nay do kia re nhat dau tien thu hai ba bon nam cuoi cung luon "
+    "di".split()
+)
+
+# Labeled messages for the nearest-neighbor vote: what the extractor keeps,
+# and everyday requests it always discards.
+MEMORABLE = "memorable"
+ROUTINE = "routine"
+
+MEMORY_GATE_EXAMPLES: dict[str, list[str]] = {
+    MEMORABLE: [
+        "Tôi bị dị ứng hải sản",
+        "Tôi thích khách sạn gần biển, yên tĩnh",
+        "Lần nào tôi cũng bay Vietnam Airlines",
+        "Tôi đi cùng vợ và hai con nhỏ",
+        "Ngân sách của tôi khoảng 5 triệu mỗi chuyến",
+        "Tôi sống ở Quận 7",
+        "Mẹ tôi đi lại khó khăn, cần xe lăn",
+        "Chúng tôi đi tuần trăng mật",
+        "Tôi không ăn được cay",
+        "Tôi thường đi công tác Đà Nẵng mỗi tháng",
+        "I'm allergic to peanuts",
+        "I always prefer a window seat",
+        "We are traveling with a newborn baby",
+        "I only stay in five star hotels",
+        "My husband gets seasick, so no boat tours",
+        "I'm a vegetarian",
+    ],
+    ROUTINE: [
+        "Tìm chuyến bay từ Hà Nội đến Sài Gòn",
+        "Có tour nào đi Phú Quốc không?",
+        "Thời tiết ở Đà Nẵng hôm nay thế nào?",
+        "Khách sạn ở Đà Lạt giá bao nhiêu?",
+        "Đặt chuyến bay lúc 8 giờ sáng",
+        "Cho tôi xem thêm lựa chọn khác",
+        "Có chuyến nào rẻ hơn không?",
+        "Đổi sang ngày mai được không?",
+        "Tôi cần xe từ sân bay về Quận 1",
+        "Hủy đặt phòng giúp tôi",
+        "Find me flights from SGN to DAD tomorrow",
+        "Book the 9 am flight",
+        "Show me cheaper hotels",
+        "How much does the Sa Pa tour cost?",
+        "What's the weather like in Hanoi?",
+        "Can you check again?",
+    ],
+}
+
+
+@dataclass(frozen=True)
+class GateDecision:
+    """Whether a message goes to the memory extractor, and why."""
+
+    extract: bool
+    # "personal", "short", "filler", "routine" or "memorable"
+    reason: str
+    # Share of the neighbors' similarity-weighted vote won by ROUTINE, when the classifier ran
+    routine_confidence: Optional[float] = None
+
+
+class MemoryGate:
+    """Local pre-filter deciding whether a message is worth a memory-extractor call.
+
+    Checks run cheapest first:
+
+    1. A message with a personal phrase (``PERSONAL_PHRASES``) is extracted.
+    2. A message under ``min_words`` words is skipped.
+    3. A message made only of ``FILLER_WORDS`` is skipped.
+    4. Otherwise its ``k`` most similar labeled examples vote, weighted by
+       similarity. The message is skipped only when ROUTINE wins at least
+       ``min_confidence`` of the vote. Without ``embeddings`` this check is
+       left out and the message is extracted.
+
+    Doubtful messages are extracted, so the gate trades LLM calls for a few
+    missed memories only when it is confident.
+    """
+
+    def __init__(
+        self,
+        embeddings: Optional[Embeddings] = None,
+        examples: dict[str, list[str]] = MEMORY_GATE_EXAMPLES,
+        min_words: int = 3,
+        k: int = 5,
+        min_confidence: float = 0.75,
+    ):
+        self.embeddings = embeddings
+        self.min_words = min_words
+        self.k = k
+        self.min_confidence = min_confidence
+        self.stats = {"checked": 0, "skipped": 0, "personal": 0, "short": 0, "filler": 0, "routine": 0, "memorable": 0}
+        self._labels: list[str] = []
+        self._vectors: Optional[np.ndarray] = None
+        if embeddings is not None:
+            self._labels = [label for label, texts in examples.items() for _ in texts]
+            vectors = np.asarray(
+                embeddings.embed_documents([text for texts in examples.values() for text in texts]), dtype=np.float32
+            )
+            self._vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def skip_rate(self) -> float:
+        return self.stats["skipped"] / self.stats["checked"] if self.stats["checked"] else 0.0
+
+    def screen(self, text: str) -> Optional[GateDecision]:
+        """Decide from the text alone, or return None when the classifier must decide."""
+        words = fold(text).split()
+        if _PERSONAL.search(" ".join(words)):
+            return GateDecision(True, "personal")
+        if len(words) < self.min_words:
+            return GateDecision(False, "short")
+        if all(word in FILLER_WORDS or word.isdigit() for word in words):
+            return GateDecision(False, "filler")
+        return None
+
+    def classify(self, embedding: Sequence[float]) -> GateDecision:
+        """Vote of the labeled examples nearest to a message embedding."""
+        vector = np.asarray(embedding, dtype=np.float32)
+        similarities = self._vectors @ (vector / max(float(np.linalg.norm(vector)), 1e-12))
+        votes = {MEMORABLE: 0.0, ROUTINE: 0.0}
+        for index in np.argsort(-similarities)[:self.k]:
+            votes[self._labels[index]] += max(float(similarities[index]), 0.0)
+        total = sum(votes.values())
+        confidence = votes[ROUTINE] / total if total else 0.0
+        if confidence >= self.min_confidence:
+            return GateDecision(False, "routine", confidence)
+        return GateDecision(True, "memorable", confidence)
+
+    def _record(self, decision: GateDecision) -> GateDecision:
+        self.stats["checked"] += 1
+        self.stats[decision.reason] += 1
+        if not decision.extract:
+            self.stats["skipped"] += 1
+        return decision
+
+    def check(self, text: str) -> GateDecision:
+        decision = self.screen(text)
+        if decision is None:
+            if self._vectors is None:
+                decision = GateDecision(True, "memorable")
+            else:
+                decision = self.classify(self.embeddings.embed_query(text))
+        return self._record(decision)
+
+    async def acheck(self, text: str) -> GateDecision:
+        """Async version of ``check``; the message is embedded only when the heuristics cannot decide."""
+        decision = self.screen(text)
+        if decision is None:
+            if self._vectors is None:
+                decision = GateDecision(True, "memorable")
+            else:
+                decision = self.classify(await self.embeddings.aembed_query(text))
+        return self._record(decision)
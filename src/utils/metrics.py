@@ -0,0 +1,141 @@
+import bisect
+import logging
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+# Upper bounds in seconds, from a fast Mongo lookup to a slow LLM turn.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = logging.getLogger(__name__)
+
+
+def _key(name: str, labels: dict[str, str]) -> tuple[str, tuple[tuple[str, str], ...]]:
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _label_text(labels: tuple[tuple[str, str], ...], extra: Optional[tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Process-wide counters, histograms and gauges, identified by a name and optional labels.
+
+    ``render_prometheus`` exports everything in the Prometheus text format.
+    Gauges are read from callbacks at export time, so components keep their own
+    ``stats`` and the registry only samples them.
+    """
+
+    def __init__(self):
+        self._counters: defaultdict[tuple, float] = defaultdict(float)
+        self._histograms: dict[tuple, _Histogram] = {}
+        self._gauges: dict[str, Callable[[], dict]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """Add ``value`` to a counter, e.g. ``metrics.inc("llm_calls_total", outcome="ok")``."""
+        with self._lock:
+            self._counters[_key(name, labels)] += value
+
+    def get(self, name: str, **labels: str) -> float:
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0.0)
+
+    def observe(self, name: str, value: float, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **labels: str) -> None:
+        """Record one sample, e.g. a duration in seconds, in a histogram."""
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def register_gauge(self, name: str, read: Callable[[], dict]) -> None:
+        """Export ``read()`` as gauges ``<name>_<key>``, e.g. a component's ``stats`` dict."""
+        self._gauges[name] = read
+
+    def snapshot(self) -> dict[str, float]:
+        """Every counter as ``name{label="value",...}`` -> value."""
+        with self._lock:
+            counters = dict(self._counters)
+        return {f"{name}{_label_text(labels)}": value for (name, labels), value in sorted(counters.items())}
+
+    def render_prometheus(self) -> str:
+        """Every metric in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (list(h.buckets), list(h.counts), h.sum, h.count)) for key, h in self._histograms.items()
+            )
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_label_text(labels)} {value:g}")
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_label_text(labels, ('le', f'{bound:g}'))} {cumulative}")
+            lines.append(f"{name}_bucket{_label_text(labels, ('le', '+Inf'))} {count}")
+            lines.append(f"{name}_sum{_label_text(labels)} {total:g}")
+            lines.append(f"{name}_count{_label_text(labels)} {count}")
+        for name, read in sorted(self._gauges.items()):
+            try:
+                values = read()
+            except Exception:
+                logger.exception("Reading gauge %s failed", name)
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)):
+                    lines.append(f"# TYPE {name}_{key} gauge")
+                    lines.append(f"{name}_{key} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        body = metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve ``render_prometheus`` for scraping on a background thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
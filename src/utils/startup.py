@@ -0,0 +1,115 @@
+import asyncio
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+_UNSET = object()
+
+
+class StartupReport:
+    """Import and initialization time per component, in seconds."""
+
+    def __init__(self):
+        self.timings: dict[str, dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, component: str, phase: str, seconds: float) -> None:
+        with self._lock:
+            phases = self.timings.setdefault(component, {})
+            phases[phase] = phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def measure(self, component: str, phase: str):
+        """Time the enclosed block and add it to ``component``'s ``phase``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(component, phase, time.perf_counter() - start)
+
+    def total(self) -> float:
+        with self._lock:
+            return sum(sum(phases.values()) for phases in self.timings.values())
+
+    def format(self) -> str:
+        """Render the report as a fixed-width table, slowest component first."""
+        with self._lock:
+            timings = {component: dict(phases) for component, phases in self.timings.items()}
+        rows = sorted(timings.items(), key=lambda item: -sum(item[1].values()))
+        lines = [f"{'component':<28}{'import (s)':>12}{'init (s)':>12}{'total (s)':>12}"]
+        for component, phases in rows:
+            imported = phases.get("import", 0.0)
+            initialized = phases.get("init", 0.0)
+            lines.append(f"{component:<28}{imported:>12.3f}{initialized:>12.3f}{imported + initialized:>12.3f}")
+        lines.append(f"{'total':<28}{'':>12}{'':>12}{self.total():>12.3f}")
+        return "\n".join(lines)
+
+
+startup_report = StartupReport()
+
+
+def lazy_singleton(component: str) -> Callable[[Callable[[], T]], Callable[[], T]]:
+    """Turn a zero-argument factory into a thread-safe accessor that builds once.
+
+    The first call runs the factory and records its duration under ``component``
+    in ``startup_report``. Time spent in ``startup_report.measure(component,
+    "import")`` blocks or in other accessors called by the factory is reported
+    under those entries, not as this component's init time.
+
+    Callers block on a lock until the instance is built, including while
+    ``warm_up`` builds it in another thread. Coroutines must therefore not call
+    an accessor directly: doing so blocks the event loop, and every session on
+    it, for the whole build. They use ``await resolve(accessor)`` instead.
+    """
+
+    def decorator(factory: Callable[[], T]) -> Callable[[], T]:
+        lock = threading.Lock()
+        instance = _UNSET
+
+        @functools.wraps(factory)
+        def accessor() -> T:
+            nonlocal instance
+            if instance is _UNSET:
+                with lock:
+                    if instance is _UNSET:
+                        recorded_before = startup_report.total()
+                        start = time.perf_counter()
+                        value = factory()
+                        elapsed = time.perf_counter() - start
+                        # Exclude time already recorded by imports and nested accessors.
+                        nested = startup_report.total() - recorded_before
+                        startup_report.record(component, "init", max(elapsed - nested, 0.0))
+                        instance = value
+            return instance
+
+        def is_initialized() -> bool:
+            return instance is not _UNSET
+
+        def rebuild() -> T:
+            """Run the factory again and serve its result; callers get the old instance until then."""
+            nonlocal instance
+            with lock:
+                instance = factory()
+            return instance
+
+        accessor.is_initialized = is_initialized
+        accessor.rebuild = rebuild
+        return accessor
+
+    return decorator
+
+
+async def resolve(accessor: Callable[[], T]) -> T:
+    """Get a ``lazy_singleton`` instance from a coroutine without blocking the event loop.
+
+    A built instance is returned right away. Otherwise the accessor runs in a
+    worker thread, so waiting for the build, whether started here or by
+    ``warm_up``, holds up only the calling task.
+    """
+    if getattr(accessor, "is_initialized", lambda: False)():
+        return accessor()
+    return await asyncio.to_thread(accessor)
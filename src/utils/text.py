@@ -0,0 +1,74 @@
+import re
+import unicodedata
+from typing import Optional
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+# "Q1", "Q.1", "quận 1", "district 1" -> "quan 1"
+_DISTRICT = re.compile(r"^(?:q|quan|district|dist)\s*(\d{1,2})$")
+_CITY_PREFIX = re.compile(r"^(?:tp|thanh pho|city of)\s+")
+_CITY_SUFFIX = re.compile(r"\s+(?:city|province|tinh)$")
+
+# Other names of a place, folded, mapped to its folded canonical name.
+PLACE_ALIASES = {
+    **dict.fromkeys(
+        ["sai gon", "saigon", "hcm", "hcmc", "tphcm", "sgn", "tan son nhat", "ho chi minh"], "ho chi minh"
+    ),
+    **dict.fromkeys(["hanoi", "hn", "han", "noi bai"], "ha noi"),
+    **dict.fromkeys(["danang", "dad"], "da nang"),
+    **dict.fromkeys(["dalat", "dli", "lien khuong"], "da lat"),
+    **dict.fromkeys(["pqc"], "phu quoc"),
+    **dict.fromkeys(["cxr", "cam ranh"], "nha trang"),
+    **dict.fromkeys(["haiphong", "hph", "cat bi"], "hai phong"),
+    **dict.fromkeys(["thua thien hue", "hui", "phu bai"], "hue"),
+    **dict.fromkeys(["sapa"], "sa pa"),
+    **dict.fromkeys(["halong", "vinh ha long", "ha long bay"], "ha long"),
+    **dict.fromkeys(["hoian"], "hoi an"),
+}
+
+# IATA code of the airport serving each canonical place.
+AIRPORT_CODES = {
+    "ho chi minh": "SGN",
+    "ha noi": "HAN",
+    "da nang": "DAD",
+    "da lat": "DLI",
+    "phu quoc": "PQC",
+    "nha trang": "CXR",
+    "hai phong": "HPH",
+    "hue": "HUI",
+}
+
+
+def fold(text: Optional[str]) -> str:
+    """Lowercase ``text`` without diacritics or punctuation, e.g. "Đà Lạt!" -> "da lat"."""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFD", text.replace("đ", "d").replace("Đ", "D"))
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return _NON_ALNUM.sub(" ", stripped.casefold()).strip()
+
+
+def place_key(text: Optional[str]) -> str:
+    """Search key of a city or district name, equal for every spelling and alias.
+
+    "Sài Gòn", "TP. HCM" and "SGN" all give "ho chi minh"; "Q1" and "Quận 1"
+    give "quan 1".
+    """
+    key = fold(text)
+    if match := _DISTRICT.match(key):
+        return f"quan {int(match.group(1))}"
+    if key in PLACE_ALIASES:
+        return PLACE_ALIASES[key]
+    key = _CITY_SUFFIX.sub("", _CITY_PREFIX.sub("", key))
+    return PLACE_ALIASES.get(key, key)
+
+
+def airport_code(text: Optional[str]) -> str:
+    """IATA code for an airport code or the name of the city it serves.
+
+    "sgn", "Sài Gòn" and "Hồ Chí Minh" all give "SGN"; anything unknown is
+    returned uppercased.
+    """
+    key = fold(text)
+    if key.upper() in AIRPORT_CODES.values():
+        return key.upper()
+    return AIRPORT_CODES.get(place_key(key), key.upper())
@@ -0,0 +1,80 @@
+import asyncio
+import base64
+import io
+import logging
+from typing import Awaitable, Callable, Optional
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Longest side sent to the vision model. Llama 3.2 Vision sees at most 2x2
+# tiles of 560 px, so larger images only cost upload bytes.
+VISION_MAX_SIDE = 1120
+JPEG_QUALITY = 85
+
+
+def prepare_image(data: bytes, max_side: int = VISION_MAX_SIDE, quality: int = JPEG_QUALITY) -> Optional[bytes]:
+    """Decode an image and re-encode it as the smallest JPEG the vision model sees in full.
+
+    The image is rotated upright from its EXIF orientation, flattened onto
+    white if it has transparency, downscaled to ``max_side`` and saved without
+    any metadata (EXIF, GPS, ICC).
+
+    Returns:
+        Optional[bytes]: The JPEG, or None when ``data`` is not a readable image.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+                rgba = image.convert("RGBA")
+                image = Image.new("RGB", rgba.size, "white")
+                image.paste(rgba, mask=rgba.getchannel("A"))
+            else:
+                image = image.convert("RGB")
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, format="JPEG", quality=quality, optimize=True)
+            return output.getvalue()
+    except (UnidentifiedImageError, OSError) as exc:
+        logger.warning("Skipping unreadable image: %s", exc)
+        return None
+
+
+def load_image(path: str) -> Optional[bytes]:
+    """Read and prepare an uploaded image file."""
+    with open(path, "rb") as file:
+        return prepare_image(file.read())
+
+
+def image_data_url(jpeg: bytes) -> str:
+    return f"data:image/jpeg;base64,{base64.b64encode(jpeg).decode('ascii')}"
+
+
+async def analyze_images(
+    paths: list[str], analyze: Callable[[bytes], Awaitable[str]], limit: asyncio.Semaphore
+) -> list[str]:
+    """Prepare every image and analyze them concurrently, at most ``limit`` calls at a time.
+
+    Images that cannot be read or analyzed are logged and left out, so one bad
+    attachment does not cost the user the others.
+
+    Returns:
+        list[str]: The analyses, in the order of ``paths``.
+    """
+    async def analyze_one(path: str) -> Optional[str]:
+        jpeg = await asyncio.to_thread(load_image, path)
+        if jpeg is None:
+            return None
+        async with limit:
+            return await analyze(jpeg)
+
+    results = await asyncio.gather(*(analyze_one(path) for path in paths), return_exceptions=True)
+    analyses = []
+    for path, result in zip(paths, results):
+        if isinstance(result, BaseException):
+            logger.warning("Analysis of %s failed: %r", path, result)
+        elif result:
+            analyses.append(result)
+    return analyses